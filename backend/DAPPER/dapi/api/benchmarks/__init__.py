@@ -0,0 +1 @@
+# Load-testing helpers used by the benchmark management command
@@ -0,0 +1,149 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from ..services.template_registry import registry as template_registry
+
+class FakeOpenRouter:
+    """Local OpenAI-compatible chat completions server for benchmarks.
+
+    Answers with a template journey after a configurable latency, streams it
+    in chunks when asked to, and fails a configurable fraction of requests
+    with a 503 or with content that is not JSON.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.2, error_rate=0.0, invalid_rate=0.0,
+                 chunk_size=40, chunk_delay=0.005, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._content = "Here is your journey:\n```json\n" + json.dumps(
+            template_registry.render_journey('sad', 'happy'), indent=2
+        ) + "\n```"
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openrouter", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay(self):
+        return max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with fake._lock:
+                    fake.requests += 1
+                    failing = random.random() < fake.error_rate
+                    if failing:
+                        fake.errors += 1
+
+                time.sleep(fake._delay())
+                if failing:
+                    return self._send_json(503, {"error": {"message": "Service unavailable", "code": 503}})
+
+                content = fake._content
+                if random.random() < fake.invalid_rate:
+                    content = "I'm sorry, I can't produce that journey right now."
+                if body.get('stream'):
+                    return self._stream(body, content)
+                self._send_json(200, {
+                    "id": "bench",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get('model', ''),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": self._usage(body, content),
+                })
+
+            def _usage(self, body, content):
+                prompt_tokens = len(json.dumps(body.get('messages', []))) // 4
+                completion_tokens = len(content) // 4
+                return {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, content):
+                # No Content-Length, so the stream ends with the connection
+                self.close_connection = True
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for start in range(0, len(content), fake.chunk_size):
+                    chunk = {
+                        "id": "bench",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get('model', ''),
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": content[start:start + fake.chunk_size]},
+                            "finish_reason": None,
+                        }],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    if fake.chunk_delay:
+                        time.sleep(fake.chunk_delay)
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    chunk = {
+                        "id": "bench",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get('model', ''),
+                        "choices": [],
+                        "usage": self._usage(body, content),
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
@@ -0,0 +1,172 @@
+import json
+import random
+import threading
+import time
+import tracemalloc
+from django.db import connection, connections
+from django.test import Client
+from ..services.course_service import create_course
+from ..services.template_registry import registry as template_registry
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EMOTION_PAIRS = [('sad', 'happy'), ('angry', 'happy'), ('anxious', 'calm'), ('envy', 'happy')]
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(p * len(sorted_values)))]
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    if resource is None:
+        return None
+    # Linux reports kilobytes, macOS bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if peak > 1 << 32 else 1), 1)
+
+class Scenario:
+    """The requests a benchmark sends, against courses seeded up front"""
+
+    def __init__(self, users=20, courses_per_user=10, use_cache=False):
+        self.users = users
+        self.courses_per_user = courses_per_user
+        self.use_cache = use_cache
+        self.course_ids = []
+
+    def seed(self):
+        journey = template_registry.render_journey('sad', 'happy')
+        for user in range(self.users):
+            for _ in range(self.courses_per_user):
+                course = create_course(f"bench-{user}", 'sad', 'happy', 'benchmark seed', journey)
+                self.course_ids.append(course.id)
+
+    def _generate_body(self, i):
+        mood, target_emotion = EMOTION_PAIRS[i % len(EMOTION_PAIRS)]
+        return json.dumps({
+            "user_id": f"bench-{i % self.users}",
+            "mood": mood,
+            "target_emotion": target_emotion,
+            # Distinct contexts, so requests neither hit the cache nor coalesce
+            "context": f"Benchmark request {i}",
+            "no_cache": not self.use_cache,
+        })
+
+    def generate(self, client, i):
+        return client.post('/api/v1/courses/generate/', self._generate_body(i), content_type='application/json')
+
+    def stream(self, client, i):
+        return client.post('/api/v1/courses/generate/stream/', self._generate_body(i), content_type='application/json')
+
+    def progress(self, client, i):
+        body = {"current_step": random.randint(0, 5), "mood_rating": random.randint(1, 10)}
+        return client.post(f'/api/v1/courses/{random.choice(self.course_ids)}/progress/',
+                           json.dumps(body), content_type='application/json')
+
+    def list(self, client, i):
+        return client.get('/api/v1/courses/', {"user_id": f"bench-{random.randrange(self.users)}"})
+
+    def mixed(self, client, i):
+        # Mostly cheap reads and writes, with an occasional generation
+        return random.choices([self.generate, self.progress, self.list], weights=[1, 4, 5])[0](client, i)
+
+ENDPOINTS = ('generate', 'stream', 'progress', 'list', 'mixed')
+
+def run_phase(send, requests, concurrency, trace_memory=False):
+    """Send requests from concurrency threads and summarize latency, queries and memory"""
+    lock = threading.Lock()
+    issued = [0]
+    samples = []  # (seconds, status, queries, first byte seconds)
+    failures = []
+
+    def worker():
+        client = Client()
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            while True:
+                with lock:
+                    if issued[0] >= requests:
+                        return
+                    i = issued[0]
+                    issued[0] += 1
+
+                queries[0] = 0
+                started = time.perf_counter()
+                first_byte = None
+                try:
+                    with connection.execute_wrapper(count_query):
+                        response = send(client, i)
+                        if response.streaming:
+                            for _ in response.streaming_content:
+                                if first_byte is None:
+                                    first_byte = time.perf_counter() - started
+                            response.close()
+                except Exception as e:
+                    with lock:
+                        failures.append(repr(e))
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    samples.append((elapsed, response.status_code, queries[0], first_byte))
+        finally:
+            connections.close_all()
+
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, name=f"bench-{n}") for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    traced_peak = None
+    if trace_memory:
+        traced_peak = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    first_bytes = sorted(sample[3] * 1000 for sample in samples if sample[3] is not None)
+    query_counts = [sample[2] for sample in samples]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample[1])] = statuses.get(str(sample[1]), 0) + 1
+
+    def rounded(value):
+        return round(value, 1) if value is not None else None
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "completed": len(samples),
+        "exceptions": len(failures),
+        "statuses": statuses,
+        "wall_seconds": round(wall, 2),
+        "throughput_rps": round(len(samples) / wall, 1) if wall else None,
+        "latency_ms": {
+            "p50": rounded(percentile(latencies, 0.50)),
+            "p95": rounded(percentile(latencies, 0.95)),
+            "p99": rounded(percentile(latencies, 0.99)),
+            "max": rounded(latencies[-1] if latencies else None),
+        },
+        "first_byte_ms": {
+            "p50": rounded(percentile(first_bytes, 0.50)),
+            "p99": rounded(percentile(first_bytes, 0.99)),
+        } if first_bytes else None,
+        "queries_per_request": {
+            "mean": round(sum(query_counts) / len(query_counts), 1) if query_counts else None,
+            "max": max(query_counts) if query_counts else None,
+        },
+        "peak_rss_mb": peak_rss_mb(),
+        "traced_peak_mb": traced_peak,
+        "first_exception": failures[0] if failures else None,
+    }
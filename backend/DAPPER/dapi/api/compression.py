@@ -0,0 +1,32 @@
+import json
+import zlib
+
+# Stored payloads start with MAGIC and a dictionary id. Only 0, no dictionary,
+# is in use; migration 0018 rewrote the rows made with the retired dictionary 1.
+MAGIC = b'Z'
+NO_DICTIONARY = 0
+
+def dumps(data):
+    """Compact encoding every stored journey uses"""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+def compress_json(data):
+    """Encode data as compact JSON, deflated"""
+    compressor = zlib.compressobj(9)
+    body = compressor.compress(dumps(data).encode('utf-8')) + compressor.flush()
+    return MAGIC + bytes([NO_DICTIONARY]) + body
+
+def payload_dictionary_id(payload):
+    """Dictionary id a stored payload was compressed with"""
+    payload = bytes(payload)
+    if payload[:1] != MAGIC:
+        raise ValueError("Not a compressed JSON payload")
+    return payload[1]
+
+def decompress_json(payload):
+    """Inverse of compress_json"""
+    payload = bytes(payload)
+    dictionary_id = payload_dictionary_id(payload)
+    if dictionary_id != NO_DICTIONARY:
+        raise ValueError(f"Payload uses retired dictionary {dictionary_id}; run the migrations")
+    return json.loads(zlib.decompress(payload[2:]))
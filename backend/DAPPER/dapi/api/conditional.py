@@ -0,0 +1,97 @@
+import hashlib
+from rest_framework.request import Request
+from .models import EmotionalCourse, UserProgress
+from .pagination import CourseCursorPagination
+
+# Validator functions for django.views.decorators.http.condition.
+#
+# Each one reads a few indexed columns instead of building the response, so a
+# 304 costs one small query. Rows are memoized on the request because
+# condition() asks for the ETag and Last-Modified separately.
+
+def _memoized(request, key, load):
+    cache = request.__dict__.setdefault('_validator_rows', {})
+    if key not in cache:
+        cache[key] = load()
+    return cache[key]
+
+def _course_row(request, course_id):
+    return _memoized(request, ('course', course_id), lambda: (
+        EmotionalCourse.objects.filter(id=course_id)
+        .values('blob__digest', 'created_at', 'updated_at')
+        .first()
+    ))
+
+def course_etag(request, course_id, **kwargs):
+    """Journey content digest plus the course's own modification time"""
+    row = _course_row(request, course_id)
+    if row is None:
+        return None
+    return f"{row['blob__digest']}-{row['updated_at'].timestamp():.6f}"
+
+def course_last_modified(request, course_id, **kwargs):
+    row = _course_row(request, course_id)
+    return row['updated_at'] if row else None
+
+def course_step_etag(request, course_id, step_number, **kwargs):
+    """Steps only change with the journey content itself"""
+    row = _course_row(request, course_id)
+    if row is None:
+        return None
+    return f"{row['blob__digest']}-step-{step_number}"
+
+def course_step_last_modified(request, course_id, **kwargs):
+    row = _course_row(request, course_id)
+    return row['created_at'] if row else None
+
+def _course_list_row(request):
+    user_id = request.GET.get('user_id')
+    if not user_id:
+        return None
+    return _memoized(request, ('course_list', user_id), lambda: _load_course_list_row(request, user_id))
+
+def _load_course_list_row(request, user_id):
+    # Both reads are bounded index scans, so a 304 costs the same however many courses the user has
+    courses = EmotionalCourse.objects.filter(user_id=user_id)
+    last_modified = courses.order_by('-updated_at').values_list('updated_at', flat=True).first()
+    if last_modified is None:
+        return {'last_modified': None, 'page': None}
+    # Keys of the requested page (additions and deletions change them); modifications move last_modified
+    paginator = CourseCursorPagination()
+    drf_request = request if isinstance(request, Request) else Request(request)
+    page = paginator.paginate_queryset(courses.values('id', 'created_at'), drf_request)
+    keys = [row['id'] for row in page] + [paginator.has_next, paginator.has_previous]
+    return {'last_modified': last_modified, 'page': keys}
+
+def course_list_etag(request, **kwargs):
+    """Changes whenever a course on the requested page is added, removed or modified"""
+    row = _course_list_row(request)
+    if row is None or row['last_modified'] is None:
+        return None
+    page = f"{request.GET.get('user_id')}|{request.GET.get('cursor', '')}|{request.GET.get('page_size', '')}"
+    version = f"{page}|{row['page']}|{row['last_modified'].isoformat()}"
+    return hashlib.sha256(version.encode('utf-8')).hexdigest()
+
+def course_list_last_modified(request, **kwargs):
+    row = _course_list_row(request)
+    return row['last_modified'] if row else None
+
+def _progress_row(request, course_id):
+    # Progress writes only need validators when they carry a precondition
+    if request.method not in ('GET', 'HEAD') and not (
+        'HTTP_IF_MATCH' in request.META or 'HTTP_IF_UNMODIFIED_SINCE' in request.META
+    ):
+        return None
+    return _memoized(request, ('progress', course_id), lambda: (
+        UserProgress.objects.filter(course_id=course_id).values('id', 'last_updated').first()
+    ))
+
+def progress_etag(request, course_id, **kwargs):
+    row = _progress_row(request, course_id)
+    if row is None:
+        return None
+    return f"progress-{row['id']}-{row['last_updated'].timestamp():.6f}"
+
+def progress_last_modified(request, course_id, **kwargs):
+    row = _progress_row(request, course_id)
+    return row['last_updated'] if row else None
@@ -0,0 +1,63 @@
+import json
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from .compression import compress_json, decompress_json
+
+class CompressedJSON:
+    """Still-compressed value straight from the database"""
+    __slots__ = ('payload',)
+
+    def __init__(self, payload):
+        self.payload = bytes(payload)
+
+    def load(self):
+        return decompress_json(self.payload)
+
+    def __repr__(self):
+        return f"<CompressedJSON {len(self.payload)} bytes>"
+
+class CompressedJSONDescriptor(DeferredAttribute):
+    """Decompresses on first attribute access and keeps the result on the instance"""
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedJSON):
+            value = value.load()
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so reads keep coming
+        # through __get__ even once the value sits in the instance __dict__
+        instance.__dict__[self.field.attname] = value
+
+class CompressedJSONField(models.BinaryField):
+    """JSON stored as zlib-deflated bytes.
+
+    Rows are only decompressed when the attribute is read, so queries that
+    load but never touch the JSON pay nothing for it. values() and
+    values_list() return CompressedJSON objects; call load() on them.
+    """
+    descriptor_class = CompressedJSONDescriptor
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return CompressedJSON(value)
+
+    def to_python(self, value):
+        if isinstance(value, CompressedJSON):
+            return value.load()
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, CompressedJSON):
+            return value.payload
+        return compress_json(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
@@ -0,0 +1,108 @@
+import json
+import os
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from api.benchmarks.fake_openrouter import FakeOpenRouter
+from api.benchmarks.runner import ENDPOINTS, Scenario, run_phase
+
+class Command(BaseCommand):
+    help = "Benchmark the API end to end against a throwaway database and a local OpenRouter stand-in"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default='generate,progress,list',
+                            help=f"Comma-separated phases to run, from: {', '.join(ENDPOINTS)}")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per phase")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients per phase")
+        parser.add_argument('--users', type=int, default=20, help="Users to seed courses for")
+        parser.add_argument('--courses-per-user', type=int, default=10)
+        parser.add_argument('--use-cache', action='store_true',
+                            help="Let generations hit the journey cache and pool")
+        parser.add_argument('--latency', type=float, default=1.0, help="Fake upstream latency in seconds")
+        parser.add_argument('--jitter', type=float, default=0.2, help="Standard deviation of that latency")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of upstream calls answered with 503")
+        parser.add_argument('--invalid-rate', type=float, default=0.0, help="Fraction of completions that are not JSON")
+        parser.add_argument('--chunk-delay', type=float, default=0.005, help="Seconds between streamed chunks")
+        parser.add_argument('--rate-limits', action='store_true',
+                            help="Keep the generation rate limits and token budget on")
+        parser.add_argument('--upstream-url', help="Use this OpenAI-compatible base URL instead of the fake")
+        parser.add_argument('--trace-memory', action='store_true',
+                            help="Report Python allocation peaks per phase (slows requests down)")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON")
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        fake = None
+        base_url = options['upstream_url']
+        if not base_url:
+            fake = FakeOpenRouter(
+                latency=options['latency'], jitter=options['jitter'], error_rate=options['error_rate'],
+                invalid_rate=options['invalid_rate'], chunk_delay=options['chunk_delay'],
+            ).start()
+            base_url = fake.base_url
+
+        # SQLite test databases default to shared memory, which serializes
+        # threads on table locks; a temporary file behaves like production
+        tmpdir = tempfile.TemporaryDirectory()
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            if settings_dict['ENGINE'].endswith('sqlite3') and not settings_dict['TEST'].get('NAME'):
+                settings_dict['TEST']['NAME'] = os.path.join(tmpdir.name, f'benchmark-{alias}.sqlite3')
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        results = {}
+        try:
+            with override_settings(
+                OPENROUTER_BASE_URL=base_url,
+                OPENROUTER_API_KEY=settings.OPENROUTER_API_KEY if options['upstream_url'] else 'benchmark',
+                JOURNEY_POOL_BACKGROUND_REFILL=False,
+                GENERATION_RATE_LIMIT_ENABLED=options['rate_limits'],
+            ):
+                scenario = Scenario(options['users'], options['courses_per_user'], options['use_cache'])
+                scenario.seed()
+                for name in endpoints:
+                    upstream_before = fake.requests if fake else None
+                    results[name] = run_phase(getattr(scenario, name), options['requests'],
+                                              options['concurrency'], options['trace_memory'])
+                    if fake:
+                        results[name]["upstream_calls"] = fake.requests - upstream_before
+                    if not options['json']:
+                        self._report(name, results[name])
+        finally:
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            tmpdir.cleanup()
+            if fake:
+                fake.stop()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+
+    def _report(self, name, result):
+        latency = result['latency_ms']
+        queries = result['queries_per_request']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name}: {result['completed']}/{result['requests']} requests, concurrency {result['concurrency']}"
+        ))
+        self.stdout.write(f"  throughput  {result['throughput_rps']} req/s over {result['wall_seconds']}s")
+        self.stdout.write(f"  latency ms  p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+        if result['first_byte_ms']:
+            self.stdout.write(f"  first byte  p50 {result['first_byte_ms']['p50']}  p99 {result['first_byte_ms']['p99']} ms")
+        self.stdout.write(f"  queries     mean {queries['mean']}  max {queries['max']} per request")
+        self.stdout.write(f"  statuses    {result['statuses']}  exceptions {result['exceptions']}")
+        if 'upstream_calls' in result:
+            self.stdout.write(f"  upstream    {result['upstream_calls']} call(s)")
+        memory = f"  memory      peak RSS {result['peak_rss_mb']} MB"
+        if result['traced_peak_mb'] is not None:
+            memory += f", Python allocations peak {result['traced_peak_mb']} MB"
+        self.stdout.write(memory)
+        if result['first_exception']:
+            self.stdout.write(self.style.WARNING(f"  first exception: {result['first_exception']}"))
@@ -0,0 +1,38 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.job_queue import claim_next_job, requeue_stale_jobs, run_job
+
+class Command(BaseCommand):
+    help = "Run a worker pool that processes queued course generation jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.GENERATION_JOB_WORKERS,
+                            help="Number of jobs to run concurrently")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true',
+                            help="Drain the queue and exit instead of polling forever")
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation-job") as pool:
+            in_flight = set()
+            while True:
+                in_flight = {f for f in in_flight if not f.done()}
+
+                # Only claim as many jobs as there are free workers
+                job_id = claim_next_job() if len(in_flight) < workers else None
+                if job_id is not None:
+                    self.stdout.write(f"Running generation job {job_id}")
+                    in_flight.add(pool.submit(run_job, job_id, claimed=True))
+                    continue
+
+                if options['once'] and not in_flight:
+                    break
+                time.sleep(options['poll_interval'])
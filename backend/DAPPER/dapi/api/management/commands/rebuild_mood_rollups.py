@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from api.services.analytics_service import rebuild_mood_rollups
+
+class Command(BaseCommand):
+    help = "Recompute the mood outcome rollups from all courses and progress rows"
+
+    def handle(self, *args, **options):
+        pairs = rebuild_mood_rollups()
+        self.stdout.write(f"Rebuilt mood outcome rollups for {pairs} emotion pair(s)")
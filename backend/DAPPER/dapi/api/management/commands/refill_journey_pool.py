@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.services.journey_pool import normalize_emotion, pool_pairs, refill_pool
+
+class Command(BaseCommand):
+    help = "Pre-generate journeys so each common emotion pair has a ready-made pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--depth', type=int, default=settings.JOURNEY_POOL_DEPTH,
+                            help="Journeys to keep ready per emotion pair")
+        parser.add_argument('--pair', action='append', default=[],
+                            help="Only refill this from:to pair (repeatable)")
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep refilling instead of exiting after one pass")
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help="Seconds between passes with --loop")
+
+    def handle(self, *args, **options):
+        pairs = pool_pairs()
+        if options['pair']:
+            pairs = [
+                tuple(normalize_emotion(part) for part in pair.partition(":")[::2])
+                for pair in options['pair']
+            ]
+
+        while True:
+            for emotion, target_emotion in pairs:
+                added = refill_pool(emotion, target_emotion, depth=options['depth'])
+                self.stdout.write(f"{emotion} -> {target_emotion}: added {added}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
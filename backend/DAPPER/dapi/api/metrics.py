@@ -0,0 +1,251 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Seconds; generation stages span microseconds (parsing) to minutes (upstream)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 3000, 4000, 6000, 8000)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic in-process counter with optional labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}")
+        return lines
+
+class Histogram:
+    """In-process histogram with fixed buckets, rendered cumulatively like Prometheus"""
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), values[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [('le', _format_number(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_number(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Gauge:
+    """Current value of something, read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def collect(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {_format_number(self.read())}",
+        ]
+
+class Registry:
+    """The metrics exposed on the metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+generation_stage_seconds = registry.register(Histogram(
+    'dapi_generation_stage_seconds',
+    "Time spent in each stage of journey generation",
+    labels=('stage',),
+))
+generation_results = registry.register(Counter(
+    'dapi_generation_results_total',
+    "Journeys produced, by where they came from (fallback reasons included)",
+    labels=('source', 'reason'),
+))
+generation_tokens = registry.register(Counter(
+    'dapi_generation_tokens_total',
+    "Tokens reported by OpenRouter completions",
+    labels=('kind',),
+))
+completion_tokens = registry.register(Histogram(
+    'dapi_generation_completion_tokens',
+    "Completion tokens per OpenRouter response",
+    buckets=TOKEN_BUCKETS,
+))
+request_seconds = registry.register(Histogram(
+    'dapi_http_request_duration_seconds',
+    "Time to produce a response, by URL name",
+    labels=('view', 'method', 'status'),
+))
+request_queries = registry.register(Histogram(
+    'dapi_http_request_queries',
+    "Database queries per request, by URL name",
+    labels=('view', 'method'),
+    buckets=QUERY_BUCKETS,
+))
+model_requests = registry.register(Counter(
+    'dapi_model_requests_total',
+    "Completed OpenRouter journey requests per model, ok or error (abandoned hedges excluded)",
+    labels=('model', 'result'),
+))
+model_hedges = registry.register(Counter(
+    'dapi_model_hedges_total',
+    "Hedged second requests sent, by the model they went to",
+    labels=('model',),
+))
+circuit_transitions = registry.register(Counter(
+    'dapi_circuit_breaker_transitions_total',
+    "Circuit breaker state changes made by this process, by the state entered",
+    labels=('breaker', 'state'),
+))
+circuit_errors = registry.register(Counter(
+    'dapi_circuit_breaker_errors_total',
+    "Database errors reading or recording circuit breaker state (calls are let through)",
+    labels=('breaker', 'operation'),
+))
+admission_results = registry.register(Counter(
+    'dapi_generation_admission_total',
+    "Generation admission decisions: admitted, queued (then admitted), queue_full or queue_timeout",
+    labels=('result',),
+))
+admission_wait_seconds = registry.register(Histogram(
+    'dapi_generation_admission_wait_seconds',
+    "Time queued generations waited for a slot",
+))
+
+def record_generation(source, reason=''):
+    """Count a journey served from source ('openrouter', 'cache', 'pool' or 'fallback')"""
+    generation_results.inc(source=source, reason=reason)
+
+def record_usage(response):
+    """Count the tokens of a completion, if it reported usage"""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    generation_tokens.inc(usage.prompt_tokens or 0, kind='prompt')
+    generation_tokens.inc(usage.completion_tokens or 0, kind='completion')
+    completion_tokens.observe(usage.completion_tokens or 0)
+
+class RequestMetricsMiddleware:
+    """Time every request and count its database queries, labelled by URL name"""
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Stay async under ASGI, so async views are not funnelled through one thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            # Every alias, so reads routed to the replica are counted too
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(count_query))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view = _view_label(request)
+        request_seconds.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        request_queries.observe(queries[0], view=view, method=request.method)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        # Queries run in worker threads here, out of reach of execute_wrapper, so only time it
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        request_seconds.observe(time.perf_counter() - started, view=_view_label(request),
+                                method=request.method, status=response.status_code)
+        return response
+
+def _view_label(request):
+    # Streamed bodies are produced after the middleware returns; timings cover the headers
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unmatched'
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_generationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JourneyCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('from_emotion', models.CharField(max_length=50)),
+                ('to_emotion', models.CharField(max_length=50)),
+                ('journey', models.JSONField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_hit_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='generationjob',
+            name='use_cache',
+            field=models.BooleanField(default=True),
+        ),
+    ]
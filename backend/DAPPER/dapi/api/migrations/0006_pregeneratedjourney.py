@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_generationlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PregeneratedJourney',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_emotion', models.CharField(max_length=50)),
+                ('to_emotion', models.CharField(max_length=50)),
+                ('journey', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['from_emotion', 'to_emotion', 'created_at'], name='pool_pair_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,88 @@
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def journey_digest(data):
+    # Frozen copy of api.models.journey_digest; existing digests depend on it
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def deduplicate_course_json(apps, schema_editor):
+    """Move each course's json_data into a shared blob, one blob per distinct content"""
+    EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+    JourneyBlob = apps.get_model('api', 'JourneyBlob')
+
+    blob_ids = {}
+    pending = []
+    for course in EmotionalCourse.objects.only('id', 'json_data').iterator(chunk_size=BATCH_SIZE):
+        digest = journey_digest(course.json_data)
+        if digest not in blob_ids:
+            blob, _ = JourneyBlob.objects.get_or_create(digest=digest, defaults={'data': course.json_data})
+            blob_ids[digest] = blob.id
+        course.blob_id = blob_ids[digest]
+        pending.append(course)
+        if len(pending) >= BATCH_SIZE:
+            EmotionalCourse.objects.bulk_update(pending, ['blob'])
+            pending = []
+    if pending:
+        EmotionalCourse.objects.bulk_update(pending, ['blob'])
+
+
+def restore_course_json(apps, schema_editor):
+    """Copy blob contents back onto every course"""
+    EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+
+    pending = []
+    for course in EmotionalCourse.objects.select_related('blob').iterator(chunk_size=BATCH_SIZE):
+        course.json_data = course.blob.data
+        pending.append(course)
+        if len(pending) >= BATCH_SIZE:
+            EmotionalCourse.objects.bulk_update(pending, ['json_data'])
+            pending = []
+    if pending:
+        EmotionalCourse.objects.bulk_update(pending, ['json_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_pregeneratedjourney'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JourneyBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='emotionalcourse',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='courses', to='api.journeyblob'),
+        ),
+        migrations.AlterField(
+            model_name='emotionalcourse',
+            name='json_data',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(deduplicate_course_json, restore_course_json),
+        migrations.RemoveField(
+            model_name='emotionalcourse',
+            name='json_data',
+        ),
+        migrations.AlterField(
+            model_name='emotionalcourse',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='courses', to='api.journeyblob'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_journeyblob_emotionalcourse_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emotionalcourse',
+            index=models.Index(fields=['user_id', 'created_at', 'id'], name='course_user_created_idx'),
+        ),
+    ]
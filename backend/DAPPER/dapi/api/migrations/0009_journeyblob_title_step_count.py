@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def journey_summary(data):
+    # Frozen copy of api.models.journey_summary
+    course = data.get('course') if isinstance(data, dict) else None
+    if not isinstance(course, dict):
+        return '', 0
+    steps = course.get('steps')
+    return str(course.get('title') or '')[:200], len(steps) if isinstance(steps, list) else 0
+
+
+def backfill_summaries(apps, schema_editor):
+    """Fill in title and step_count for blobs stored before they existed"""
+    JourneyBlob = apps.get_model('api', 'JourneyBlob')
+
+    pending = []
+    for blob in JourneyBlob.objects.iterator(chunk_size=BATCH_SIZE):
+        blob.title, blob.step_count = journey_summary(blob.data)
+        pending.append(blob)
+        if len(pending) >= BATCH_SIZE:
+            JourneyBlob.objects.bulk_update(pending, ['title', 'step_count'])
+            pending = []
+    if pending:
+        JourneyBlob.objects.bulk_update(pending, ['title', 'step_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_emotionalcourse_course_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journeyblob',
+            name='step_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='journeyblob',
+            name='title',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """Start existing courses off with their creation time"""
+    EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+    EmotionalCourse.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_journeyblob_title_step_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emotionalcourse',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
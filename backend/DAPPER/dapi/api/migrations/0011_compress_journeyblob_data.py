@@ -0,0 +1,69 @@
+import api.fields
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def compress_blobs(apps, schema_editor):
+    """Copy each blob's plain JSON into the compressed column"""
+    JourneyBlob = apps.get_model('api', 'JourneyBlob')
+
+    pending = []
+    for blob in JourneyBlob.objects.only('id', 'data').iterator(chunk_size=BATCH_SIZE):
+        blob.data_compressed = blob.data
+        pending.append(blob)
+        if len(pending) >= BATCH_SIZE:
+            JourneyBlob.objects.bulk_update(pending, ['data_compressed'])
+            pending = []
+    if pending:
+        JourneyBlob.objects.bulk_update(pending, ['data_compressed'])
+
+
+def decompress_blobs(apps, schema_editor):
+    """Copy each blob's compressed JSON back into the plain column"""
+    JourneyBlob = apps.get_model('api', 'JourneyBlob')
+
+    pending = []
+    for blob in JourneyBlob.objects.only('id', 'data_compressed').iterator(chunk_size=BATCH_SIZE):
+        blob.data = blob.data_compressed
+        pending.append(blob)
+        if len(pending) >= BATCH_SIZE:
+            JourneyBlob.objects.bulk_update(pending, ['data'])
+            pending = []
+    if pending:
+        JourneyBlob.objects.bulk_update(pending, ['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_emotionalcourse_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journeyblob',
+            name='data_compressed',
+            field=api.fields.CompressedJSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='journeyblob',
+            name='data',
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(compress_blobs, decompress_blobs),
+        migrations.RemoveField(
+            model_name='journeyblob',
+            name='data',
+        ),
+        migrations.RenameField(
+            model_name='journeyblob',
+            old_name='data_compressed',
+            new_name='data',
+        ),
+        migrations.AlterField(
+            model_name='journeyblob',
+            name='data',
+            field=api.fields.CompressedJSONField(),
+        ),
+    ]
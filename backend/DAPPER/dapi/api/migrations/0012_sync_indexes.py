@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_compress_journeyblob_data'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='emotionalcourse',
+            index=models.Index(fields=['user_id', 'updated_at'], name='course_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['last_updated'], name='progress_last_updated_idx'),
+        ),
+    ]
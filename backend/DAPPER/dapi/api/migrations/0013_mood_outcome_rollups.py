@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    """Fill the new rollups from existing courses, so later progress deltas start from true totals"""
+    from api.services.analytics_service import rebuild_mood_rollups
+    rebuild_mood_rollups(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_sync_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodHistogramBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_emotion', models.CharField(max_length=50)),
+                ('to_emotion', models.CharField(max_length=50)),
+                ('kind', models.CharField(choices=[('initial', 'Initial'), ('final', 'Final')], max_length=10)),
+                ('rating', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('from_emotion', 'to_emotion', 'kind', 'rating'), name='unique_mood_histogram_bucket')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MoodOutcomeRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_emotion', models.CharField(max_length=50)),
+                ('to_emotion', models.CharField(max_length=50)),
+                ('courses', models.IntegerField(default=0)),
+                ('initial_count', models.IntegerField(default=0)),
+                ('initial_sum', models.BigIntegerField(default=0)),
+                ('initial_sum_squares', models.BigIntegerField(default=0)),
+                ('final_count', models.IntegerField(default=0)),
+                ('final_sum', models.BigIntegerField(default=0)),
+                ('final_sum_squares', models.BigIntegerField(default=0)),
+                ('improvement_count', models.IntegerField(default=0)),
+                ('improvement_sum', models.BigIntegerField(default=0)),
+                ('improvement_sum_squares', models.BigIntegerField(default=0)),
+                ('medals', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('from_emotion', 'to_emotion'), name='unique_mood_rollup_pair')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
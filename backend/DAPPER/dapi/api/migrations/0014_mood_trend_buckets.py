@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_mood_outcome_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodTrendBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.CharField(max_length=100)),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('sum', models.BigIntegerField(default=0)),
+                ('sum_squares', models.BigIntegerField(default=0)),
+                ('min_rating', models.IntegerField()),
+                ('max_rating', models.IntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user_id', 'granularity', 'period_start'), name='unique_mood_trend_bucket')],
+            },
+        ),
+    ]
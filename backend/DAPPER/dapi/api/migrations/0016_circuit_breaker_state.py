@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_rate_limits_token_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CircuitBreakerState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half_open', 'Half-open')], default='closed', max_length=10)),
+                ('failures', models.IntegerField(default=0)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('probes', models.IntegerField(default=0)),
+                ('successes', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
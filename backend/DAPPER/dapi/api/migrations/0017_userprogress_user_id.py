@@ -0,0 +1,36 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_user_id(apps, schema_editor):
+    """Copy each progress row's user_id from its course"""
+    EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+    UserProgress = apps.get_model('api', 'UserProgress')
+    UserProgress.objects.update(
+        user_id=Subquery(EmotionalCourse.objects.filter(id=OuterRef('course_id')).values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_circuit_breaker_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprogress',
+            name='user_id',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_user_id, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='userprogress',
+            name='progress_last_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['user_id', 'last_updated', 'id'], name='progress_user_updated_idx'),
+        ),
+    ]
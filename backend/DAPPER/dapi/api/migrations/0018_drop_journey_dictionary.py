@@ -0,0 +1,57 @@
+import json
+import zlib
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# The retired api/zdicts/journey-v1.zdict, frozen here so its rows can still be read
+JOURNEY_V1_DICTIONARY = (
+    b'"sad","calm"}":4}],"":3,"":2,""D","A","}},""to":":8,"":1,""m'
+    b'in":"max":"C","B",":10}],"":10},{""quiz":"from":":15,""title'
+    b'":"steps":"],"":[""course":":3}}}],""}],""options":"explanat'
+    b'ion":":5}],"":4},{""question":"education":":4,""input_type":'
+    b'"step_number":"input_range":"number_scale","correct_text":":'
+    b'10,""initial_prompt":"correct_answer":":8},"":3}}},{""id":"e'
+    b'motion_transition":"correct_text_seconds_wait":":10},"":5},"'
+    b'":[{""},{""seconds_wait":"text":"How are you feeling right n'
+    b'ow on a scale of 1-10? (10 being most calm)",":5},{"":5,"":{'
+    b'"","":"'
+)
+
+
+def decompress_v1(payload):
+    decompressor = zlib.decompressobj(zdict=JOURNEY_V1_DICTIONARY)
+    return json.loads(decompressor.decompress(payload[2:]) + decompressor.flush())
+
+
+def drop_dictionary(apps, schema_editor):
+    """Rewrite blobs compressed with dictionary 1 as plain deflate"""
+    from api.compression import compress_json
+    from api.fields import CompressedJSON
+    JourneyBlob = apps.get_model('api', 'JourneyBlob')
+
+    last_id = 0
+    while True:
+        batch = list(
+            JourneyBlob.objects.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'data')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for blob_id, stored in batch:
+            if stored.payload[1] == 1:
+                payload = compress_json(decompress_v1(stored.payload))
+                JourneyBlob.objects.filter(id=blob_id).update(data=CompressedJSON(payload))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_userprogress_user_id'),
+    ]
+
+    operations = [
+        # Plain payloads were always readable, so there is nothing to undo
+        migrations.RunPython(drop_dictionary, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,54 @@
+import hashlib
+import json
 from django.db import models
+from .fields import CompressedJSONField
 
 # Create your models here.
 
+def journey_digest(data):
+    """sha256 of the canonical JSON encoding, so equal journeys share one digest"""
+    canonical = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def journey_summary(data):
+    """Title and step count of a journey, kept on the blob for list views"""
+    course = data.get('course') if isinstance(data, dict) else None
+    if not isinstance(course, dict):
+        return '', 0
+    steps = course.get('steps')
+    return str(course.get('title') or '')[:200], len(steps) if isinstance(steps, list) else 0
+
+class JourneyBlobManager(models.Manager):
+    def intern(self, data):
+        """Return the blob holding this journey, storing it on first sight"""
+        title, step_count = journey_summary(data)
+        blob, _ = self.get_or_create(
+            digest=journey_digest(data),
+            defaults={'data': data, 'title': title, 'step_count': step_count}
+        )
+        return blob
+
+class JourneyBlob(models.Model):
+    """Journey JSON stored once per distinct content and shared by courses"""
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the canonical JSON
+    data = CompressedJSONField()
+    title = models.CharField(max_length=200, blank=True, default='')  # Denormalized from data
+    step_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = JourneyBlobManager()
+
+    def __str__(self):
+        return f"Journey blob {self.digest[:12]}"
+
+class EmotionalCourseQuerySet(models.QuerySet):
+    def summaries(self):
+        """Only the columns course summaries need, leaving the journey JSON unread"""
+        return self.select_related('blob').only(
+            'id', 'user_id', 'from_emotion', 'to_emotion', 'completed', 'created_at', 'updated_at',
+            'blob__title', 'blob__step_count'
+        )
+
 class EmotionalCourse(models.Model):
     """Stores a complete emotional journey course"""
     user_id = models.CharField(max_length=100)  # External user ID
@@ -9,20 +56,265 @@ class EmotionalCourse(models.Model):
     to_emotion = models.CharField(max_length=50)
     context = models.TextField()  # User's input about why they feel this way
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Drives Last-Modified/ETag on reads
     completed = models.BooleanField(default=False)
-    json_data = models.JSONField()  # Stores the entire course JSON
-    
+    blob = models.ForeignKey(JourneyBlob, on_delete=models.PROTECT, related_name='courses')  # The course JSON
+
+    objects = EmotionalCourseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the per-user course list in (created_at, id) order
+            models.Index(fields=['user_id', 'created_at', 'id'], name='course_user_created_idx'),
+            # Serves delta sync: a user's courses changed since a cursor
+            models.Index(fields=['user_id', 'updated_at'], name='course_user_updated_idx'),
+        ]
+
+    _pending_json = None
+
+    @property
+    def json_data(self):
+        """The entire course JSON, shared with every course of identical content"""
+        if self._pending_json is not None:
+            return self._pending_json
+        return self.blob.data
+
+    @json_data.setter
+    def json_data(self, value):
+        # Resolved to a blob on save, so unsaved courses never write blobs
+        self._pending_json = value
+
+    def save(self, *args, **kwargs):
+        if self._pending_json is not None:
+            self.blob = JourneyBlob.objects.intern(self._pending_json)
+            self._pending_json = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'json_data' in update_fields:
+                kwargs['update_fields'] = [f for f in update_fields if f != 'json_data'] + ['blob']
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Journey from {self.from_emotion} to {self.to_emotion} for {self.user_id}"
 
 class UserProgress(models.Model):
     """Tracks user progress through a course"""
     course = models.ForeignKey(EmotionalCourse, on_delete=models.CASCADE)
+    user_id = models.CharField(max_length=100)  # Copy of course.user_id, so sync needs no join
     current_step = models.IntegerField(default=0)
     initial_mood_rating = models.IntegerField(null=True)
     final_mood_rating = models.IntegerField(null=True)
     earned_medal = models.BooleanField(default=False)
     last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Serves delta sync: a user's progress changed since a cursor, in cursor order
+            models.Index(fields=['user_id', 'last_updated', 'id'], name='progress_user_updated_idx'),
+        ]
     
     def __str__(self):
         return f"Progress for {self.course.user_id} - Step {self.current_step}"
+
+class GenerationJob(models.Model):
+    """Queued course generation request, processed by the local worker pool"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user_id = models.CharField(max_length=100)
+    from_emotion = models.CharField(max_length=50)
+    to_emotion = models.CharField(max_length=50)
+    context = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    course = models.ForeignKey(EmotionalCourse, null=True, blank=True, on_delete=models.SET_NULL)
+    use_cache = models.BooleanField(default=True)
+    error = models.TextField(blank=True, default='')
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Generation job {self.id} ({self.status}) for {self.user_id}"
+
+class JourneyCacheEntry(models.Model):
+    """Generated journey shared across processes, keyed on normalized inputs"""
+    key = models.CharField(max_length=64, unique=True)  # sha256 of the canonical inputs
+    from_emotion = models.CharField(max_length=50)
+    to_emotion = models.CharField(max_length=50)
+    journey = models.JSONField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_hit_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Cached journey from {self.from_emotion} to {self.to_emotion} ({self.hits} hits)"
+
+class GenerationLock(models.Model):
+    """Cross-process single-flight marker for an in-flight journey generation"""
+    key = models.CharField(max_length=64, unique=True)  # Same key as the journey cache
+    owner = models.CharField(max_length=100)  # host:pid of the leading worker
+    completed = models.BooleanField(default=False)
+    result = models.JSONField(null=True, blank=True)  # Shared with waiting workers once completed
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Generation lock {self.key[:12]} held by {self.owner}"
+
+class PregeneratedJourney(models.Model):
+    """Ready-made journey for a common emotion pair, handed out before live generation"""
+    from_emotion = models.CharField(max_length=50)
+    to_emotion = models.CharField(max_length=50)
+    journey = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['from_emotion', 'to_emotion', 'created_at'], name='pool_pair_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pooled journey from {self.from_emotion} to {self.to_emotion}"
+
+class MoodOutcomeRollup(models.Model):
+    """Running mood statistics for an emotion pair, kept current on every progress write.
+
+    Counts, sums and sums of squares give means and standard deviations
+    without scanning UserProgress. Emotions are stored normalized.
+    """
+    from_emotion = models.CharField(max_length=50)
+    to_emotion = models.CharField(max_length=50)
+    courses = models.IntegerField(default=0)
+    initial_count = models.IntegerField(default=0)
+    initial_sum = models.BigIntegerField(default=0)
+    initial_sum_squares = models.BigIntegerField(default=0)
+    final_count = models.IntegerField(default=0)
+    final_sum = models.BigIntegerField(default=0)
+    final_sum_squares = models.BigIntegerField(default=0)
+    improvement_count = models.IntegerField(default=0)  # Courses with both ratings
+    improvement_sum = models.BigIntegerField(default=0)  # Of final - initial
+    improvement_sum_squares = models.BigIntegerField(default=0)
+    medals = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['from_emotion', 'to_emotion'], name='unique_mood_rollup_pair'),
+        ]
+
+    def __str__(self):
+        return f"Mood outcomes from {self.from_emotion} to {self.to_emotion}"
+
+class MoodHistogramBucket(models.Model):
+    """Number of initial or final ratings with a given value for an emotion pair"""
+    KIND_INITIAL = 'initial'
+    KIND_FINAL = 'final'
+    KIND_CHOICES = [
+        (KIND_INITIAL, 'Initial'),
+        (KIND_FINAL, 'Final'),
+    ]
+
+    from_emotion = models.CharField(max_length=50)
+    to_emotion = models.CharField(max_length=50)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    rating = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['from_emotion', 'to_emotion', 'kind', 'rating'], name='unique_mood_histogram_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} rating {self.rating} from {self.from_emotion} to {self.to_emotion}: {self.count}"
+
+class MoodTrendBucket(models.Model):
+    """Mood ratings a user reported during one day or week, kept current as ratings arrive"""
+    GRANULARITY_DAY = 'day'
+    GRANULARITY_WEEK = 'week'  # Weeks start on Monday
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_DAY, 'Day'),
+        (GRANULARITY_WEEK, 'Week'),
+    ]
+
+    user_id = models.CharField(max_length=100)
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    count = models.IntegerField(default=0)
+    sum = models.BigIntegerField(default=0)
+    sum_squares = models.BigIntegerField(default=0)
+    min_rating = models.IntegerField()
+    max_rating = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            # Also the index behind a user's range query
+            models.UniqueConstraint(
+                fields=['user_id', 'granularity', 'period_start'], name='unique_mood_trend_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Mood of {self.user_id} for the {self.granularity} of {self.period_start}"
+
+class RateLimitBucket(models.Model):
+    """Token bucket shared by all workers; refilled lazily when it is next used"""
+    key = models.CharField(max_length=150, unique=True)  # e.g. "generate:user:<user_id>"
+    tokens = models.FloatField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f} tokens"
+
+class TokenUsage(models.Model):
+    """OpenRouter tokens spent on a user's generations during one day"""
+    user_id = models.CharField(max_length=100)
+    day = models.DateField()
+    requests = models.IntegerField(default=0)  # Completions that reported usage
+    prompt_tokens = models.BigIntegerField(default=0)
+    completion_tokens = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_id', 'day'], name='unique_token_usage_user_day'),
+        ]
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.total_tokens} tokens"
+
+class CircuitBreakerState(models.Model):
+    """State of a circuit breaker, shared by all workers; each keeps a short-lived copy"""
+    STATE_CLOSED = 'closed'
+    STATE_OPEN = 'open'
+    STATE_HALF_OPEN = 'half_open'
+    STATE_CHOICES = [
+        (STATE_CLOSED, 'Closed'),
+        (STATE_OPEN, 'Open'),
+        (STATE_HALF_OPEN, 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=50, unique=True)  # e.g. "openrouter"
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=STATE_CLOSED)
+    failures = models.IntegerField(default=0)  # Consecutive failures while closed
+    opened_at = models.DateTimeField(null=True, blank=True)
+    probes = models.IntegerField(default=0)  # Probe calls let through while half-open
+    successes = models.IntegerField(default=0)  # Probe calls that succeeded
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.state}"
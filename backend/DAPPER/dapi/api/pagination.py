@@ -0,0 +1,13 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+class CourseCursorPagination(CursorPagination):
+    """Keyset pagination over (created_at, id), newest first.
+
+    Each page is a single index range scan from the cursor position, so the
+    cost of a page does not grow with how many courses a user has.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.COURSE_LIST_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.COURSE_LIST_MAX_PAGE_SIZE
@@ -1,14 +1,32 @@
 from rest_framework import serializers
-from .models import EmotionalCourse, UserProgress
+from .models import EmotionalCourse, GenerationJob, UserProgress
 
 class EmotionalCourseSerializer(serializers.ModelSerializer):
+    json_data = serializers.JSONField(read_only=True)  # Read from the shared journey blob
+
     class Meta:
         model = EmotionalCourse
         fields = ['id', 'user_id', 'from_emotion', 'to_emotion', 
                   'context', 'created_at', 'completed', 'json_data']
 
+class EmotionalCourseSummarySerializer(serializers.ModelSerializer):
+    """Course list entry without the journey itself"""
+    title = serializers.CharField(source='blob.title', read_only=True)
+    step_count = serializers.IntegerField(source='blob.step_count', read_only=True)
+
+    class Meta:
+        model = EmotionalCourse
+        fields = ['id', 'user_id', 'title', 'from_emotion', 'to_emotion',
+                  'completed', 'created_at', 'step_count']
+
 class UserProgressSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProgress
         fields = ['id', 'course', 'current_step', 'initial_mood_rating',
                   'final_mood_rating', 'earned_medal', 'last_updated']
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = ['id', 'status', 'course', 'error', 'attempts',
+                  'created_at', 'started_at', 'finished_at']
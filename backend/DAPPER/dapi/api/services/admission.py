@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from ..metrics import Gauge, admission_results, admission_wait_seconds, registry
+
+class GenerationOverloaded(Exception):
+    """No generation slot came free within the queue limits"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Generation capacity exhausted ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionGate:
+    """Caps concurrent generations in this process, with a bounded, timed wait queue.
+
+    Requests beyond ``limit`` wait for a slot, but only up to ``max_queue`` of
+    them and for at most ``max_wait`` seconds; the rest are turned away at
+    once, so generations can never tie up every worker thread.
+    """
+
+    def __init__(self, limit, max_queue, max_wait, retry_after):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._condition:
+            # Newcomers queue behind waiters instead of barging past them
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                admission_results.inc(result='admitted')
+                return
+            if self.waiting >= self.max_queue:
+                admission_results.inc(result='queue_full')
+                raise GenerationOverloaded('queue_full', self.retry_after)
+
+            self.waiting += 1
+            deadline = started + self.max_wait
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        admission_results.inc(result='queue_timeout')
+                        raise GenerationOverloaded('queue_timeout', self.retry_after)
+                    self._condition.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+        admission_results.inc(result='queued')
+        admission_wait_seconds.observe(time.monotonic() - started)
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def admit(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aadmit(self):
+        # Waiting blocks a thread, but never more than max_queue of them
+        acquiring = asyncio.ensure_future(sync_to_async(self.acquire, thread_sensitive=False)())
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # The caller went away; give back the slot if the wait still wins one
+            acquiring.add_done_callback(lambda done: done.cancelled() or done.exception() or self.release())
+            raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._condition:
+            return {"active": self.active, "waiting": self.waiting, "limit": self.limit, "max_queue": self.max_queue}
+
+_gate = None
+_async_gate = None
+_gate_lock = threading.Lock()
+
+registry.register(Gauge(
+    'dapi_generation_active', "Sync generations holding a slot in this process",
+    lambda: _gate.active if _gate else 0,
+))
+registry.register(Gauge(
+    'dapi_generation_queued', "Sync generations waiting for a slot in this process",
+    lambda: _gate.waiting if _gate else 0,
+))
+registry.register(Gauge(
+    'dapi_generation_async_active', "Async generations holding a slot in this process",
+    lambda: _async_gate.active if _async_gate else 0,
+))
+registry.register(Gauge(
+    'dapi_generation_async_queued', "Async generations waiting for a slot in this process",
+    lambda: _async_gate.waiting if _async_gate else 0,
+))
+
+def get_generation_gate():
+    """Return the process-wide gate for sync generations, or None if disabled"""
+    global _gate
+    if not settings.GENERATION_MAX_CONCURRENT:
+        return None
+    if _gate is None:
+        with _gate_lock:
+            if _gate is None:
+                _gate = AdmissionGate(
+                    settings.GENERATION_MAX_CONCURRENT,
+                    settings.GENERATION_MAX_QUEUE,
+                    settings.GENERATION_MAX_QUEUE_SECONDS,
+                    settings.GENERATION_OVERLOAD_RETRY_AFTER,
+                )
+    return _gate
+
+def get_async_generation_gate():
+    """Return the process-wide gate for async generations, or None if disabled.
+
+    Async generations hold no thread while they wait on the model, so they
+    get their own, much larger cap instead of sharing the sync one.
+    """
+    global _async_gate
+    if not settings.GENERATION_ASYNC_MAX_CONCURRENT:
+        return None
+    if _async_gate is None:
+        with _gate_lock:
+            if _async_gate is None:
+                _async_gate = AdmissionGate(
+                    settings.GENERATION_ASYNC_MAX_CONCURRENT,
+                    settings.GENERATION_ASYNC_MAX_QUEUE,
+                    settings.GENERATION_MAX_QUEUE_SECONDS,
+                    settings.GENERATION_OVERLOAD_RETRY_AFTER,
+                )
+    return _async_gate
+
+@contextmanager
+def generation_slot():
+    """Hold a generation slot for the block; raises GenerationOverloaded if none comes free"""
+    gate = get_generation_gate()
+    if gate is None:
+        yield
+        return
+    with gate.admit():
+        yield
+
+@asynccontextmanager
+async def ageneration_slot():
+    """Async variant of generation_slot, drawing on the async gate"""
+    gate = get_async_generation_gate()
+    if gate is None:
+        yield
+        return
+    async with gate.aadmit():
+        yield
@@ -1,13 +1,35 @@
+import asyncio
+import contextvars
 import json
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import nullcontext
 from datetime import datetime
+from types import SimpleNamespace
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from openai import OpenAI
+from django.db import connections
+from ..metrics import generation_stage_seconds, model_hedges, model_requests, record_generation, record_usage
+from .admission import GenerationOverloaded, ageneration_slot, generation_slot
+from .circuit_breaker import CircuitOpen, openrouter_breaker
+from .journey_cache import aget_cached_journey, astore_journey, get_cached_journey, make_cache_key, store_journey
+from .journey_pool import apop_pooled_journey, pop_pooled_journey
+from .journey_stream import JourneyStreamParser, iter_journey_events
+from .openrouter_client import acreate_completion, create_completion, cut_off_stream, latency_summary
+from .rate_limit import charge_usage
+from .single_flight import arun_single_flight, run_single_flight
+from .template_registry import registry as template_registry
 
-def generate_journey_with_claude(emotion, target_emotion, context):
-    """Generate a complete journey using Claude via OpenRouter API"""
-    
-    prompt = f"""
+OPENROUTER_MODEL = "anthropic/claude-3-opus-20240229"  # Default primary model, see OPENROUTER_MODELS
+
+SYSTEM_PROMPT = "You are an expert in psychology and emotional well-being. Create detailed, educational emotional journeys in JSON format."
+
+def build_journey_prompt(emotion, target_emotion, context):
+    """Build the user prompt asking the model for a 5-step journey"""
+    return f"""
     Create a 5-step educational journey to help someone transition from feeling {emotion} to {target_emotion}.
     
     Their context: "{context}"
@@ -107,776 +129,625 @@ def generate_journey_with_claude(emotion, target_emotion, context):
       }}
     }}
     """
+
+def build_completion_kwargs(prompt, model=OPENROUTER_MODEL):
+    """Return the chat completion arguments shared by the sync and async clients"""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": 4000,
+        "response_format": {"type": "text"}  # Ensure we get text back, not JSON object
+    }
+
+def parse_journey_content(content):
+    """Extract the journey JSON from a model response, raising JSONDecodeError if invalid"""
+    # Extract JSON from response if needed
+    with generation_stage_seconds.time(stage='json_extract'):
+        if "```json" in content:
+            json_str = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            json_str = content.split("```")[1].split("```")[0].strip()
+        else:
+            json_str = content.strip()
     
-    try:
-        # Check if OpenRouter API key is available
-        if settings.OPENROUTER_API_KEY:
-            # Initialize OpenAI client with OpenRouter base URL and API key
-            client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=settings.OPENROUTER_API_KEY,
-                default_headers={
-                    "HTTP-Referer": settings.OPENROUTER_REFERRER  # Optional
+    with generation_stage_seconds.time(stage='json_parse'):
+        return json.loads(json_str)
+
+class ModelStats:
+    """Exponentially weighted latency and error rate of one model"""
+
+    def __init__(self):
+        self.latency = None  # Seconds to a complete response
+        self.first_token = None  # Seconds to the first streamed token
+        self.error_rate = 0.0
+        self.requests = 0
+        self.hedges_won = 0
+        self.failed_at = 0.0  # time.monotonic() of the last failure
+
+class ModelRouter:
+    """Routes journey requests over an ordered list of OpenRouter models.
+
+    The first model whose recent error rate is acceptable is the primary. If
+    it has not streamed a token after OPENROUTER_HEDGE_AFTER_SECONDS (or has
+    already failed), a second request goes to the model with the lowest
+    average latency and the first valid journey wins; the other request is
+    abandoned.
+    """
+
+    def __init__(self, models, alpha):
+        self.models = list(models)
+        self.alpha = alpha
+        self._stats = {model: ModelStats() for model in self.models}
+        self._latencies = deque(maxlen=1000)  # Seconds to a complete response, any model
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _ewma(self, current, sample):
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def record_success(self, model, first_token, latency):
+        with self._lock:
+            stats = self._stats[model]
+            stats.requests += 1
+            stats.latency = self._ewma(stats.latency, latency)
+            self._latencies.append(latency)
+            if first_token is not None:
+                stats.first_token = self._ewma(stats.first_token, first_token)
+            stats.error_rate = self._ewma(stats.error_rate, 0.0)
+        model_requests.inc(model=model, result='ok')
+
+    def record_failure(self, model):
+        with self._lock:
+            stats = self._stats[model]
+            stats.requests += 1
+            stats.error_rate = self._ewma(stats.error_rate, 1.0)
+            stats.failed_at = time.monotonic()
+        model_requests.inc(model=model, result='error')
+
+    def plan(self):
+        """Return (primary model, hedge model or None)"""
+        with self._lock:
+            # A failing model sits out a while, then gets requests again so it can recover
+            retry_before = time.monotonic() - settings.OPENROUTER_MODEL_RETRY_SECONDS
+            healthy = [
+                m for m in self.models
+                if self._stats[m].error_rate < settings.OPENROUTER_MODEL_MAX_ERROR_RATE
+                or self._stats[m].failed_at < retry_before
+            ]
+            candidates = healthy or self.models
+            primary = candidates[0]
+            # Unmeasured models first so each gets measured, then the fastest; later-listed win ties
+            others = sorted(
+                (m for m in candidates if m != primary),
+                key=lambda m: (self._stats[m].latency is not None, self._stats[m].latency or 0, -self.models.index(m))
+            )
+        hedge = others[0] if others and settings.OPENROUTER_HEDGE_AFTER_SECONDS > 0 else None
+        return primary, hedge
+
+    def latency_summary(self):
+        """Percentiles of full completion latency over recent successful requests"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        return latency_summary(latencies)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model: {
+                    "latency_ms": round(stats.latency * 1000, 1) if stats.latency is not None else None,
+                    "first_token_ms": round(stats.first_token * 1000, 1) if stats.first_token is not None else None,
+                    "error_rate": round(stats.error_rate, 3),
+                    "requests": stats.requests,
+                    "hedges_won": stats.hedges_won,
                 }
+                for model, stats in self._stats.items()
+            }
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=settings.OPENROUTER_MAX_CONNECTIONS, thread_name_prefix="openrouter-hedge"
+                    )
+        return self._executor
+
+    def _submit(self, fn, *args):
+        # Each request keeps the caller's context (the user charged for tokens)
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                return context.run(fn, *args)
+            finally:
+                connections.close_all()
+
+        return self._get_executor().submit(run)
+
+    def _attempt(self, model, prompt, progressed, abandoned, streams=None):
+        """Stream one completion from model and parse it; None if abandoned.
+
+        An abandoned attempt keeps reading until its usage report arrives, so
+        the tokens it cost are still charged, unless fetch cuts it off first;
+        then its usage is estimated. The stream is added to streams for that.
+        """
+        started = time.perf_counter()
+        first_token, parts, stream, charged = None, [], None, False
+        try:
+            stream = create_completion(
+                stream=True, stream_options={"include_usage": True}, **build_completion_kwargs(prompt, model)
             )
-            
-            # Call OpenRouter API with Claude model
-            response = client.chat.completions.create(
-                model="anthropic/claude-3-opus-20240229",  # OpenRouter model identifier for Claude
-                messages=[
-                    {"role": "system", "content": "You are an expert in psychology and emotional well-being. Create detailed, educational emotional journeys in JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=4000,
-                response_format={"type": "text"}  # Ensure we get text back, not JSON object
+            if streams is not None:
+                streams.append(stream)
+            try:
+                for chunk in stream:
+                    # Usage arrives on a final chunk without choices
+                    if getattr(chunk, 'usage', None):
+                        record_usage(chunk)
+                        charge_usage(chunk)
+                        charged = True
+                    if abandoned.is_set():
+                        continue  # Only the usage report matters now
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            progressed.set()
+                        parts.append(chunk.choices[0].delta.content)
+            finally:
+                stream.close()
+            if abandoned.is_set():
+                return None
+            journey_data = parse_journey_content(''.join(parts))
+        except Exception:
+            if abandoned.is_set():
+                return None
+            self.record_failure(model)
+            raise
+        finally:
+            if abandoned.is_set() and stream is not None and not charged:
+                _charge_estimate(prompt, parts)
+        self.record_success(model, first_token, time.perf_counter() - started)
+        return journey_data
+
+    def fetch(self, prompt):
+        """Return the first valid journey from the primary or its hedge, raising the last error if none"""
+        primary, hedge = self.plan()
+        abandoned = threading.Event()
+        with generation_stage_seconds.time(stage='upstream'):
+            if hedge is None:
+                return self._attempt(primary, prompt, threading.Event(), abandoned)
+
+            progressed, streams = threading.Event(), []
+            primary_future = self._submit(self._attempt, primary, prompt, progressed, abandoned, streams)
+            # Set once the primary is done too, so an early failure hedges at once
+            primary_future.add_done_callback(lambda future: progressed.set())
+            pending = {primary_future: primary}
+            progressed.wait(settings.OPENROUTER_HEDGE_AFTER_SECONDS)
+
+            error, hedged = None, False
+            try:
+                while True:
+                    # Still silent, or failed: race (or fall over to) a faster model
+                    if not hedged and (not progressed.is_set() or error is not None):
+                        hedged = True
+                        model_hedges.inc(model=hedge)
+                        pending[self._submit(self._attempt, hedge, prompt, threading.Event(), abandoned, streams)] = hedge
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        model = pending.pop(future)
+                        if future.exception() is not None:
+                            error = future.exception()
+                            continue
+                        if model != primary:
+                            with self._lock:
+                                self._stats[model].hedges_won += 1
+                        return future.result()
+            finally:
+                abandoned.set()
+                if pending:
+                    # The loser may drain for its usage report, but never holds its thread longer than this
+                    timer = threading.Timer(settings.OPENROUTER_ABANDONED_DRAIN_SECONDS, _cut_off_streams, [streams])
+                    timer.daemon = True
+                    timer.start()
+            raise error
+
+    async def _aattempt(self, model, prompt, progressed):
+        """Async variant of _attempt; abandoned by cancelling its task, which charges estimated usage"""
+        started = time.perf_counter()
+        first_token, parts, stream, charged = None, [], None, False
+        try:
+            stream = await acreate_completion(
+                stream=True, stream_options={"include_usage": True}, **build_completion_kwargs(prompt, model)
             )
-            
-            # Extract content from response
-            content = response.choices[0].message.content
-            
-            # Extract JSON from response if needed
-            if "```json" in content:
-                json_str = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                json_str = content.split("```")[1].split("```")[0].strip()
-            else:
-                json_str = content.strip()
-            
+            try:
+                async for chunk in stream:
+                    if getattr(chunk, 'usage', None):
+                        record_usage(chunk)
+                        await sync_to_async(charge_usage)(chunk)
+                        charged = True
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            progressed.set()
+                        parts.append(chunk.choices[0].delta.content)
+            finally:
+                await stream.close()
+            journey_data = parse_journey_content(''.join(parts))
+        except asyncio.CancelledError:
+            if stream is not None and not charged:
+                await sync_to_async(_charge_estimate)(prompt, parts)
+            raise
+        except Exception:
+            self.record_failure(model)
+            raise
+        self.record_success(model, first_token, time.perf_counter() - started)
+        return journey_data
+
+    async def afetch(self, prompt):
+        """Async variant of fetch"""
+        primary, hedge = self.plan()
+        with generation_stage_seconds.time(stage='upstream'):
+            if hedge is None:
+                return await self._aattempt(primary, prompt, asyncio.Event())
+
+            progressed = asyncio.Event()
+            primary_task = asyncio.ensure_future(self._aattempt(primary, prompt, progressed))
+            primary_task.add_done_callback(lambda task: progressed.set())
+            pending = {primary_task: primary}
+            try:
+                await asyncio.wait_for(progressed.wait(), settings.OPENROUTER_HEDGE_AFTER_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+            error, hedged = None, False
+            try:
+                while True:
+                    if not hedged and (not progressed.is_set() or error is not None):
+                        hedged = True
+                        model_hedges.inc(model=hedge)
+                        pending[asyncio.ensure_future(self._aattempt(hedge, prompt, asyncio.Event()))] = hedge
+                    if not pending:
+                        break
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        model = pending.pop(task)
+                        if task.exception() is not None:
+                            error = task.exception()
+                            continue
+                        if model != primary:
+                            with self._lock:
+                                self._stats[model].hedges_won += 1
+                        return task.result()
+            finally:
+                for task in pending:
+                    task.cancel()
+                # Let the losers close their streams and charge their usage before returning
+                await asyncio.gather(*pending, return_exceptions=True)
+            raise error
+
+def _charge_estimate(prompt, parts):
+    """Charge an estimated usage (about four characters a token) for a completion cut off before its report"""
+    prompt_tokens = (len(SYSTEM_PROMPT) + len(prompt)) // 4
+    completion_tokens = sum(len(part) for part in parts) // 4
+    estimate = SimpleNamespace(usage=SimpleNamespace(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, total_tokens=prompt_tokens + completion_tokens
+    ))
+    record_usage(estimate)
+    charge_usage(estimate)
+
+def _cut_off_streams(streams):
+    for stream in list(streams):
+        cut_off_stream(stream)
+
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router():
+    """Return the process-wide model router"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(settings.OPENROUTER_MODELS or [OPENROUTER_MODEL], settings.OPENROUTER_EWMA_ALPHA)
+    return _router
+
+def fetch_journey_from_openrouter(emotion, target_emotion, context):
+    """Request and parse a journey from OpenRouter, raising on any failure"""
+    with generation_stage_seconds.time(stage='prompt_build'):
+        prompt = build_journey_prompt(emotion, target_emotion, context)
+    
+    # Refused at once while OpenRouter is known to be failing
+    probe = openrouter_breaker.before_call()
+    try:
+        # Routed and possibly hedged across models, through the shared, pooled client;
+        # raises JSONDecodeError if no model returned a journey
+        journey_data = get_model_router().fetch(prompt)
+    except json.JSONDecodeError:
+        # OpenRouter answered, so this says nothing about its health
+        openrouter_breaker.record(True, probe)
+        raise
+    except Exception:
+        openrouter_breaker.record(False, probe)
+        raise
+    openrouter_breaker.record(True, probe)
+    return journey_data
+
+async def afetch_journey_from_openrouter(emotion, target_emotion, context):
+    """Async variant of fetch_journey_from_openrouter"""
+    with generation_stage_seconds.time(stage='prompt_build'):
+        prompt = build_journey_prompt(emotion, target_emotion, context)
+    probe = await openrouter_breaker.abefore_call()
+    try:
+        journey_data = await get_model_router().afetch(prompt)
+    except json.JSONDecodeError:
+        await openrouter_breaker.arecord(True, probe)
+        raise
+    except Exception:
+        await openrouter_breaker.arecord(False, probe)
+        raise
+    await openrouter_breaker.arecord(True, probe)
+    return journey_data
+
+def generate_journey_with_claude(emotion, target_emotion, context, use_cache=True, admission=True):
+    """Generate a complete journey using Claude via OpenRouter API
+
+    Repeated requests with the same normalized inputs are answered from the
+    journey cache, and common emotion pairs from the pre-generated pool;
+    pass use_cache=False to force a fresh completion. Calls that reach the
+    model go through the admission gate unless admission=False; when it is
+    full they get the template or GenerationOverloaded, per
+    GENERATION_OVERLOAD_MODE.
+    """
+    if use_cache:
+        journey_data = lookup_journey(emotion, target_emotion, context)
+        if journey_data is not None:
+            return journey_data
+    return generate_new_journey(emotion, target_emotion, context, fresh=not use_cache, admission=admission)
+
+def lookup_journey(emotion, target_emotion, context):
+    """Return a cached journey for these inputs, or one from the pool for the emotion pair, or None"""
+    cached = get_cached_journey(emotion, target_emotion, context)
+    if cached is not None:
+        record_generation('cache')
+        return cached
+    
+    pooled = pop_pooled_journey(emotion, target_emotion)
+    if pooled is not None:
+        record_generation('pool')
+        return pooled
+    return None
+
+def generate_new_journey(emotion, target_emotion, context, fresh=False, admission=True):
+    """Generate a journey without looking in the cache or pool first.
+
+    With fresh=True a result another worker just finished for the same
+    inputs is not reused either.
+    """
+    try:
+        # Identical concurrent requests share a single upstream call; only its leader takes a slot
+        return run_single_flight(
+            make_cache_key(emotion, target_emotion, context),
+            lambda: _admitted_request(emotion, target_emotion, context, admission),
+            fresh=fresh
+        )
+    except GenerationOverloaded as e:
+        return _overloaded_journey(emotion, target_emotion, e)
+
+def _admitted_request(emotion, target_emotion, context, admission=True):
+    """Run _request_journey holding a generation slot, unless admission is False"""
+    with generation_slot() if admission else nullcontext():
+        return _request_journey(emotion, target_emotion, context)
+
+def _overloaded_journey(emotion, target_emotion, error):
+    """Serve the template at once when generation is saturated, or shed the request"""
+    if settings.GENERATION_OVERLOAD_MODE == 'reject':
+        raise error
+    record_generation('fallback', 'overloaded')
+    return get_journey_template(emotion, target_emotion)
+
+def _request_journey(emotion, target_emotion, context):
+    """Call OpenRouter for a new journey, falling back to the template on failure"""
+    try:
+        # Check if OpenRouter API key is available
+        if settings.OPENROUTER_API_KEY:
             # Parse and validate the JSON
             try:
-                journey_data = json.loads(json_str)
-                return journey_data
+                journey_data = fetch_journey_from_openrouter(emotion, target_emotion, context)
             except json.JSONDecodeError:
                 # Fallback to template if AI response is not valid JSON
                 print("Error parsing JSON from OpenRouter response")
+                record_generation('fallback', 'invalid_json')
+                return get_journey_template(emotion, target_emotion)
+            except CircuitOpen:
+                # OpenRouter is failing; skip the call and serve the template at once
+                record_generation('fallback', 'circuit_open')
                 return get_journey_template(emotion, target_emotion)
+            
+            store_journey(emotion, target_emotion, context, journey_data)
+            record_generation('openrouter')
+            return journey_data
         else:
             # No API key, use fallback template
             print("No OpenRouter API key found, using fallback template")
+            record_generation('fallback', 'no_api_key')
             return get_journey_template(emotion, target_emotion)
             
     except Exception as e:
         # Fallback to template if API call fails
         print(f"Error calling OpenRouter API: {str(e)}")
+        record_generation('fallback', 'upstream_error')
         return get_journey_template(emotion, target_emotion)
 
-def get_journey_template(emotion, target_emotion):
-    """Return a pre-built template for the given emotions"""
+async def agenerate_journey_with_claude(emotion, target_emotion, context, use_cache=True):
+    """Async variant of generate_journey_with_claude for ASGI deployments.
+
+    Awaits the OpenRouter round trip instead of blocking a worker, so a single
+    process can keep many generations in flight.
+    """
+    if use_cache:
+        journey_data = await alookup_journey(emotion, target_emotion, context)
+        if journey_data is not None:
+            return journey_data
+    return await agenerate_new_journey(emotion, target_emotion, context, fresh=not use_cache)
+
+async def alookup_journey(emotion, target_emotion, context):
+    """Async variant of lookup_journey"""
+    cached = await aget_cached_journey(emotion, target_emotion, context)
+    if cached is not None:
+        record_generation('cache')
+        return cached
     
-    # Emotion mapping
-    emotion_medals = {
-        "sad": "blue",
-        "angry": "orange", 
-        "anxious": "purple",
-        "envy": "green",
-        "happy": "gold"
-    }
+    pooled = await apop_pooled_journey(emotion, target_emotion)
+    if pooled is not None:
+        record_generation('pool')
+        return pooled
+    return None
+
+async def agenerate_new_journey(emotion, target_emotion, context, fresh=False):
+    """Async variant of generate_new_journey"""
+    try:
+        return await arun_single_flight(
+            make_cache_key(emotion, target_emotion, context),
+            lambda: _aadmitted_request(emotion, target_emotion, context),
+            fresh=fresh
+        )
+    except GenerationOverloaded as e:
+        return _overloaded_journey(emotion, target_emotion, e)
+
+async def _aadmitted_request(emotion, target_emotion, context):
+    """Async variant of _admitted_request"""
+    async with ageneration_slot():
+        return await _arequest_journey(emotion, target_emotion, context)
+
+async def _arequest_journey(emotion, target_emotion, context):
+    """Async variant of _request_journey"""
+    try:
+        if settings.OPENROUTER_API_KEY:
+            try:
+                journey_data = await afetch_journey_from_openrouter(emotion, target_emotion, context)
+            except json.JSONDecodeError:
+                print("Error parsing JSON from OpenRouter response")
+                record_generation('fallback', 'invalid_json')
+                return get_journey_template(emotion, target_emotion)
+            except CircuitOpen:
+                record_generation('fallback', 'circuit_open')
+                return get_journey_template(emotion, target_emotion)
+            
+            await astore_journey(emotion, target_emotion, context, journey_data)
+            record_generation('openrouter')
+            return journey_data
+        else:
+            print("No OpenRouter API key found, using fallback template")
+            record_generation('fallback', 'no_api_key')
+            return get_journey_template(emotion, target_emotion)
+            
+    except Exception as e:
+        print(f"Error calling OpenRouter API: {str(e)}")
+        record_generation('fallback', 'upstream_error')
+        return get_journey_template(emotion, target_emotion)
+
+def stream_journey_with_claude(emotion, target_emotion, context, use_cache=True):
+    """Stream a journey from OpenRouter, yielding sections as soon as they are complete.
+
+    Yields ("initial_prompt", dict) and ("step", dict) while the model is still
+    writing, then ("journey", dict) with the full journey. If the stream fails
+    after sections were sent, ("restart", dict) is yielded before the fallback
+    template's sections so clients can discard what they rendered.
+    """
+    if use_cache:
+        cached = lookup_journey(emotion, target_emotion, context)
+        if cached is not None:
+            yield from iter_journey_events(cached)
+            return
     
-    medal_color = emotion_medals.get(emotion, "silver")
+    with generation_stage_seconds.time(stage='prompt_build'):
+        prompt = build_journey_prompt(emotion, target_emotion, context)
+    emitted = False
+    reason = 'no_api_key'
     
-    # Basic template structure
-    template = {
-        "course": {
-            "title": f"From {emotion.title()} to {target_emotion.title()} Journey",
-            "emotion_transition": {
-                "from": emotion,
-                "to": target_emotion
-            },
-            "initial_prompt": {
-                "text": f"How are you feeling right now on a scale of 1-10? (10 being most {target_emotion})",
-                "seconds_wait": 5,
-                "input_type": "number_scale",
-                "input_range": {
-                    "min": 1,
-                    "max": 10
-                }
-            },
-            # Steps would be pre-defined per emotion pair
-            "steps": get_steps_for_emotion(emotion, target_emotion),
-            "final_check": {
-                "text": f"How are you feeling now compared to when we started? Has your {emotion} decreased on a scale of 1-10?",
-                "seconds_wait": 8,
-                "input_type": "number_scale",
-                "input_range": {
-                    "min": 1,
-                    "max": 10
-                },
-                "reward_threshold": 5
-            },
-            "reward": {
-                "medal_type": medal_color,
-                "title": f"{medal_color.title()} Medal of {target_emotion.title()}",
-                "description": "This medal represents the neurological and physiological changes you've created through these practices.",
-                "seconds_wait": 10,
-                "techniques_summary": [
-                    "Emotional awareness",
-                    "Cognitive reframing",
-                    "Mindfulness practice",
-                    "Self-compassion",
-                    "Behavioral activation"
-                ],
-                "congratulations_text": f"Each time you practice these skills, you strengthen the neural pathways that support {target_emotion}!"
-            }
-        },
-        "metadata": {
-            "version": "1.0",
-            "created_date": datetime.now().strftime('%Y-%m-%d'),
-            "target_emotions": [emotion, target_emotion],
-            "estimated_completion_time_minutes": 15,
-            "difficulty_level": "beginner"
-        }
-    }
+    try:
+        if settings.OPENROUTER_API_KEY:
+            # Streams have already sent 200, so a full gate always means the template
+            with generation_slot():
+                parser = JourneyStreamParser()
+                started = time.perf_counter()
+                first_token = None
+                # Sections are already on their way to the client, so streams use the primary without hedging
+                router = get_model_router()
+                model, _ = router.plan()
+                # Refused at once while OpenRouter is known to be failing
+                probe = openrouter_breaker.before_call()
+                # A client that disconnects (GeneratorExit) says nothing against OpenRouter
+                healthy = True
+                try:
+                    stream = create_completion(
+                        stream=True, stream_options={"include_usage": True}, **build_completion_kwargs(prompt, model)
+                    )
+                    try:
+                        for chunk in stream:
+                            # Usage arrives on a final chunk without choices
+                            if getattr(chunk, 'usage', None):
+                                record_usage(chunk)
+                                charge_usage(chunk)
+                            if not chunk.choices or not chunk.choices[0].delta.content:
+                                continue
+                            if first_token is None:
+                                first_token = time.perf_counter() - started
+                                generation_stage_seconds.observe(first_token, stage='upstream_first_token')
+                            for event in parser.feed(chunk.choices[0].delta.content):
+                                emitted = True
+                                yield event
+                    finally:
+                        # Hands the connection back to the pool even if the client went away mid-stream
+                        stream.close()
+                except Exception:
+                    healthy = False
+                    raise
+                finally:
+                    # Always reported, so a half-open probe is never left taken
+                    openrouter_breaker.record(healthy, probe)
+                # Includes the time the client took to read the sections sent so far
+                generation_stage_seconds.observe(time.perf_counter() - started, stage='upstream_stream')
+            
+            try:
+                journey_data = parse_journey_content(parser.text)
+            except json.JSONDecodeError:
+                print("Error parsing JSON from OpenRouter stream")
+                router.record_failure(model)
+                reason = 'invalid_json'
+            else:
+                router.record_success(model, first_token, time.perf_counter() - started)
+                store_journey(emotion, target_emotion, context, journey_data)
+                record_generation('openrouter')
+                yield "journey", journey_data
+                return
+        else:
+            print("No OpenRouter API key found, using fallback template")
+            
+    except GenerationOverloaded:
+        reason = 'overloaded'
+    except CircuitOpen:
+        reason = 'circuit_open'
+    except Exception as e:
+        print(f"Error streaming from OpenRouter API: {str(e)}")
+        reason = 'upstream_error'
     
-    return template
+    record_generation('fallback', reason)
+    # Fallback to the template, sent section by section like a real stream
+    journey_data = get_journey_template(emotion, target_emotion)
+    if emitted:
+        yield "restart", {"reason": "fallback"}
+    yield from iter_journey_events(journey_data)
+
+def get_journey_template(emotion, target_emotion):
+    """Return a pre-built template for the given emotions"""
+    return template_registry.render_journey(emotion, target_emotion)
 
 def get_steps_for_emotion(emotion, target_emotion):
     """Return pre-defined steps for the given emotion pair"""
-    # This would contain pre-defined steps for common emotion pairs
-    # For brevity, I'm including just a sample for sadness->happiness
-    
-    if emotion == "sad" and target_emotion == "happy":
-        return [
-            {
-                "step_number": 1,
-                "quiz": {
-                    "question": "Which of these is NOT a common physiological effect of sadness?",
-                    "options": [
-                        {"id": "A", "text": "Decreased energy levels"},
-                        {"id": "B", "text": "Increased heart rate"},
-                        {"id": "C", "text": "Changes in appetite"},
-                        {"id": "D", "text": "Disrupted sleep patterns"}
-                    ],
-                    "correct_answer": "B",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Sadness typically decreases heart rate, unlike anxiety or excitement.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Sadness typically slows our physiological systems down. It decreases heart rate, can cause fatigue, and often leads to withdrawal behaviors. This is different from anxiety or fear, which activate our sympathetic nervous system and increase heart rate.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Body Awareness Scan",
-                    "instructions": {
-                        "text": "Let's do a quick body scan to notice how sadness feels in your body right now.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Close your eyes and take a deep breath", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": "Notice any sensations in your chest", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": "Notice any sensations in your shoulders and neck", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": "Notice any sensations in your face", 
-                            "countdown": 4, 
-                            "wait": 4
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By noticing these physical sensations, you've taken the first step toward managing your emotions.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 2,
-                "quiz": {
-                    "question": "Which cognitive distortion often accompanies sadness?",
-                    "options": [
-                        {"id": "A", "text": "Catastrophizing"},
-                        {"id": "B", "text": "Mind reading"},
-                        {"id": "C", "text": "Overgeneralization"},
-                        {"id": "D", "text": "All of the above"}
-                    ],
-                    "correct_answer": "D",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! All of these cognitive distortions can accompany sadness.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Sadness often brings cognitive distortions that reinforce negative feelings. Catastrophizing makes us imagine the worst outcomes. Mind reading assumes others think negatively of us. Overgeneralization takes one negative event and applies it broadly to life. Recognizing these patterns is the first step to challenging them.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Thought Challenge",
-                    "instructions": {
-                        "text": "Let's identify and challenge a negative thought you're having.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Identify a negative thought you've had today", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "What evidence supports this thought?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "What evidence contradicts this thought?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "What would you tell a friend with this thought?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By examining your thoughts objectively, you can reduce their emotional impact.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 3,
-                "quiz": {
-                    "question": "Which activity is most likely to boost mood according to research?",
-                    "options": [
-                        {"id": "A", "text": "Scrolling social media"},
-                        {"id": "B", "text": "Watching TV alone"},
-                        {"id": "C", "text": "Light physical exercise"},
-                        {"id": "D", "text": "Online shopping"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Light physical exercise has been consistently shown to improve mood.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Exercise releases endorphins, natural mood elevators. Even light activity like walking can reduce sadness and anxiety. Physical movement also disrupts rumination cycles by shifting focus to the body. Regular exercise has been shown in studies to be as effective as medication for mild to moderate depression in some cases.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Mood-Boosting Movement",
-                    "instructions": {
-                        "text": "Let's do a brief movement exercise to activate your body's natural mood enhancers.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Stand up and gently stretch your arms overhead", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Roll your shoulders backward 5 times", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "March in place, lifting your knees high", 
-                            "countdown": 10, 
-                            "wait": 10
-                        },
-                        {
-                            "text": "Take 3 deep breaths, feeling the energy in your body", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "Even this brief activity can begin to shift your neurochemistry toward a more positive state.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 4,
-                "quiz": {
-                    "question": "Which of these is a healthy way to process sadness?",
-                    "options": [
-                        {"id": "A", "text": "Suppressing the emotion entirely"},
-                        {"id": "B", "text": "Distracting yourself until it passes"},
-                        {"id": "C", "text": "Expressing the emotion through creative outlets"},
-                        {"id": "D", "text": "Analyzing why you shouldn't feel sad"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Expressing emotions through creative outlets is a healthy processing method.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Creative expression gives form to emotions that can be difficult to verbalize. Activities like journaling, art, music, or dance allow us to process sadness without judgment. This approach acknowledges the emotion while providing a constructive channel for its energy. Research shows creative expression can reduce stress hormones and increase positive emotions.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Expressive Writing",
-                    "instructions": {
-                        "text": "Let's try a brief expressive writing exercise to process your feelings.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Take a moment to connect with how you're feeling", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Write or mentally compose a letter to your emotion", 
-                            "countdown": 15, 
-                            "wait": 15
-                        },
-                        {
-                            "text": "What would you like to say to this feeling?", 
-                            "countdown": 10, 
-                            "wait": 10
-                        },
-                        {
-                            "text": "How might this emotion be trying to help you?", 
-                            "countdown": 10, 
-                            "wait": 10
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By acknowledging and expressing your emotions, you reduce their power to overwhelm you.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 5,
-                "quiz": {
-                    "question": "Which practice has been shown to increase positive emotions over time?",
-                    "options": [
-                        {"id": "A", "text": "Gratitude practice"},
-                        {"id": "B", "text": "Comparing yourself to others"},
-                        {"id": "C", "text": "Setting extremely high standards"},
-                        {"id": "D", "text": "Focusing on future goals"}
-                    ],
-                    "correct_answer": "A",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Gratitude practice has been consistently shown to increase positive emotions.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Gratitude practice trains the brain to notice positive aspects of life that we often overlook. Regular gratitude exercises have been shown to increase happiness, reduce depression, improve sleep, and even strengthen immune function. This practice works by shifting attention from what's lacking to what's present, creating new neural pathways that support positive emotional states.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Gratitude Practice",
-                    "instructions": {
-                        "text": "Let's practice gratitude to build positive emotional resources.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Think of something small you're grateful for today", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Recall a person who has supported you recently", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Notice something about your body you're thankful for", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Identify a challenge that taught you something valuable", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "Regular gratitude practice can gradually shift your emotional baseline toward greater happiness.",
-                        "wait": 3
-                    }
-                }
-            }
-        ]
-    elif emotion == "anxious" and target_emotion == "calm":
-        return [
-            {
-                "step_number": 1,
-                "quiz": {
-                    "question": "Which physical symptom is commonly associated with anxiety?",
-                    "options": [
-                        {"id": "A", "text": "Decreased heart rate"},
-                        {"id": "B", "text": "Muscle relaxation"},
-                        {"id": "C", "text": "Shallow breathing"},
-                        {"id": "D", "text": "Decreased blood pressure"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Shallow breathing is a common physical symptom of anxiety.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Anxiety activates our sympathetic nervous system (fight-or-flight response), which often leads to shallow, rapid breathing. This breathing pattern can actually increase feelings of anxiety by reducing carbon dioxide levels in the blood, causing lightheadedness and increased heart rate. Understanding this connection gives us a powerful intervention point: controlling our breath.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Diaphragmatic Breathing",
-                    "instructions": {
-                        "text": "Let's practice deep breathing to activate your parasympathetic nervous system.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Place one hand on your chest and one on your stomach", 
-                            "countdown": 3, 
-                            "wait": 3
-                        },
-                        {
-                            "text": "Breathe in slowly through your nose for 4 counts", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": "Hold your breath for 2 counts", 
-                            "countdown": 2, 
-                            "wait": 2
-                        },
-                        {
-                            "text": "Exhale slowly through your mouth for 6 counts", 
-                            "countdown": 6, 
-                            "wait": 6
-                        },
-                        {
-                            "text": "Repeat this cycle 3 more times", 
-                            "countdown": 36, 
-                            "wait": 36
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "This breathing pattern activates your parasympathetic nervous system, which counteracts anxiety's effects.",
-                        "wait": 3
-                    }
-                }
-            },
-            # Additional steps would be added here for anxious->calm
-        ]
-    elif emotion == "angry" and target_emotion == "peaceful":
-        return [
-            {
-                "step_number": 1,
-                "quiz": {
-                    "question": "What happens in the brain when we experience anger?",
-                    "options": [
-                        {"id": "A", "text": "The prefrontal cortex becomes more active"},
-                        {"id": "B", "text": "The amygdala becomes less active"},
-                        {"id": "C", "text": "The amygdala triggers the fight-or-flight response"},
-                        {"id": "D", "text": "Serotonin levels increase significantly"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! The amygdala triggers the fight-or-flight response during anger.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "When we feel angry, the amygdala (our brain's alarm system) activates the fight-or-flight response, flooding our body with stress hormones like adrenaline and cortisol. This physiological response prepares us for conflict by increasing heart rate, blood pressure, and muscle tension. At the same time, activity in the prefrontal cortex (responsible for rational thinking) often decreases, making it harder to think clearly.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Temperature Change",
-                    "instructions": {
-                        "text": "Let's try a physical technique to cool down anger quickly.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "If possible, place your hands or face under cool water", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Alternatively, place a cool object against your forehead or neck", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Focus on the cooling sensation as it spreads", 
-                            "countdown": 10, 
-                            "wait": 10
-                        },
-                        {
-                            "text": "Take slow, deep breaths as you continue to focus on the sensation", 
-                            "countdown": 10, 
-                            "wait": 10
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "This technique works by activating the mammalian diving reflex, which naturally calms your nervous system.",
-                        "wait": 3
-                    }
-                }
-            },
-            # Additional steps would be added here for angry->peaceful
-        ]
-    else:
-        # Default generic steps
-        return [
-            {
-                "step_number": 1,
-                "quiz": {
-                    "question": f"Which of these is a healthy way to respond to feeling {emotion}?",
-                    "options": [
-                        {"id": "A", "text": "Ignore the feeling completely"},
-                        {"id": "B", "text": "Acknowledge the emotion without judgment"},
-                        {"id": "C", "text": "Distract yourself with social media"},
-                        {"id": "D", "text": "Tell yourself to just feel better"}
-                    ],
-                    "correct_answer": "B",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Acknowledging emotions without judgment is a key part of emotional intelligence.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": f"When we feel {emotion}, acknowledging the emotion without judgment allows us to process it in a healthy way. This is a fundamental principle of mindfulness and emotional intelligence.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Mindful Awareness",
-                    "instructions": {
-                        "text": f"Let's practice acknowledging your {emotion} with mindfulness.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Take a deep breath in and out", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": f"Say to yourself: 'I notice I'm feeling {emotion}'", 
-                            "countdown": 4, 
-                            "wait": 4
-                        },
-                        {
-                            "text": "Observe any physical sensations without trying to change them", 
-                            "countdown": 4, 
-                            "wait": 4
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By acknowledging your emotions, you've taken an important step toward emotional well-being.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 2,
-                "quiz": {
-                    "question": "Which of these statements about emotions is true?",
-                    "options": [
-                        {"id": "A", "text": "Emotions are either good or bad"},
-                        {"id": "B", "text": "We should always try to control our emotions"},
-                        {"id": "C", "text": "Emotions provide valuable information about our needs"},
-                        {"id": "D", "text": "Emotional reactions are always rational"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Emotions provide valuable information about our needs and values.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Emotions serve as messengers that help us understand what matters to us. Rather than being 'good' or 'bad,' emotions are signals that can guide our decisions and actions. Understanding the message behind an emotion helps us respond effectively to situations.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Emotion as Messenger",
-                    "instructions": {
-                        "text": "Let's explore what your current emotion might be telling you.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "What need might this emotion be highlighting?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "What value or boundary might this emotion be protecting?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "What action might this emotion be suggesting?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By listening to your emotions, you gain valuable insights that can guide your choices.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 3,
-                "quiz": {
-                    "question": "Which technique can help regulate intense emotions?",
-                    "options": [
-                        {"id": "A", "text": "Suppressing the emotion"},
-                        {"id": "B", "text": "Physical exercise"},
-                        {"id": "C", "text": "Ruminating on the cause"},
-                        {"id": "D", "text": "Consuming caffeine or sugar"}
-                    ],
-                    "correct_answer": "B",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Physical exercise is an effective way to regulate intense emotions.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Exercise helps process emotions by metabolizing stress hormones, releasing endorphins, and shifting focus to physical sensations. Even brief movement can change your physiological state and create distance from overwhelming feelings.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Movement Reset",
-                    "instructions": {
-                        "text": "Let's use physical movement to shift your emotional state.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Stand up if possible and shake out your hands and arms", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Roll your shoulders forward and backward", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Gently twist your torso from side to side", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Take three deep breaths with arms raising on inhale, lowering on exhale", 
-                            "countdown": 10, 
-                            "wait": 10
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "This brief movement break helps reset your nervous system and create emotional space.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 4,
-                "quiz": {
-                    "question": "Which statement about thoughts and emotions is most accurate?",
-                    "options": [
-                        {"id": "A", "text": "Our thoughts directly cause our emotions"},
-                        {"id": "B", "text": "We have no control over our thoughts"},
-                        {"id": "C", "text": "Thoughts and emotions influence each other"},
-                        {"id": "D", "text": "Emotions have no effect on thinking"}
-                    ],
-                    "correct_answer": "C",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Thoughts and emotions have a bidirectional relationship, influencing each other.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Our thoughts can trigger or intensify emotions, while our emotions can shape the content and style of our thinking. This relationship creates feedback loops that can either escalate or de-escalate our emotional experiences. By recognizing this connection, we can intervene at either the thought or emotion level to create positive change.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Thought Reframing",
-                    "instructions": {
-                        "text": "Let's practice reframing a thought to shift your emotional experience.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Notice a thought that's contributing to your current emotion", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Ask yourself: Is this thought helpful? Is it accurate?", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Consider a more balanced or helpful perspective", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Notice how this new perspective feels in your body", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "By reframing unhelpful thoughts, you can shift your emotional experience.",
-                        "wait": 3
-                    }
-                }
-            },
-            {
-                "step_number": 5,
-                "quiz": {
-                    "question": "Which of these practices builds emotional resilience over time?",
-                    "options": [
-                        {"id": "A", "text": "Avoiding all emotional triggers"},
-                        {"id": "B", "text": "Regular self-care and stress management"},
-                        {"id": "C", "text": "Keeping emotions private from others"},
-                        {"id": "D", "text": "Focusing only on positive emotions"}
-                    ],
-                    "correct_answer": "B",
-                    "seconds_wait": 10
-                },
-                "education": {
-                    "correct_text": "Correct! Regular self-care and stress management build emotional resilience.",
-                    "correct_text_seconds_wait": 5,
-                    "explanation": "Emotional resilience is built through consistent practices that support overall well-being. Regular self-care activities like adequate sleep, nutrition, exercise, and stress management create a foundation that helps us navigate emotional challenges. Rather than avoiding emotions, resilience comes from developing the skills to process them effectively.",
-                    "explanation_seconds_wait": 8
-                },
-                "guided_activity": {
-                    "title": "Resilience Planning",
-                    "instructions": {
-                        "text": "Let's create a simple resilience plan for ongoing emotional well-being.",
-                        "wait": 5
-                    },
-                    "steps": [
-                        {
-                            "text": "Identify one self-care activity you can practice daily", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Think of a person you can reach out to when you need support", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Consider a calming activity you can use when feeling overwhelmed", 
-                            "countdown": 5, 
-                            "wait": 5
-                        },
-                        {
-                            "text": "Imagine implementing this plan and notice how it feels", 
-                            "countdown": 5, 
-                            "wait": 5
-                        }
-                    ],
-                    "conclusion": {
-                        "text": "Having a simple resilience plan helps you navigate emotional challenges more effectively.",
-                        "wait": 3
-                    }
-                }
-            }
-        ]
+    return template_registry.render_steps(emotion, target_emotion)
@@ -0,0 +1,265 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count
+from django.utils import timezone
+from ..models import MoodHistogramBucket, MoodOutcomeRollup, MoodTrendBucket
+from .journey_pool import normalize_emotion
+
+# (initial rating, final rating, earned medal) of a progress row with nothing recorded yet
+NO_OUTCOME = (None, None, False)
+
+# Columns of MoodOutcomeRollup that RollupChanges adds deltas to
+ROLLUP_COUNTERS = (
+    'courses', 'initial_count', 'initial_sum', 'initial_sum_squares', 'final_count', 'final_sum',
+    'final_sum_squares', 'improvement_count', 'improvement_sum', 'improvement_sum_squares', 'medals',
+)
+
+def outcome_of(progress):
+    """The parts of a UserProgress row that the mood rollups summarize"""
+    return (progress.initial_mood_rating, progress.final_mood_rating, progress.earned_medal)
+
+class RollupChanges:
+    """Rollup deltas collected during a write, applied as one upsert per table"""
+
+    def __init__(self):
+        self.pairs = defaultdict(lambda: defaultdict(int))
+        self.buckets = defaultdict(int)  # (pair, kind, rating) -> count delta
+        self.trends = {}  # (user_id, granularity, period_start) -> [count, sum, sum_squares, min, max]
+
+    def add_courses(self, from_emotion, to_emotion, count=1):
+        pair = (normalize_emotion(from_emotion), normalize_emotion(to_emotion))
+        self.pairs[pair]['courses'] += count
+
+    def add_change(self, from_emotion, to_emotion, before, after, weight=1):
+        """Swap one progress row's contribution from its old outcome to its new one"""
+        if before == after:
+            return
+        pair = (normalize_emotion(from_emotion), normalize_emotion(to_emotion))
+        for outcome, sign in ((before, -weight), (after, weight)):
+            initial, final, earned_medal = outcome
+            deltas = self.pairs[pair]
+            for kind, rating in ((MoodHistogramBucket.KIND_INITIAL, initial), (MoodHistogramBucket.KIND_FINAL, final)):
+                if rating is None:
+                    continue
+                deltas[f'{kind}_count'] += sign
+                deltas[f'{kind}_sum'] += sign * rating
+                deltas[f'{kind}_sum_squares'] += sign * rating * rating
+                self.buckets[(pair, kind, rating)] += sign
+            if initial is not None and final is not None:
+                improvement = final - initial
+                deltas['improvement_count'] += sign
+                deltas['improvement_sum'] += sign * improvement
+                deltas['improvement_sum_squares'] += sign * improvement * improvement
+            if earned_medal:
+                deltas['medals'] += sign
+
+    def add_mood(self, user_id, rating, moment):
+        """Count a mood rating reported at moment in the user's day and week trend buckets"""
+        day = timezone.localdate(moment)
+        periods = (
+            (MoodTrendBucket.GRANULARITY_DAY, day),
+            (MoodTrendBucket.GRANULARITY_WEEK, day - timedelta(days=day.weekday())),
+        )
+        for granularity, period_start in periods:
+            stats = self.trends.get((user_id, granularity, period_start))
+            if stats is None:
+                self.trends[(user_id, granularity, period_start)] = [1, rating, rating * rating, rating, rating]
+            else:
+                stats[0] += 1
+                stats[1] += rating
+                stats[2] += rating * rating
+                stats[3] = min(stats[3], rating)
+                stats[4] = max(stats[4], rating)
+
+    def apply(self, apps=global_apps):
+        """Write the collected deltas, one statement per table; call inside the transaction that made the changes.
+
+        Migrations pass their historical apps registry.
+        """
+        now = timezone.now()
+        rollups = []
+        for (from_emotion, to_emotion), deltas in self.pairs.items():
+            if any(deltas.values()):
+                rollups.append({'from_emotion': from_emotion, 'to_emotion': to_emotion, 'updated_at': now,
+                                **{field: deltas.get(field, 0) for field in ROLLUP_COUNTERS}})
+        _upsert(apps.get_model('api', 'MoodOutcomeRollup'), ('from_emotion', 'to_emotion'), rollups,
+                add=ROLLUP_COUNTERS, replace=('updated_at',))
+
+        buckets = [
+            {'from_emotion': from_emotion, 'to_emotion': to_emotion, 'kind': kind, 'rating': rating, 'count': delta}
+            for ((from_emotion, to_emotion), kind, rating), delta in self.buckets.items() if delta
+        ]
+        _upsert(apps.get_model('api', 'MoodHistogramBucket'), ('from_emotion', 'to_emotion', 'kind', 'rating'), buckets,
+                add=('count',))
+
+        trends = [
+            {'user_id': user_id, 'granularity': granularity, 'period_start': period_start, 'count': count,
+             'sum': total, 'sum_squares': squares, 'min_rating': low, 'max_rating': high}
+            for (user_id, granularity, period_start), (count, total, squares, low, high) in self.trends.items()
+        ]
+        if trends:
+            _upsert(apps.get_model('api', 'MoodTrendBucket'), ('user_id', 'granularity', 'period_start'), trends,
+                    add=('count', 'sum', 'sum_squares'), least=('min_rating',), greatest=('max_rating',))
+
+def _upsert(model, keys, rows, add=(), replace=(), least=(), greatest=()):
+    """Insert rows, or fold each into the existing row with the same keys, in one statement.
+
+    add columns are summed into the existing row, replace columns overwrite
+    it and least/greatest columns keep the smaller/larger value. Every row
+    must have the same columns. Uses INSERT ... ON CONFLICT DO UPDATE, which
+    both SQLite and PostgreSQL support; keys must match a unique constraint.
+    """
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = {field.name: quote(field.column) for field in fields}
+
+    assignments = [f"{columns[name]} = {table}.{columns[name]} + EXCLUDED.{columns[name]}" for name in add]
+    assignments += [f"{columns[name]} = EXCLUDED.{columns[name]}" for name in replace]
+    for names, operator in ((least, '<'), (greatest, '>')):
+        assignments += [
+            f"{columns[name]} = CASE WHEN EXCLUDED.{columns[name]} {operator} {table}.{columns[name]} "
+            f"THEN EXCLUDED.{columns[name]} ELSE {table}.{columns[name]} END"
+            for name in names
+        ]
+    placeholders = "(" + ", ".join(["%s"] * len(fields)) + ")"
+
+    # Always in key order, so concurrent writers lock rows in the same order; batches stay under SQLite's variable limit
+    rows = sorted(rows, key=lambda row: tuple(row[name] for name in keys))
+    batch_size = max(1, 999 // len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(columns.values())}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({', '.join(columns[name] for name in keys)}) DO UPDATE SET {', '.join(assignments)}",
+                [field.get_db_prep_save(row[field.name], connection) for row in batch for field in fields]
+            )
+
+def rebuild_mood_rollups(apps=global_apps):
+    """Recompute every rollup from scratch, e.g. after a backfill. Returns the number of pairs.
+
+    Migrations pass their historical apps registry.
+    """
+    course_model = apps.get_model('api', 'EmotionalCourse')
+    progress_model = apps.get_model('api', 'UserProgress')
+    changes = RollupChanges()
+    with transaction.atomic():
+        # Deleting first locks the rollup rows, so progress writes racing the rebuild
+        # either commit before the reads below or add their deltas after it
+        apps.get_model('api', 'MoodOutcomeRollup').objects.all().delete()
+        apps.get_model('api', 'MoodHistogramBucket').objects.all().delete()
+
+        for row in course_model.objects.values('from_emotion', 'to_emotion').annotate(count=Count('id')).order_by():
+            changes.add_courses(row['from_emotion'], row['to_emotion'], row['count'])
+
+        # Group identical outcomes in the database; only distinct combinations come back
+        outcomes = (
+            progress_model.objects
+            .values('course__from_emotion', 'course__to_emotion', 'initial_mood_rating', 'final_mood_rating', 'earned_medal')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+        for row in outcomes:
+            outcome = (row['initial_mood_rating'], row['final_mood_rating'], row['earned_medal'])
+            changes.add_change(row['course__from_emotion'], row['course__to_emotion'], NO_OUTCOME, outcome, row['count'])
+
+        changes.apply(apps)
+    return len(changes.pairs)
+
+def _distribution(count, total, sum_squares):
+    if not count:
+        return {"count": 0, "mean": None, "stddev": None}
+    mean = total / count
+    variance = max(0.0, sum_squares / count - mean * mean)
+    return {"count": count, "mean": round(mean, 3), "stddev": round(math.sqrt(variance), 3)}
+
+def mood_outcomes(from_emotion=None, to_emotion=None):
+    """Per-pair outcome statistics, read from the rollup tables only"""
+    rollups = MoodOutcomeRollup.objects.order_by('-courses', 'from_emotion', 'to_emotion')
+    buckets = MoodHistogramBucket.objects.filter(count__gt=0)
+    if from_emotion:
+        rollups = rollups.filter(from_emotion=normalize_emotion(from_emotion))
+        buckets = buckets.filter(from_emotion=normalize_emotion(from_emotion))
+    if to_emotion:
+        rollups = rollups.filter(to_emotion=normalize_emotion(to_emotion))
+        buckets = buckets.filter(to_emotion=normalize_emotion(to_emotion))
+
+    histograms = defaultdict(dict)
+    for bucket in buckets.order_by('rating'):
+        histograms[(bucket.from_emotion, bucket.to_emotion, bucket.kind)][str(bucket.rating)] = bucket.count
+
+    results = []
+    for rollup in rollups:
+        pair = (rollup.from_emotion, rollup.to_emotion)
+        initial = _distribution(rollup.initial_count, rollup.initial_sum, rollup.initial_sum_squares)
+        initial["histogram"] = histograms[pair + (MoodHistogramBucket.KIND_INITIAL,)]
+        final = _distribution(rollup.final_count, rollup.final_sum, rollup.final_sum_squares)
+        final["histogram"] = histograms[pair + (MoodHistogramBucket.KIND_FINAL,)]
+        results.append({
+            "from_emotion": rollup.from_emotion,
+            "to_emotion": rollup.to_emotion,
+            "courses": rollup.courses,
+            "initial_mood": initial,
+            "final_mood": final,
+            "improvement": _distribution(rollup.improvement_count, rollup.improvement_sum, rollup.improvement_sum_squares),
+            "medals": rollup.medals,
+            "medal_rate": round(rollup.medals / rollup.courses, 3) if rollup.courses else None,
+            "updated_at": rollup.updated_at,
+        })
+    return results
+
+def mood_trend(user_id, start, end, granularity=None, max_points=None):
+    """A user's mood between two dates, at most max_points points.
+
+    Reads day buckets when the range fits in max_points, week buckets
+    otherwise (unless granularity is given), then merges neighbouring
+    buckets into equal spans of time until the series fits.
+    Returns (granularity, span_days, points).
+    """
+    max_points = max_points or settings.MOOD_TREND_MAX_POINTS
+    if granularity is None:
+        fits_in_days = (end - start).days + 1 <= max_points
+        granularity = MoodTrendBucket.GRANULARITY_DAY if fits_in_days else MoodTrendBucket.GRANULARITY_WEEK
+    period_days = 1 if granularity == MoodTrendBucket.GRANULARITY_DAY else 7
+    if period_days == 7:
+        start -= timedelta(days=start.weekday())
+
+    periods = (end - start).days // period_days + 1
+    span_days = period_days * math.ceil(periods / max_points)
+
+    rows = (
+        MoodTrendBucket.objects
+        .filter(user_id=user_id, granularity=granularity, period_start__gte=start, period_start__lte=end)
+        .order_by('period_start')
+        .values_list('period_start', 'count', 'sum', 'sum_squares', 'min_rating', 'max_rating')
+    )
+
+    # Buckets combine exactly: counts and sums add, extremes take the extreme
+    merged = {}
+    for period_start, count, total, squares, low, high in rows:
+        point_start = start + timedelta(days=(period_start - start).days // span_days * span_days)
+        stats = merged.get(point_start)
+        if stats is None:
+            merged[point_start] = [count, total, squares, low, high]
+        else:
+            stats[0] += count
+            stats[1] += total
+            stats[2] += squares
+            stats[3] = min(stats[3], low)
+            stats[4] = max(stats[4], high)
+
+    points = []
+    for point_start, (count, total, squares, low, high) in merged.items():
+        point = _distribution(count, total, squares)
+        point.update({"start": point_start, "min": low, "max": high})
+        points.append(point)
+    return granularity, span_days, points
@@ -0,0 +1,196 @@
+import math
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+from ..metrics import Gauge, circuit_errors, circuit_transitions, registry
+from ..models import CircuitBreakerState
+
+CLOSED = CircuitBreakerState.STATE_CLOSED
+OPEN = CircuitBreakerState.STATE_OPEN
+HALF_OPEN = CircuitBreakerState.STATE_HALF_OPEN
+
+class CircuitOpen(Exception):
+    """The breaker is refusing calls to a failing upstream"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit breaker {name} is open")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker whose state lives in the database.
+
+    After CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive failures the breaker
+    opens and calls are refused for CIRCUIT_BREAKER_OPEN_SECONDS. Then up to
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES calls go through as probes: if they all
+    succeed it closes, and any failure opens it again. Each worker trusts its
+    cached copy of the state for CIRCUIT_BREAKER_SYNC_SECONDS, and while open
+    refuses calls without touching the database at all.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._synced = None  # time.monotonic() when the copy was read
+        self._lock = threading.Lock()
+
+    def _cache(self, row):
+        with self._lock:
+            self.state = row.state if row else CLOSED
+            self.failures = row.failures if row else 0
+            self.opened_at = row.opened_at if row else None
+            self._synced = time.monotonic()
+
+    def _open_until(self, opened_at):
+        return opened_at + timedelta(seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS)
+
+    def _refused(self, opened_at):
+        wait = (self._open_until(opened_at) - timezone.now()).total_seconds()
+        return CircuitOpen(self.name, max(1, math.ceil(wait)))
+
+    def _local_decision(self):
+        """False to let the call through, CircuitOpen to refuse it, None if the database must decide"""
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return False
+        with self._lock:
+            state, opened_at, synced = self.state, self.opened_at, self._synced
+        if state == OPEN and timezone.now() < self._open_until(opened_at):
+            return self._refused(opened_at)
+        if state == CLOSED and synced is not None and time.monotonic() - synced < settings.CIRCUIT_BREAKER_SYNC_SECONDS:
+            return False
+        return None
+
+    def _locked_row(self):
+        """The breaker's row, locked for the current transaction and created if missing"""
+        row = CircuitBreakerState.objects.select_for_update().filter(name=self.name).first()
+        if row is None:
+            try:
+                with transaction.atomic():
+                    row = CircuitBreakerState.objects.create(name=self.name)
+            except IntegrityError:
+                # Another worker created it first
+                row = CircuitBreakerState.objects.select_for_update().get(name=self.name)
+        return row
+
+    def _transition(self, row, state):
+        circuit_transitions.inc(breaker=self.name, state=state)
+        row.state = state
+        if state == OPEN:
+            row.opened_at = timezone.now()
+        if state == HALF_OPEN:
+            row.probes = row.successes = 0
+        if state == CLOSED:
+            row.failures = 0
+
+    def _shared_decision(self):
+        row = CircuitBreakerState.objects.filter(name=self.name).first()
+        if row is None or row.state == CLOSED:
+            self._cache(row)
+            return False
+
+        with transaction.atomic():
+            row = self._locked_row()
+            now = timezone.now()
+            if row.state == OPEN and now >= self._open_until(row.opened_at):
+                self._transition(row, HALF_OPEN)
+            elif row.state == HALF_OPEN and row.updated_at < now - timedelta(seconds=settings.CIRCUIT_BREAKER_OPEN_SECONDS):
+                # Probes that never reported back (a crashed worker) stop blocking new ones
+                row.probes = row.successes = 0
+
+            probe = row.state == HALF_OPEN and row.probes < settings.CIRCUIT_BREAKER_HALF_OPEN_PROBES
+            if probe:
+                row.probes += 1
+                row.save()
+        self._cache(row)
+        if row.state == CLOSED or probe:
+            return probe
+        return self._refused(row.opened_at if row.state == OPEN else now)
+
+    def _decide(self, decision):
+        if isinstance(decision, CircuitOpen):
+            raise decision
+        return decision
+
+    def before_call(self):
+        """Return True if the call is a half-open probe, or raise CircuitOpen to refuse it"""
+        decision = self._local_decision()
+        if decision is None:
+            try:
+                decision = self._shared_decision()
+            except DatabaseError:
+                # Never refuse calls just because the breaker's bookkeeping failed
+                circuit_errors.inc(breaker=self.name, operation='read')
+                decision = False
+        return self._decide(decision)
+
+    async def abefore_call(self):
+        """Async variant of before_call; only leaves the event loop when the database must decide"""
+        decision = self._local_decision()
+        if decision is None:
+            return await sync_to_async(self.before_call)()
+        return self._decide(decision)
+
+    def _needs_update(self, ok, probe):
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return False
+        with self._lock:
+            # Successes while closed and clean, the common case, skip the database
+            return not (ok and not probe and self.state == CLOSED and not self.failures)
+
+    def _update(self, ok, probe):
+        with transaction.atomic():
+            row = self._locked_row()
+            if ok:
+                if row.state == HALF_OPEN and probe:
+                    row.successes += 1
+                    if row.successes >= settings.CIRCUIT_BREAKER_HALF_OPEN_PROBES:
+                        self._transition(row, CLOSED)
+                elif row.state == CLOSED:
+                    row.failures = 0
+            elif row.state == HALF_OPEN:
+                self._transition(row, OPEN)
+            elif row.state == CLOSED:
+                row.failures += 1
+                if row.failures >= settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD:
+                    self._transition(row, OPEN)
+            row.save()
+        self._cache(row)
+
+    def record(self, ok, probe=False):
+        """Report how a call let through by before_call went"""
+        if not self._needs_update(ok, probe):
+            return
+        try:
+            self._update(ok, probe)
+        except DatabaseError:
+            circuit_errors.inc(breaker=self.name, operation='record')
+
+    async def arecord(self, ok, probe=False):
+        """Async variant of record"""
+        if self._needs_update(ok, probe):
+            await sync_to_async(self.record)(ok, probe)
+
+    def stats(self):
+        row = CircuitBreakerState.objects.filter(name=self.name).first()
+        if row is None:
+            return {"state": CLOSED, "failures": 0, "opened_at": None, "probes": 0, "successes": 0}
+        return {
+            "state": row.state,
+            "failures": row.failures,
+            "opened_at": row.opened_at,
+            "probes": row.probes,
+            "successes": row.successes,
+        }
+
+openrouter_breaker = CircuitBreaker('openrouter')
+
+registry.register(Gauge(
+    'dapi_openrouter_circuit_state',
+    "OpenRouter circuit breaker as last seen by this process: 0 closed, 1 half-open, 2 open",
+    lambda: {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}[openrouter_breaker.state],
+))
@@ -0,0 +1,21 @@
+from django.db import transaction
+from ..metrics import generation_stage_seconds
+from ..models import EmotionalCourse, UserProgress
+from .analytics_service import RollupChanges
+
+def create_course(user_id, mood, target_emotion, context, journey_data):
+    """Persist a generated journey together with its initial progress row"""
+    with generation_stage_seconds.time(stage='db_insert'), transaction.atomic():
+        course = EmotionalCourse.objects.create(
+            user_id=user_id,
+            from_emotion=mood,
+            to_emotion=target_emotion,
+            context=context,
+            json_data=journey_data
+        )
+        UserProgress.objects.create(course=course, user_id=user_id)
+
+        changes = RollupChanges()
+        changes.add_courses(mood, target_emotion)
+        changes.apply()
+    return course
@@ -0,0 +1,108 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import GenerationJob
+from .ai_service import generate_journey_with_claude
+from .course_service import create_course
+from .rate_limit import charge_to
+
+# Process-wide worker pool, created lazily on first submit
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the shared thread pool that runs generation jobs in this process"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GENERATION_JOB_WORKERS,
+                    thread_name_prefix="generation-job"
+                )
+    return _executor
+
+def enqueue_generation(user_id, mood, target_emotion, context, use_cache=True):
+    """Record a queued generation job and hand it to the local worker pool"""
+    job = GenerationJob.objects.create(
+        user_id=user_id,
+        from_emotion=mood,
+        to_emotion=target_emotion,
+        context=context,
+        use_cache=use_cache
+    )
+
+    # Dispatch only once the job row is visible to the worker threads
+    if settings.GENERATION_JOB_RUN_IN_PROCESS:
+        transaction.on_commit(lambda: get_executor().submit(run_job, job.id))
+
+    return job
+
+def claim_job(job_id):
+    """Atomically move a queued job to running; False if another worker got it"""
+    claimed = GenerationJob.objects.filter(id=job_id, status=GenerationJob.STATUS_QUEUED).update(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at=timezone.now(),
+        attempts=F('attempts') + 1
+    )
+    return claimed == 1
+
+def claim_next_job():
+    """Claim the oldest queued job, returning its id or None if the queue is empty"""
+    while True:
+        job_id = (
+            GenerationJob.objects.filter(status=GenerationJob.STATUS_QUEUED)
+            .order_by('created_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        if claim_job(job_id):
+            return job_id
+        # Lost the race to another worker, try the next one
+
+def run_job(job_id, claimed=False):
+    """Generate and persist the course for a job, recording the outcome on the row"""
+    close_old_connections()
+    try:
+        if not claimed and not claim_job(job_id):
+            return
+
+        job = GenerationJob.objects.get(id=job_id)
+        try:
+            with charge_to(job.user_id):
+                # The job pool already bounds concurrency, and jobs have no caller to shed
+                journey_data = generate_journey_with_claude(
+                    job.from_emotion, job.to_emotion, job.context, use_cache=job.use_cache, admission=False
+                )
+            course = create_course(job.user_id, job.from_emotion, job.to_emotion, job.context, journey_data)
+        except Exception as e:
+            print(f"Generation job {job_id} failed: {str(e)}")
+            GenerationJob.objects.filter(id=job_id).update(
+                status=GenerationJob.STATUS_FAILED,
+                error=str(e),
+                finished_at=timezone.now()
+            )
+            return
+
+        GenerationJob.objects.filter(id=job_id).update(
+            status=GenerationJob.STATUS_DONE,
+            course=course,
+            finished_at=timezone.now()
+        )
+    finally:
+        # Worker threads own their DB connections, release them between jobs
+        close_old_connections()
+
+def requeue_stale_jobs():
+    """Put running jobs back in the queue if their worker died mid-generation"""
+    cutoff = timezone.now() - timedelta(seconds=settings.GENERATION_JOB_STALE_SECONDS)
+    return GenerationJob.objects.filter(
+        status=GenerationJob.STATUS_RUNNING,
+        started_at__lt=cutoff
+    ).update(status=GenerationJob.STATUS_QUEUED, started_at=None)
@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from ..models import JourneyCacheEntry
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(value):
+    """Canonicalize free text so trivially different inputs share a cache key"""
+    value = _NON_WORD.sub(" ", str(value).lower())
+    return _WHITESPACE.sub(" ", value).strip()
+
+def make_cache_key(emotion, target_emotion, context):
+    """Hash the normalized (emotion, target, context) triple into a cache key"""
+    canonical = json.dumps([normalize_text(emotion), normalize_text(target_emotion), normalize_text(context)])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class LocalJourneyCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL and hit counter"""
+
+    def __init__(self, max_entries, ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> [journey, expires_at, hits]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry[2] += 1
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, journey, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = [journey, time.monotonic() + ttl, 0]
+            self._entries.move_to_end(key)
+            # Evict least recently used entries beyond capacity
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+_local_cache = None
+_local_cache_lock = threading.Lock()
+_stores_since_prune = 0
+
+def get_local_cache():
+    """Return the process-wide in-memory tier of the journey cache"""
+    global _local_cache
+    if _local_cache is None:
+        with _local_cache_lock:
+            if _local_cache is None:
+                _local_cache = LocalJourneyCache(
+                    settings.JOURNEY_CACHE_MAX_ENTRIES,
+                    settings.JOURNEY_CACHE_TTL_SECONDS
+                )
+    return _local_cache
+
+def _fresh_copy(journey):
+    """Hand out a private copy dated today, so callers never mutate cached data"""
+    journey = copy.deepcopy(journey)
+    if isinstance(journey.get("metadata"), dict):
+        journey["metadata"]["created_date"] = datetime.now().strftime('%Y-%m-%d')
+    return journey
+
+def _get_from_db(key):
+    now = timezone.now()
+    entry = JourneyCacheEntry.objects.filter(key=key, expires_at__gt=now).first()
+    if entry is None:
+        return None
+    JourneyCacheEntry.objects.filter(pk=entry.pk).update(hits=F('hits') + 1, last_hit_at=now)
+    # Promote into the local tier for the rest of the entry's lifetime
+    get_local_cache().set(key, entry.journey, (entry.expires_at - now).total_seconds())
+    return entry.journey
+
+def get_cached_journey(emotion, target_emotion, context):
+    """Return a cached journey for these inputs, checking memory then the database"""
+    if not settings.JOURNEY_CACHE_ENABLED:
+        return None
+    key = make_cache_key(emotion, target_emotion, context)
+    journey = get_local_cache().get(key)
+    if journey is None:
+        try:
+            journey = _get_from_db(key)
+        except DatabaseError as e:
+            print(f"Error reading journey cache: {str(e)}")
+    return _fresh_copy(journey) if journey is not None else None
+
+async def aget_cached_journey(emotion, target_emotion, context):
+    """Async variant of get_cached_journey; memory hits never leave the event loop"""
+    if not settings.JOURNEY_CACHE_ENABLED:
+        return None
+    key = make_cache_key(emotion, target_emotion, context)
+    journey = get_local_cache().get(key)
+    if journey is None:
+        try:
+            journey = await sync_to_async(_get_from_db)(key)
+        except DatabaseError as e:
+            print(f"Error reading journey cache: {str(e)}")
+    return _fresh_copy(journey) if journey is not None else None
+
+def store_journey(emotion, target_emotion, context, journey):
+    """Save a freshly generated journey in both cache tiers"""
+    global _stores_since_prune
+    if not settings.JOURNEY_CACHE_ENABLED:
+        return
+    key = make_cache_key(emotion, target_emotion, context)
+    journey = copy.deepcopy(journey)
+    get_local_cache().set(key, journey)
+    try:
+        JourneyCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                "from_emotion": emotion,
+                "to_emotion": target_emotion,
+                "journey": journey,
+                "expires_at": timezone.now() + timedelta(seconds=settings.JOURNEY_CACHE_TTL_SECONDS),
+            }
+        )
+        _stores_since_prune += 1
+        if _stores_since_prune >= settings.JOURNEY_CACHE_PRUNE_EVERY:
+            _stores_since_prune = 0
+            prune_journey_cache()
+    except DatabaseError as e:
+        print(f"Error writing journey cache: {str(e)}")
+
+async def astore_journey(emotion, target_emotion, context, journey):
+    """Async variant of store_journey"""
+    await sync_to_async(store_journey)(emotion, target_emotion, context, journey)
+
+def prune_journey_cache():
+    """Drop expired rows, then the least recently used rows beyond the size cap"""
+    deleted, _ = JourneyCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+    overflow = (
+        JourneyCacheEntry.objects.order_by(Coalesce('last_hit_at', 'created_at').desc())
+        .values_list('id', flat=True)[settings.JOURNEY_CACHE_DB_MAX_ENTRIES:]
+    )
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        deleted += JourneyCacheEntry.objects.filter(id__in=overflow_ids).delete()[0]
+    return deleted
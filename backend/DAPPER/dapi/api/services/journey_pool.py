@@ -0,0 +1,141 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from ..models import PregeneratedJourney
+from .admission import generation_slot
+from .rate_limit import charge_to, generation_wait
+
+# Generic context used when generating journeys ahead of any request
+POOL_CONTEXT = "General feelings of {emotion} in everyday life"
+
+# Refills are charged to this user id, so they have a daily token budget of their own
+POOL_USER = "journey-pool"
+
+_refiller = None
+_refilling = set()
+_refill_lock = threading.Lock()
+
+def normalize_emotion(value):
+    return str(value).strip().lower()
+
+def pool_pairs():
+    """Return the configured (from, to) emotion pairs that are kept pre-generated"""
+    pairs = []
+    for pair in settings.JOURNEY_POOL_PAIRS:
+        emotion, _, target_emotion = pair.partition(":")
+        pairs.append((normalize_emotion(emotion), normalize_emotion(target_emotion)))
+    return pairs
+
+def personalize_journey(journey, emotion, target_emotion):
+    """Cheaply adapt a pooled journey to the request: emotion labels, title and date"""
+    course = journey.get("course", {})
+    course["title"] = f"From {emotion.title()} to {target_emotion.title()} Journey"
+    course["emotion_transition"] = {"from": emotion, "to": target_emotion}
+    metadata = journey.setdefault("metadata", {})
+    metadata["created_date"] = datetime.now().strftime('%Y-%m-%d')
+    metadata["target_emotions"] = [emotion, target_emotion]
+    return journey
+
+def pop_pooled_journey(emotion, target_emotion):
+    """Take one ready-made journey for this pair, or None if the pool is empty"""
+    if not settings.JOURNEY_POOL_ENABLED:
+        return None
+    pair = (normalize_emotion(emotion), normalize_emotion(target_emotion))
+    if pair not in pool_pairs():
+        return None
+
+    try:
+        while True:
+            row = (
+                PregeneratedJourney.objects.filter(from_emotion=pair[0], to_emotion=pair[1])
+                .order_by('created_at', 'id')
+                .values_list('id', 'journey')
+                .first()
+            )
+            if row is None:
+                journey = None
+                break
+            # Whoever deletes the row owns it; retry if another worker beat us
+            if PregeneratedJourney.objects.filter(id=row[0]).delete()[0]:
+                journey = row[1]
+                break
+    except DatabaseError as e:
+        print(f"Error reading journey pool: {str(e)}")
+        return None
+
+    if journey is None:
+        # Misses leave refilling to refill_journey_pool, so a run of them cannot pile up upstream calls
+        return None
+    if settings.JOURNEY_POOL_BACKGROUND_REFILL and _pool_size(*pair) < settings.JOURNEY_POOL_LOW_WATER:
+        schedule_refill(*pair)
+    return personalize_journey(journey, emotion, target_emotion)
+
+async def apop_pooled_journey(emotion, target_emotion):
+    """Async variant of pop_pooled_journey"""
+    return await sync_to_async(pop_pooled_journey)(emotion, target_emotion)
+
+def _pool_size(emotion, target_emotion):
+    try:
+        return PregeneratedJourney.objects.filter(from_emotion=emotion, to_emotion=target_emotion).count()
+    except DatabaseError as e:
+        print(f"Error reading journey pool: {str(e)}")
+        return settings.JOURNEY_POOL_DEPTH
+
+def refill_pool(emotion, target_emotion, depth=None):
+    """Generate journeys until the pair's pool holds depth entries; returns how many were added.
+
+    Refills go through the same limits as user generations: the global rate
+    limit, a daily token budget (charged to POOL_USER), a generation slot and
+    the circuit breaker. A refill that hits one stops and is retried later.
+    """
+    # Imported here because ai_service itself draws from the pool
+    from .ai_service import fetch_journey_from_openrouter
+
+    if not settings.OPENROUTER_API_KEY:
+        return 0
+    depth = settings.JOURNEY_POOL_DEPTH if depth is None else depth
+    missing = depth - _pool_size(emotion, target_emotion)
+
+    added = 0
+    for _ in range(max(missing, 0)):
+        if generation_wait(POOL_USER, None, background=True):
+            break
+        try:
+            with charge_to(POOL_USER), generation_slot():
+                journey = fetch_journey_from_openrouter(emotion, target_emotion, POOL_CONTEXT.format(emotion=emotion))
+        except Exception as e:
+            # Only keep real model output in the pool; try again on the next refill
+            print(f"Error refilling journey pool for {emotion}->{target_emotion}: {str(e)}")
+            break
+        PregeneratedJourney.objects.create(from_emotion=emotion, to_emotion=target_emotion, journey=journey)
+        added += 1
+    return added
+
+def refill_all_pools(depth=None):
+    """Top up every configured pair, returning {(from, to): added}"""
+    return {pair: refill_pool(*pair, depth=depth) for pair in pool_pairs()}
+
+def schedule_refill(emotion, target_emotion):
+    """Top up a pair's pool on a background thread unless a refill is already running"""
+    global _refiller
+    pair = (emotion, target_emotion)
+    with _refill_lock:
+        if pair in _refilling:
+            return
+        _refilling.add(pair)
+        if _refiller is None:
+            _refiller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journey-pool-refill")
+    _refiller.submit(_background_refill, pair)
+
+def _background_refill(pair):
+    try:
+        refill_pool(*pair)
+    except Exception as e:
+        print(f"Error refilling journey pool: {str(e)}")
+    finally:
+        with _refill_lock:
+            _refilling.discard(pair)
+        close_old_connections()
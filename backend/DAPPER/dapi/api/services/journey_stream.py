@@ -0,0 +1,130 @@
+import contextvars
+import json
+from asgiref.sync import sync_to_async
+
+def format_sse(event, payload):
+    """Encode one Server-Sent Event carrying a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def iter_journey_sections(journey_data):
+    """Yield the streamable sections of an already complete journey"""
+    course = journey_data.get("course", {})
+    if "initial_prompt" in course:
+        yield "initial_prompt", course["initial_prompt"]
+    for step in course.get("steps", []):
+        yield "step", step
+
+def iter_journey_events(journey_data):
+    """Stream events for an already complete journey: its sections, then the journey itself"""
+    yield from iter_journey_sections(journey_data)
+    yield "journey", journey_data
+
+async def aiter_sync(iterator):
+    """Serve a blocking iterator to an ASGI server one item at a time.
+
+    Under ASGI Django reads a sync StreamingHttpResponse body in one go, so
+    nothing would reach the client until generation finished. Each item is
+    produced on the request's sync thread instead, always in the same
+    context so context variables set inside the generator survive.
+    """
+    context = contextvars.copy_context()
+    done = object()
+    try:
+        while True:
+            item = await sync_to_async(context.run)(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(context.run)(close)
+
+class JourneyStreamParser:
+    """Incremental scanner for journey JSON arriving in arbitrary text chunks.
+
+    It tracks just enough JSON structure (strings, nesting and object keys) to
+    know the path of every container, and returns ``course.initial_prompt`` and
+    each ``course.steps[i]`` object as soon as its closing brace arrives. Any
+    text before the first ``{`` (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._root_seen = False
+        self._done = False
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+
+    def feed(self, chunk):
+        """Consume a chunk of model output, returning newly completed (event, section) pairs"""
+        self.text += chunk
+        events = []
+        text = self.text
+
+        while self._pos < len(text) and not self._done:
+            char = text[self._pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:self._pos + 1]
+            elif not self._root_seen:
+                if char == "{":
+                    self._root_seen = True
+                    self._open("object", ())
+            elif char == '"':
+                self._in_string = True
+                self._string_start = self._pos
+            elif char in "{[":
+                frame = self._stack[-1]
+                key = frame["index"] if frame["type"] == "array" else frame["key"]
+                self._open("object" if char == "{" else "array", frame["path"] + (key,))
+            elif char in "}]":
+                frame = self._stack.pop()
+                event = self._section_event(frame["path"])
+                if event and char == "}":
+                    try:
+                        events.append((event, json.loads(text[frame["start"]:self._pos + 1])))
+                    except json.JSONDecodeError:
+                        # Not valid on its own (e.g. model comments); the final parse decides
+                        pass
+                if not self._stack:
+                    self._done = True
+            elif char == ":":
+                frame = self._stack[-1]
+                if frame["type"] == "object" and self._last_string is not None:
+                    try:
+                        frame["key"] = json.loads(self._last_string)
+                    except json.JSONDecodeError:
+                        frame["key"] = None
+            elif char == ",":
+                frame = self._stack[-1]
+                if frame["type"] == "array":
+                    frame["index"] += 1
+                else:
+                    frame["key"] = None
+
+            self._pos += 1
+
+        return events
+
+    def _open(self, kind, path):
+        self._stack.append({"type": kind, "path": path, "start": self._pos, "key": None, "index": 0})
+        self._last_string = None
+
+    @staticmethod
+    def _section_event(path):
+        if path == ("course", "initial_prompt"):
+            return "initial_prompt"
+        if len(path) == 3 and path[:2] == ("course", "steps") and isinstance(path[2], int):
+            return "step"
+        return None
@@ -0,0 +1,273 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+import weakref
+from collections import deque
+import httpx
+from django.conf import settings
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+# Failures worth retrying: network errors and timeouts, 429s and 5xx responses
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+class RetryBudget:
+    """Token bucket that caps retries to a fraction of recent requests.
+
+    Every request deposits ``ratio`` tokens and every retry spends one, so
+    during an outage retries stop instead of multiplying upstream load.
+    """
+
+    def __init__(self, ratio, max_tokens):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class OpenRouterClientManager:
+    """Process-wide OpenRouter clients sharing a tuned keep-alive connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()  # One per event loop
+        self.retry_budget = RetryBudget(settings.OPENROUTER_RETRY_BUDGET_RATIO, settings.OPENROUTER_RETRY_BUDGET_MAX)
+        self._latencies = deque(maxlen=1000)
+        self.requests = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.retries_denied = 0
+
+    def _timeout(self):
+        return httpx.Timeout(settings.OPENROUTER_READ_TIMEOUT, connect=settings.OPENROUTER_CONNECT_TIMEOUT)
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=settings.OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENROUTER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENROUTER_KEEPALIVE_EXPIRY
+        )
+
+    def _client_kwargs(self):
+        return {
+            "base_url": settings.OPENROUTER_BASE_URL,
+            "api_key": settings.OPENROUTER_API_KEY,
+            "default_headers": {
+                "HTTP-Referer": settings.OPENROUTER_REFERRER  # Optional
+            },
+            "timeout": self._timeout(),
+            "max_retries": 0,  # Retries are handled here, under the retry budget
+        }
+
+    def get_client(self):
+        """Return the shared sync client, creating it on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = OpenAI(
+                        http_client=DefaultHttpxClient(limits=self._limits(), timeout=self._timeout()),
+                        **self._client_kwargs()
+                    )
+        return self._client
+
+    def get_async_client(self):
+        """Return the async client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                http_client=DefaultAsyncHttpxClient(limits=self._limits(), timeout=self._timeout()),
+                **self._client_kwargs()
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff"""
+        cap = min(settings.OPENROUTER_RETRY_MAX_DELAY, settings.OPENROUTER_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return random.uniform(0, cap)
+
+    def _should_retry(self, attempt):
+        if attempt >= settings.OPENROUTER_MAX_RETRIES:
+            return False
+        if not self.retry_budget.try_spend():
+            with self._lock:
+                self.retries_denied += 1
+            return False
+        with self._lock:
+            self.retries += 1
+        return True
+
+    def _record(self, started, ok):
+        with self._lock:
+            self._latencies.append(time.monotonic() - started)
+            if ok:
+                self.successes += 1
+            else:
+                self.failures += 1
+
+    def create_completion(self, **kwargs):
+        """Create a chat completion with timeouts and budgeted, jittered retries.
+
+        Streamed completions return as soon as the response headers arrive,
+        so only failures before that point are retried and timed here.
+        """
+        client = self.get_client()
+        with self._lock:
+            self.requests += 1
+        self.retry_budget.record_request()
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = client.chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS:
+                self._record(started, ok=False)
+                if not self._should_retry(attempt):
+                    raise
+                attempt += 1
+                time.sleep(self._backoff(attempt))
+                continue
+            except Exception:
+                self._record(started, ok=False)
+                raise
+            self._record(started, ok=True)
+            return response
+
+    async def acreate_completion(self, **kwargs):
+        """Async variant of create_completion"""
+        client = self.get_async_client()
+        with self._lock:
+            self.requests += 1
+        self.retry_budget.record_request()
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = await client.chat.completions.create(**kwargs)
+            except RETRYABLE_ERRORS:
+                self._record(started, ok=False)
+                if not self._should_retry(attempt):
+                    raise
+                attempt += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            except Exception:
+                self._record(started, ok=False)
+                raise
+            self._record(started, ok=True)
+            return response
+
+    def stats(self):
+        """Snapshot of request counters, latency percentiles and pool state"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "requests": self.requests,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "retries_denied": self.retries_denied,
+                "retry_budget_tokens": round(self.retry_budget.tokens, 2),
+            }
+
+        # Calls return once response headers arrive, so for streams this is time to headers;
+        # full completion latency is tracked by the model router
+        stats["time_to_headers_ms"] = latency_summary(latencies)
+        stats["pool"] = {
+            "max_connections": settings.OPENROUTER_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.OPENROUTER_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": settings.OPENROUTER_KEEPALIVE_EXPIRY,
+            "connect_timeout": settings.OPENROUTER_CONNECT_TIMEOUT,
+            "read_timeout": settings.OPENROUTER_READ_TIMEOUT,
+            "async_clients": len(self._async_clients),
+        }
+        stats["pool"].update(self._connection_counts())
+        return stats
+
+    def _connection_counts(self):
+        """Open/idle connections of the sync pool; httpx has no public API for this"""
+        if self._client is None:
+            return {"open_connections": 0, "idle_connections": 0}
+        try:
+            connections = list(self._client._client._transport._pool.connections)
+        except AttributeError:
+            return {}
+        return {
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+        }
+
+def latency_summary(latencies):
+    """Sample count and p50/p95/p99/max in milliseconds of sorted latencies in seconds"""
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+    return {
+        "samples": len(latencies),
+        "p50": percentile(0.50) if latencies else None,
+        "p95": percentile(0.95) if latencies else None,
+        "p99": percentile(0.99) if latencies else None,
+        "max": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_client_manager():
+    """Return the process-wide OpenRouter client manager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = OpenRouterClientManager()
+    return _manager
+
+def create_completion(**kwargs):
+    """Create a chat completion through the shared OpenRouter client"""
+    return get_client_manager().create_completion(**kwargs)
+
+async def acreate_completion(**kwargs):
+    """Async variant of create_completion"""
+    return await get_client_manager().acreate_completion(**kwargs)
+
+def cut_off_stream(stream):
+    """Make a streamed completion still being read in another thread fail at once.
+
+    Closing the response does not wake a thread blocked reading it, so the
+    socket is shut down instead; the connection is discarded, not pooled.
+    """
+    response = stream.response
+    if response.is_closed:
+        return
+    network_stream = response.extensions.get('network_stream')
+    sock = network_stream.get_extra_info('socket') if network_stream is not None else None
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # Already closed
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.utils import timezone
+from ..models import EmotionalCourse, UserProgress
+from .analytics_service import RollupChanges, outcome_of
+
+# A final mood rating at or above this earns the medal and completes the course
+MEDAL_THRESHOLD = 5
+
+def apply_progress_report(progress, current_step=None, mood_rating=None):
+    """Fold one progress report into a loaded UserProgress. Returns True if it earned the medal.
+
+    A mood rating taken at step 0 is the initial rating, otherwise it is the
+    final one; a report without a step is judged by the stored step.
+    """
+    if current_step is not None:
+        progress.current_step = current_step
+    if mood_rating is None:
+        return False
+    if progress.current_step == 0:
+        progress.initial_mood_rating = mood_rating
+        return False
+    progress.final_mood_rating = mood_rating
+    if mood_rating >= MEDAL_THRESHOLD:
+        progress.earned_medal = True
+        return True
+    return False
+
+def apply_progress_batch(events):
+    """Apply ordered (course_id, current_step, mood_rating) reports in one transaction.
+
+    Rows are locked and read once, folded in memory, then written with a
+    single bulk update. Returns (updated progress rows, course ids without progress).
+    """
+    course_ids = list(dict.fromkeys(course_id for course_id, _, _ in events))
+    now = timezone.now()
+    with transaction.atomic():
+        progress_by_course = {
+            progress.course_id: progress
+            for progress in UserProgress.objects.select_for_update().select_related('course').filter(course_id__in=course_ids)
+        }
+        before = {course_id: outcome_of(progress) for course_id, progress in progress_by_course.items()}
+
+        touched, completed = {}, set()
+        for course_id, current_step, mood_rating in events:
+            progress = progress_by_course.get(course_id)
+            if progress is None:
+                continue
+            if apply_progress_report(progress, current_step, mood_rating):
+                completed.add(course_id)
+            touched[course_id] = progress
+
+        for progress in touched.values():
+            progress.last_updated = now  # bulk_update skips auto_now
+        UserProgress.objects.bulk_update(
+            list(touched.values()),
+            ['current_step', 'initial_mood_rating', 'final_mood_rating', 'earned_medal', 'last_updated']
+        )
+        if completed:
+            EmotionalCourse.objects.filter(id__in=completed, completed=False).update(completed=True, updated_at=now)
+
+        changes = RollupChanges()
+        for course_id, progress in touched.items():
+            changes.add_change(progress.course.from_emotion, progress.course.to_emotion,
+                               before[course_id], outcome_of(progress))
+        for course_id, _, mood_rating in events:
+            if mood_rating is not None and course_id in touched:
+                changes.add_mood(touched[course_id].course.user_id, mood_rating, now)
+        changes.apply()
+
+    missing = [course_id for course_id in course_ids if course_id not in progress_by_course]
+    return [progress_by_course[course_id] for course_id in course_ids if course_id in touched], missing
+
+def update_course_progress(course_id, current_step=None, mood_rating=None):
+    """Apply a progress report atomically and return the new state, or None if there is no progress row.
+
+    The row is locked while the report is folded in, so concurrent reports
+    cannot interleave and the mood rollups see exactly the old and new values.
+    """
+    with transaction.atomic():
+        progress = UserProgress.objects.select_for_update().select_related('course').filter(course_id=course_id).first()
+        if progress is None:
+            return None
+        if current_step is None and mood_rating is None:
+            return progress
+
+        before = outcome_of(progress)
+        earned = apply_progress_report(progress, current_step, mood_rating)
+        progress.save(update_fields=['current_step', 'initial_mood_rating', 'final_mood_rating', 'earned_medal', 'last_updated'])
+
+        if earned:
+            EmotionalCourse.objects.filter(id=course_id, completed=False).update(completed=True, updated_at=progress.last_updated)
+
+        changes = RollupChanges()
+        changes.add_change(progress.course.from_emotion, progress.course.to_emotion, before, outcome_of(progress))
+        if mood_rating is not None:
+            changes.add_mood(progress.course.user_id, mood_rating, progress.last_updated)
+        changes.apply()
+        return progress
@@ -0,0 +1,128 @@
+import math
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models import RateLimitBucket, TokenUsage
+
+# User whose OpenRouter usage is being generated, set around a generation
+_charged_user = ContextVar('charged_user', default=None)
+
+def take_tokens(limits):
+    """Take one token from each (key, burst, tokens per second) bucket, or from none.
+
+    Buckets refill lazily from their last update, in one transaction, so
+    every worker shares them. Returns 0 when the tokens were taken, else
+    the seconds until all of the buckets will have one.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        buckets = {
+            bucket.key: bucket
+            for bucket in RateLimitBucket.objects.select_for_update().filter(key__in=[key for key, _, _ in limits])
+        }
+
+        wait, refilled = 0.0, []
+        for key, burst, per_second in limits:
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket, tokens = RateLimitBucket(key=key), float(burst)
+            else:
+                elapsed = max(0.0, (now - bucket.updated_at).total_seconds())
+                tokens = min(float(burst), bucket.tokens + elapsed * per_second)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / per_second)
+            refilled.append((bucket, tokens))
+        if wait:
+            return wait
+
+        new, existing = [], []
+        for bucket, tokens in refilled:
+            bucket.tokens, bucket.updated_at = tokens - 1, now
+            (existing if bucket.pk else new).append(bucket)
+        RateLimitBucket.objects.bulk_update(existing, ['tokens', 'updated_at'])
+        # A bucket created concurrently by another worker keeps its own count
+        RateLimitBucket.objects.bulk_create(new, ignore_conflicts=True)
+    return 0.0
+
+def generation_limits(user_id, client, background=False):
+    """The buckets a generation request draws from; a burst of 0 disables one.
+
+    Background generations only draw from the global bucket.
+    """
+    limits = [] if background else [
+        (f"generate:user:{user_id[:100]}", settings.GENERATION_USER_BURST, settings.GENERATION_USER_PER_HOUR / 3600),
+        (f"generate:client:{client}", settings.GENERATION_CLIENT_BURST, settings.GENERATION_CLIENT_PER_HOUR / 3600),
+    ]
+    limits.append(("generate:global", settings.GENERATION_GLOBAL_BURST, settings.GENERATION_GLOBAL_PER_MINUTE / 60))
+    return [(key, burst, rate) for key, burst, rate in limits if burst > 0 and rate > 0]
+
+def token_budget_wait(user_id):
+    """Seconds until the user's daily token budget resets, or 0 if it is not spent"""
+    budget = settings.GENERATION_USER_DAILY_TOKENS
+    if not budget or not user_id:
+        return 0.0
+    today = timezone.localdate()
+    usage = TokenUsage.objects.filter(user_id=user_id, day=today).first()
+    if usage is None or usage.total_tokens < budget:
+        return 0.0
+    midnight = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+    return max(1.0, (midnight - timezone.now()).total_seconds())
+
+def generation_wait(user_id, client, background=False):
+    """Seconds a generation request must wait, or 0 to let it through (taking its tokens).
+
+    Background work no client is waiting on, such as pool refills, passes
+    background=True: it still counts against user_id's daily token budget
+    and the global bucket.
+    """
+    if not settings.GENERATION_RATE_LIMIT_ENABLED:
+        return 0.0
+    # Check the budget first so a refused request does not also spend rate tokens
+    wait = token_budget_wait(user_id)
+    if wait:
+        return wait
+    return take_tokens(generation_limits(user_id or 'anonymous', client, background))
+
+def retry_after(wait):
+    """Value of a Retry-After header for a wait in seconds"""
+    return str(max(1, math.ceil(wait)))
+
+@contextmanager
+def charge_to(user_id):
+    """Attribute the OpenRouter usage of generations inside the block to user_id"""
+    token = _charged_user.set(user_id)
+    try:
+        yield
+    finally:
+        _charged_user.reset(token)
+
+def charge_usage(response):
+    """Add a completion's reported usage to today's total for the charged user"""
+    user_id = _charged_user.get()
+    usage = getattr(response, 'usage', None)
+    if not user_id or usage is None:
+        return
+
+    key = {'user_id': user_id, 'day': timezone.localdate()}
+    counts = {
+        'requests': 1,
+        'prompt_tokens': usage.prompt_tokens or 0,
+        'completion_tokens': usage.completion_tokens or 0,
+    }
+    increments = {field: F(field) + value for field, value in counts.items()}
+    try:
+        if TokenUsage.objects.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                TokenUsage.objects.create(**key, **counts)
+        except IntegrityError:
+            # Another worker recorded the user's first usage of the day first
+            TokenUsage.objects.filter(**key).update(**increments)
+    except DatabaseError as e:
+        # Never throw away a finished journey over bookkeeping
+        print(f"Error recording token usage: {str(e)}")
@@ -0,0 +1,180 @@
+import asyncio
+import copy
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+from ..models import GenerationLock
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+# Outcomes of trying to take the cross-worker lock
+_LEADER = "leader"
+_WAITING = "waiting"
+_DONE = "done"
+
+class _Flight:
+    """An in-process generation that other threads can wait on"""
+
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.error = None
+
+_flights = {}
+_flights_lock = threading.Lock()
+_async_flights = {}
+
+def run_single_flight(key, fn, fresh=False):
+    """Run fn once for all concurrent callers sharing key, across threads and workers.
+
+    The first caller in a process leads; other threads wait for its result.
+    The leader also takes a GenerationLock row so leaders in other worker
+    processes wait for the same result instead of calling upstream again.
+    Every caller gets its own copy of the result. With fresh=True a result
+    another worker finished before this call began is not reused.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return fn()
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        flight.finished.wait()
+        if flight.error is not None:
+            raise flight.error
+        return copy.deepcopy(flight.result)
+
+    try:
+        flight.result = _run_across_workers(key, fn, fresh)
+        return copy.deepcopy(flight.result)
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.finished.set()
+
+async def arun_single_flight(key, afn, fresh=False):
+    """Async variant of run_single_flight for coroutines on the same event loop.
+
+    The shared generation runs as its own task, so a disconnecting client
+    does not cancel the call other requests are waiting on.
+    """
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await afn()
+
+    flight_key = (id(asyncio.get_running_loop()), key)
+    task = _async_flights.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(_arun_across_workers(key, afn, fresh))
+        _async_flights[flight_key] = task
+        task.add_done_callback(lambda _: _async_flights.pop(flight_key, None))
+
+    return copy.deepcopy(await asyncio.shield(task))
+
+def _try_acquire(key, fresh=False):
+    """Take the lock row for key, or report whether its leader has finished.
+
+    With fresh=True a finished result is dropped rather than returned, and
+    the lock is taken in its place.
+    """
+    now = timezone.now()
+    try:
+        # Clear locks left behind by crashed leaders and expired results
+        GenerationLock.objects.filter(key=key, expires_at__lte=now).delete()
+        try:
+            with transaction.atomic():
+                GenerationLock.objects.create(
+                    key=key,
+                    owner=_OWNER,
+                    expires_at=now + timedelta(seconds=settings.SINGLE_FLIGHT_LEASE_SECONDS)
+                )
+            return _LEADER, None
+        except IntegrityError:
+            row = GenerationLock.objects.filter(key=key).values('completed', 'result').first()
+            if row is None:
+                return _WAITING, None  # Released in between, retry on the next poll
+            if row['completed']:
+                if fresh:
+                    GenerationLock.objects.filter(key=key, completed=True).delete()
+                    return _try_acquire(key)
+                return _DONE, row['result']
+            return _WAITING, None
+    except DatabaseError as e:
+        # Never block generation on the lock table itself
+        print(f"Error taking generation lock: {str(e)}")
+        return _LEADER, None
+
+def _publish(key, result):
+    """Share the leader's result with waiting workers for a short while"""
+    try:
+        GenerationLock.objects.filter(key=key, owner=_OWNER).update(
+            completed=True,
+            result=result,
+            expires_at=timezone.now() + timedelta(seconds=settings.SINGLE_FLIGHT_RESULT_SECONDS)
+        )
+    except DatabaseError as e:
+        print(f"Error publishing generation result: {str(e)}")
+
+def _release(key):
+    """Drop the lock after a failure so waiting workers generate themselves"""
+    try:
+        GenerationLock.objects.filter(key=key, owner=_OWNER, completed=False).delete()
+    except DatabaseError as e:
+        print(f"Error releasing generation lock: {str(e)}")
+
+def _run_across_workers(key, fn, fresh=False):
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_SECONDS
+    while True:
+        state, result = _try_acquire(key, fresh)
+        if state == _DONE:
+            return result
+        if state == _LEADER:
+            break
+        # A generation already under way finishes after this call began, so its result is fresh
+        fresh = False
+        if time.monotonic() >= deadline:
+            # The other worker is taking too long, generate independently
+            return fn()
+        time.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+    try:
+        result = fn()
+    except BaseException:
+        _release(key)
+        raise
+    _publish(key, result)
+    return result
+
+async def _arun_across_workers(key, afn, fresh=False):
+    deadline = time.monotonic() + settings.SINGLE_FLIGHT_WAIT_SECONDS
+    while True:
+        state, result = await sync_to_async(_try_acquire)(key, fresh)
+        if state == _DONE:
+            return result
+        if state == _LEADER:
+            break
+        fresh = False
+        if time.monotonic() >= deadline:
+            return await afn()
+        await asyncio.sleep(settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+    try:
+        result = await afn()
+    except BaseException:
+        await sync_to_async(_release)(key)
+        raise
+    await sync_to_async(_publish)(key, result)
+    return result
@@ -0,0 +1,222 @@
+import json
+import re
+import threading
+from datetime import datetime
+from operator import itemgetter
+from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
+
+TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "journey_templates"
+
+_PLACEHOLDER = re.compile(r"\$\{(\w+)\}")
+_PLACEHOLDER_NAMES = {
+    "emotion", "target_emotion", "emotion_title", "target_emotion_title",
+    "medal_color", "medal_color_title", "created_date",
+}
+
+class FrozenDict(dict):
+    """Read-only dict for template data shared between every rendered journey"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Journey template data is shared and read-only; deepcopy it to modify")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (dict, (thaw(self),))
+
+class FrozenList(list):
+    """Read-only list counterpart of FrozenDict"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Journey template data is shared and read-only; deepcopy it to modify")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (list, (thaw(self),))
+
+def thaw(value):
+    """Return a plain, mutable deep copy of (possibly frozen) template data"""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [thaw(item) for item in value]
+    return value
+
+def _compile(node):
+    """Compile template JSON into (value, dynamic).
+
+    Subtrees without placeholders become frozen values that are shared as-is.
+    Anything containing a placeholder becomes a render function that rebuilds
+    only that path, so each journey gets its own copy of what it personalizes.
+    """
+    if isinstance(node, str):
+        parts = _PLACEHOLDER.split(node)
+        if len(parts) == 1:
+            return node, False
+        unknown = set(parts[1::2]) - _PLACEHOLDER_NAMES
+        if unknown:
+            raise ImproperlyConfigured(f"Unknown journey template placeholders: {', '.join(sorted(unknown))}")
+        if parts[0] == parts[2] == "" and len(parts) == 3:
+            return itemgetter(parts[1]), True
+        # Literal text is brace-escaped so str.format_map only fills the placeholders
+        pattern = "".join(
+            "{" + part + "}" if index % 2 else part.replace("{", "{{").replace("}", "}}")
+            for index, part in enumerate(parts)
+        )
+        return pattern.format_map, True
+
+    if isinstance(node, dict):
+        compiled = {key: _compile(value) for key, value in node.items()}
+        dynamic_items = tuple((key, value) for key, (value, dynamic) in compiled.items() if dynamic)
+        if not dynamic_items:
+            return FrozenDict((key, value) for key, (value, _) in compiled.items()), False
+        # Copying a prefilled dict keeps the key order; only dynamic keys are replaced
+        skeleton = {key: None if dynamic else value for key, (value, dynamic) in compiled.items()}
+
+        def render_dict(values):
+            rendered = skeleton.copy()
+            for key, render in dynamic_items:
+                rendered[key] = render(values)
+            return rendered
+        return render_dict, True
+
+    if isinstance(node, list):
+        compiled = [_compile(value) for value in node]
+        dynamic_items = tuple((index, value) for index, (value, dynamic) in enumerate(compiled) if dynamic)
+        if not dynamic_items:
+            return FrozenList(value for value, _ in compiled), False
+        skeleton = [None if dynamic else value for value, dynamic in compiled]
+
+        def render_list(values):
+            rendered = skeleton.copy()
+            for index, render in dynamic_items:
+                rendered[index] = render(values)
+            return rendered
+        return render_list, True
+
+    return node, False
+
+class CompiledTemplate:
+    """A template document compiled once into shared frozen data plus render functions"""
+
+    def __init__(self, document):
+        self._node, self._dynamic = _compile(document)
+
+    def render(self, values):
+        """Return the document with placeholders filled in"""
+        return self._node(values) if self._dynamic else self._node
+
+def _require(condition, source, message):
+    if not condition:
+        raise ImproperlyConfigured(f"Invalid journey template {source}: {message}")
+
+def validate_steps(steps, source):
+    """Check a template's steps have the structure the app renders"""
+    _require(isinstance(steps, list) and steps, source, "steps must be a non-empty list")
+    for index, step in enumerate(steps, start=1):
+        where = f"step {index}"
+        _require(step.get("step_number") == index, source, f"{where} must have step_number {index}")
+
+        quiz = step.get("quiz", {})
+        option_ids = [option.get("id") for option in quiz.get("options", [])]
+        _require(quiz.get("question"), source, f"{where} quiz needs a question")
+        _require(len(option_ids) == 4, source, f"{where} quiz needs 4 options")
+        _require(quiz.get("correct_answer") in option_ids, source, f"{where} correct_answer is not an option id")
+
+        education = step.get("education", {})
+        for key in ("correct_text", "explanation"):
+            _require(education.get(key), source, f"{where} education needs {key}")
+
+        activity = step.get("guided_activity", {})
+        _require(activity.get("title"), source, f"{where} guided_activity needs a title")
+        _require(activity.get("instructions", {}).get("text"), source, f"{where} guided_activity needs instructions")
+        _require(activity.get("steps"), source, f"{where} guided_activity needs steps")
+        _require(activity.get("conclusion", {}).get("text"), source, f"{where} guided_activity needs a conclusion")
+
+class TemplateRegistry:
+    """Fallback journeys loaded once from journey_templates/ and keyed by emotion pair"""
+
+    def __init__(self, template_dir=TEMPLATE_DIR):
+        self.template_dir = Path(template_dir)
+        self.medals = {}
+        self.default_medal = "silver"
+        self._journeys = {}  # (from, to) or None -> CompiledTemplate
+        self._steps = {}
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read, validate and compile every template file"""
+        with self._lock:
+            base_file = self.template_dir / "base.json"
+            base = json.loads(base_file.read_text(encoding="utf-8"))
+            _require("steps" in base.get("journey", {}).get("course", {}), base_file.name, "course needs a steps key")
+
+            journeys, steps_by_pair = {}, {}
+            for steps_file in sorted((self.template_dir / "steps").glob("*.json")):
+                data = json.loads(steps_file.read_text(encoding="utf-8"))
+                validate_steps(data.get("steps"), steps_file.name)
+                pair = None if data.get("from") is None else (data["from"], data["to"])
+                _require(pair not in steps_by_pair, steps_file.name, "duplicate emotion pair")
+
+                document = json.loads(json.dumps(base["journey"]))
+                document["course"]["steps"] = data["steps"]
+                journeys[pair] = CompiledTemplate(document)
+                steps_by_pair[pair] = CompiledTemplate(data["steps"])
+
+            _require(None in journeys, "steps/", "a default template (from: null) is required")
+
+            self.medals = dict(base.get("medals", {}))
+            self.default_medal = base.get("default_medal", "silver")
+            self._journeys = journeys
+            self._steps = steps_by_pair
+            self.loaded = True
+
+    def ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def pairs(self):
+        """Emotion pairs with dedicated templates"""
+        self.ensure_loaded()
+        return [pair for pair in self._journeys if pair is not None]
+
+    def placeholder_values(self, emotion, target_emotion):
+        medal_color = self.medals.get(emotion, self.default_medal)
+        return {
+            "emotion": emotion,
+            "target_emotion": target_emotion,
+            "emotion_title": emotion.title(),
+            "target_emotion_title": target_emotion.title(),
+            "medal_color": medal_color,
+            "medal_color_title": medal_color.title(),
+            "created_date": datetime.now().strftime('%Y-%m-%d'),
+        }
+
+    def render_journey(self, emotion, target_emotion):
+        """Return the journey for the pair, using the default steps if unknown.
+
+        Personalized fields are freshly built; everything else is shared
+        read-only template data.
+        """
+        self.ensure_loaded()
+        pair = (emotion, target_emotion) if (emotion, target_emotion) in self._journeys else None
+        return self._journeys[pair].render(self.placeholder_values(emotion, target_emotion))
+
+    def render_steps(self, emotion, target_emotion):
+        """Return the steps for the pair"""
+        self.ensure_loaded()
+        pair = (emotion, target_emotion) if (emotion, target_emotion) in self._steps else None
+        return self._steps[pair].render(self.placeholder_values(emotion, target_emotion))
+
+registry = TemplateRegistry()
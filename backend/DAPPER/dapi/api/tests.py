@@ -1,3 +1,1089 @@
-from django.test import TestCase
+import asyncio
+import copy
+import json
+import tempfile
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from unittest import mock
+import httpx
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from openai import APIConnectionError, BadRequestError
+from .compression import MAGIC, compress_json, decompress_json, dumps
+from .fields import CompressedJSON
+from .metrics import Counter, Histogram
+from .models import (
+    CircuitBreakerState,
+    EmotionalCourse,
+    GenerationJob,
+    GenerationLock,
+    JourneyBlob,
+    JourneyCacheEntry,
+    MoodHistogramBucket,
+    MoodOutcomeRollup,
+    PregeneratedJourney,
+    RateLimitBucket,
+    TokenUsage,
+    journey_digest,
+)
+from .services.admission import AdmissionGate, GenerationOverloaded
+from .services.ai_service import ModelRouter, _charge_estimate, get_journey_template
+from .services.analytics_service import RollupChanges, rebuild_mood_rollups
+from .services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from .services.course_service import create_course
+from .services.job_queue import claim_job, claim_next_job, requeue_stale_jobs, run_job
+from .services.journey_cache import (
+    LocalJourneyCache,
+    get_cached_journey,
+    get_local_cache,
+    make_cache_key,
+    prune_journey_cache,
+    store_journey,
+)
+from .services.journey_pool import POOL_USER, pop_pooled_journey, refill_pool
+from .services.journey_stream import JourneyStreamParser
+from .services.openrouter_client import OpenRouterClientManager, RetryBudget
+from .services.progress_service import apply_progress_batch, apply_progress_report, update_course_progress
+from .services.rate_limit import charge_to, take_tokens
+from .services.single_flight import arun_single_flight, run_single_flight
+from .services.sync_service import changes_since, decode_cursor, encode_cursor
+from .services.template_registry import TEMPLATE_DIR, CompiledTemplate, TemplateRegistry
 
-# Create your tests here.
+class JourneyStreamParserTests(TestCase):
+    def setUp(self):
+        self.journey = get_journey_template('sad', 'happy')
+        self.text = "Here you go:\n```json\n" + json.dumps(self.journey, indent=2) + "\n```"
+
+    def feed_in_chunks(self, size):
+        parser = JourneyStreamParser()
+        events = []
+        for start in range(0, len(self.text), size):
+            events.extend(parser.feed(self.text[start:start + size]))
+        return parser, events
+
+    def test_sections_survive_any_chunk_boundary(self):
+        expected = [("initial_prompt", self.journey["course"]["initial_prompt"])]
+        expected += [("step", step) for step in self.journey["course"]["steps"]]
+        for size in (1, 2, 3, 7, 64, len(self.text)):
+            parser, events = self.feed_in_chunks(size)
+            self.assertEqual(events, expected, f"chunk size {size}")
+            self.assertEqual(parser.text, self.text)
+
+    def test_escaped_braces_in_strings_are_not_structure(self):
+        journey = {"course": {"steps": [{"title": "a \"}\" b {", "content": "x\\\\"}]}}
+        parser = JourneyStreamParser()
+        events = []
+        for char in json.dumps(journey):
+            events.extend(parser.feed(char))
+        self.assertEqual(events, [("step", journey["course"]["steps"][0])])
+
+class ProgressRollupTests(TestCase):
+    def setUp(self):
+        journey = get_journey_template('sad', 'happy')
+        self.courses = [
+            create_course('user-a', 'sad', 'happy', 'exam', journey),
+            create_course('user-a', 'Sad ', 'happy', 'work', journey),
+            create_course('user-b', 'angry', 'calm', 'traffic', journey),
+        ]
+
+    def rollup_snapshot(self):
+        outcomes = {}
+        for row in MoodOutcomeRollup.objects.values():
+            for field in ('id', 'updated_at'):
+                del row[field]
+            outcomes[row.pop('from_emotion'), row.pop('to_emotion')] = row
+        buckets = set(
+            MoodHistogramBucket.objects.filter(count__gt=0)
+            .values_list('from_emotion', 'to_emotion', 'kind', 'rating', 'count')
+        )
+        return outcomes, buckets
+
+    def test_apply_progress_report(self):
+        progress = self.courses[0].userprogress_set.get()
+        self.assertFalse(apply_progress_report(progress, current_step=0, mood_rating=3))
+        self.assertEqual(progress.initial_mood_rating, 3)
+        self.assertFalse(apply_progress_report(progress, current_step=2, mood_rating=4))
+        self.assertEqual((progress.final_mood_rating, progress.earned_medal), (4, False))
+        # A report without a step is judged by the stored one
+        self.assertTrue(apply_progress_report(progress, mood_rating=8))
+        self.assertEqual((progress.current_step, progress.final_mood_rating, progress.earned_medal), (2, 8, True))
+
+    def test_incremental_rollups_match_a_rebuild(self):
+        first, second, third = (course.id for course in self.courses)
+        update_course_progress(first, current_step=0, mood_rating=2)
+        update_course_progress(first, current_step=3, mood_rating=4)
+        update_course_progress(first, current_step=5, mood_rating=7)  # Final rating replaced, medal earned
+        apply_progress_batch([
+            (second, 0, 5),
+            (second, 1, 3),
+            (third, 0, 1),
+            (third, 4, 6),
+            (third, 4, 2),
+        ])
+
+        incremental = self.rollup_snapshot()
+        rebuild_mood_rollups()
+        self.assertEqual(incremental, self.rollup_snapshot())
+
+        outcomes, _ = incremental
+        self.assertEqual(outcomes[('sad', 'happy')]['courses'], 2)
+        self.assertEqual(outcomes[('sad', 'happy')]['medals'], 1)
+
+class SyncTests(TestCase):
+    def test_cursor_round_trip(self):
+        moment = timezone.now()
+        positions = {'courses': (moment, 4), 'progress': (moment - timedelta(seconds=1), 9)}
+        self.assertEqual(decode_cursor(encode_cursor(positions)), positions)
+
+    def test_invalid_cursors_are_rejected(self):
+        naive = encode_cursor({'courses': (timezone.now().replace(tzinfo=None), 1), 'progress': (timezone.now(), 1)})
+        for cursor in ('', 'not base64!', encode_cursor({'courses': (timezone.now(), 1)}), naive):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    @override_settings(SYNC_MAX_ROWS=2, SYNC_CURSOR_LAG_SECONDS=0)
+    def test_paging_returns_every_row_once(self):
+        journey = get_journey_template('sad', 'happy')
+        created = [create_course('syncer', 'sad', 'happy', f'context {i}', journey).id for i in range(5)]
+        create_course('someone-else', 'sad', 'happy', 'other', journey)
+
+        seen_courses, seen_progress, positions, pages = [], [], None, 0
+        while True:
+            courses, progress, cursor, has_more = changes_since('syncer', positions)
+            seen_courses += [course.id for course in courses]
+            seen_progress += [row.course_id for row in progress]
+            positions = decode_cursor(cursor)
+            pages += 1
+            if not has_more:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen_courses), created)
+        self.assertEqual(sorted(seen_progress), created)
+
+        # Caught up: nothing new, and a change shows up on the next sync
+        update_course_progress(created[0], current_step=1)
+        _, progress, _, _ = changes_since('syncer', positions)
+        self.assertEqual([row.course_id for row in progress], [created[0]])
+
+@override_settings(
+    CIRCUIT_BREAKER_ENABLED=True,
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD=3,
+    CIRCUIT_BREAKER_OPEN_SECONDS=30,
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES=2,
+    CIRCUIT_BREAKER_SYNC_SECONDS=0,
+)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('test')
+
+    def fail(self, times=1):
+        for _ in range(times):
+            probe = self.breaker.before_call()
+            self.breaker.record(False, probe)
+
+    def state(self):
+        return CircuitBreakerState.objects.get(name='test').state
+
+    def end_open_period(self):
+        CircuitBreakerState.objects.filter(name='test').update(opened_at=timezone.now() - timedelta(seconds=31))
+        self.breaker.state = HALF_OPEN  # Make this worker consult the database again
+
+    def test_opens_after_consecutive_failures(self):
+        self.fail(2)
+        self.breaker.record(True)  # A success resets the count
+        self.fail(2)
+        self.assertEqual(self.state(), CLOSED)
+        self.fail()
+        self.assertEqual(self.state(), OPEN)
+        with self.assertRaises(CircuitOpen) as refused:
+            self.breaker.before_call()
+        self.assertGreater(refused.exception.retry_after, 0)
+
+    def test_half_open_probes_close_it(self):
+        self.fail(3)
+        self.end_open_period()
+        self.assertTrue(self.breaker.before_call())
+        self.assertEqual(self.state(), HALF_OPEN)
+        self.assertTrue(self.breaker.before_call())
+        # Both probe slots are taken
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+        self.breaker.record(True, probe=True)
+        self.assertEqual(self.state(), HALF_OPEN)
+        self.breaker.record(True, probe=True)
+        self.assertEqual(self.state(), CLOSED)
+        self.assertFalse(self.breaker.before_call())
+
+    def test_failed_probe_reopens_it(self):
+        self.fail(3)
+        self.end_open_period()
+        probe = self.breaker.before_call()
+        self.breaker.record(False, probe)
+        self.assertEqual(self.state(), OPEN)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+    def test_other_workers_see_the_state(self):
+        self.fail(3)
+        with self.assertRaises(CircuitOpen):
+            CircuitBreaker('test').before_call()
+
+class AdmissionGateTests(TestCase):
+    def test_queue_full(self):
+        gate = AdmissionGate(limit=1, max_queue=0, max_wait=1, retry_after=7)
+        gate.acquire()
+        with self.assertRaises(GenerationOverloaded) as overloaded:
+            gate.acquire()
+        self.assertEqual((overloaded.exception.reason, overloaded.exception.retry_after), ('queue_full', 7))
+        gate.release()
+        with gate.admit():
+            self.assertEqual(gate.stats()['active'], 1)
+        self.assertEqual(gate.stats()['active'], 0)
+
+    def test_queue_timeout(self):
+        gate = AdmissionGate(limit=1, max_queue=1, max_wait=0.05, retry_after=7)
+        gate.acquire()
+        with self.assertRaises(GenerationOverloaded) as overloaded:
+            gate.acquire()
+        self.assertEqual(overloaded.exception.reason, 'queue_timeout')
+        self.assertEqual(gate.stats()['waiting'], 0)
+
+    def test_queued_request_gets_the_freed_slot(self):
+        gate = AdmissionGate(limit=1, max_queue=1, max_wait=5, retry_after=7)
+        gate.acquire()
+        admitted = threading.Event()
+
+        def wait_for_slot():
+            gate.acquire()
+            admitted.set()
+
+        waiter = threading.Thread(target=wait_for_slot)
+        waiter.start()
+        self.assertFalse(admitted.wait(0.05))
+        gate.release()
+        waiter.join(5)
+        self.assertTrue(admitted.is_set())
+        self.assertEqual(gate.stats()['active'], 1)
+
+class TakeTokensTests(TestCase):
+    def test_burst_then_refill(self):
+        limits = [('test:user', 2, 1.0)]  # Burst of 2, one token a second
+        self.assertEqual(take_tokens(limits), 0)
+        self.assertEqual(take_tokens(limits), 0)
+        wait = take_tokens(limits)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 1)
+
+        # 1.5 seconds later there is one token again, but never more than the burst
+        RateLimitBucket.objects.filter(key='test:user').update(updated_at=timezone.now() - timedelta(seconds=1.5))
+        self.assertEqual(take_tokens(limits), 0)
+        self.assertGreater(take_tokens(limits), 0)
+        RateLimitBucket.objects.filter(key='test:user').update(updated_at=timezone.now() - timedelta(hours=1))
+        take_tokens(limits)
+        self.assertAlmostEqual(RateLimitBucket.objects.get(key='test:user').tokens, 1, places=2)
+
+    def test_all_or_nothing(self):
+        limits = [('test:a', 5, 1.0), ('test:b', 1, 1.0)]
+        self.assertEqual(take_tokens(limits), 0)
+        self.assertGreater(take_tokens(limits), 0)
+        # The refused request took nothing from the bucket that still had tokens
+        self.assertAlmostEqual(RateLimitBucket.objects.get(key='test:a').tokens, 4, delta=0.1)
+
+@override_settings(OPENROUTER_API_KEY='', GENERATION_RATE_LIMIT_ENABLED=False, JOURNEY_POOL_ENABLED=False)
+class AsyncGenerateTests(TestCase):
+    url = '/api/v1/courses/generate/async/'
+
+    async def test_generates_and_saves_a_course(self):
+        body = {'user_id': 'async-user', 'mood': 'sad', 'target_emotion': 'happy', 'context': 'exam'}
+        response = await self.async_client.post(self.url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), get_journey_template('sad', 'happy'))
+        self.assertEqual(await EmotionalCourse.objects.filter(user_id='async-user').acount(), 1)
+
+    async def test_rejects_bad_bodies(self):
+        for body in ('not json', '[1, 2]', '"text"', '{"mood": "sad"}'):
+            response = await self.async_client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(await EmotionalCourse.objects.acount(), 0)
+
+@override_settings(
+    OPENROUTER_API_KEY='', GENERATION_RATE_LIMIT_ENABLED=False, JOURNEY_POOL_ENABLED=False,
+    GENERATION_JOB_RUN_IN_PROCESS=False, GENERATION_JOB_STALE_SECONDS=600,
+)
+class GenerationJobTests(TestCase):
+    def enqueue(self, context='exam'):
+        body = {'user_id': 'job-user', 'mood': 'sad', 'context': context, 'mode': 'job'}
+        response = self.client.post('/api/v1/courses/generate/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], GenerationJob.STATUS_QUEUED)
+        return response.json()['job_id']
+
+    def test_queued_job_runs_once(self):
+        job_id = self.enqueue()
+        self.assertFalse(EmotionalCourse.objects.exists())
+
+        self.assertEqual(claim_next_job(), job_id)
+        self.assertIsNone(claim_next_job())
+        self.assertFalse(claim_job(job_id))  # Already running
+        run_job(job_id, claimed=True)
+
+        status = self.client.get(f'/api/v1/jobs/{job_id}/').json()
+        self.assertEqual((status['status'], status['attempts']), (GenerationJob.STATUS_DONE, 1))
+        course = EmotionalCourse.objects.get(id=status['course'])
+        self.assertEqual((course.user_id, course.json_data), ('job-user', get_journey_template('sad', 'happy')))
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get('/api/v1/jobs/999/').status_code, 404)
+
+    def test_stale_running_jobs_are_requeued(self):
+        stale, fresh = self.enqueue('first'), self.enqueue('second')
+        for job_id in (stale, fresh):
+            self.assertTrue(claim_job(job_id))
+        GenerationJob.objects.filter(id=stale).update(started_at=timezone.now() - timedelta(seconds=601))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_next_job(), stale)
+        self.assertEqual(GenerationJob.objects.get(id=stale).attempts, 2)
+
+class JourneyCacheTests(TestCase):
+    def setUp(self):
+        get_local_cache().clear()
+        self.journey = get_journey_template('sad', 'happy')
+
+    def test_keys_ignore_case_punctuation_and_spacing(self):
+        self.assertEqual(
+            make_cache_key('Sad', 'happy', 'My exam,  tomorrow!'),
+            make_cache_key('sad ', 'HAPPY', 'my exam tomorrow'),
+        )
+        self.assertNotEqual(make_cache_key('sad', 'happy', 'exam'), make_cache_key('sad', 'calm', 'exam'))
+
+    def test_local_tier_evicts_least_recently_used(self):
+        cache = LocalJourneyCache(max_entries=2, ttl_seconds=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        cache.set('d', 4, ttl_seconds=0)
+        self.assertIsNone(cache.get('d'))  # Expired
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_database_tier_serves_other_workers(self):
+        store_journey('sad', 'happy', 'exam', self.journey)
+        get_local_cache().clear()  # As if another process asked
+
+        cached = get_cached_journey('Sad', 'happy', 'Exam!')
+        self.assertEqual(cached['course'], self.journey['course'])
+        self.assertEqual(JourneyCacheEntry.objects.get().hits, 1)
+        # Promoted into memory, and callers get their own copy
+        cached['course']['steps'].clear()
+        self.assertEqual(get_cached_journey('sad', 'happy', 'exam')['course'], self.journey['course'])
+        self.assertEqual(JourneyCacheEntry.objects.get().hits, 1)
+
+    @override_settings(JOURNEY_CACHE_ENABLED=False)
+    def test_disabled(self):
+        store_journey('sad', 'happy', 'exam', self.journey)
+        self.assertIsNone(get_cached_journey('sad', 'happy', 'exam'))
+        self.assertFalse(JourneyCacheEntry.objects.exists())
+
+    @override_settings(JOURNEY_CACHE_DB_MAX_ENTRIES=2)
+    def test_prune_drops_expired_then_least_recently_used(self):
+        for context in ('one', 'two', 'three', 'four'):
+            store_journey('sad', 'happy', context, self.journey)
+        JourneyCacheEntry.objects.filter(key=make_cache_key('sad', 'happy', 'four')).update(expires_at=timezone.now())
+        JourneyCacheEntry.objects.filter(key=make_cache_key('sad', 'happy', 'one')).update(last_hit_at=timezone.now())
+
+        self.assertEqual(prune_journey_cache(), 2)
+        kept = set(JourneyCacheEntry.objects.values_list('key', flat=True))
+        self.assertEqual(kept, {make_cache_key('sad', 'happy', context) for context in ('one', 'three')})
+
+@override_settings(SINGLE_FLIGHT_ENABLED=True, SINGLE_FLIGHT_WAIT_SECONDS=0, SINGLE_FLIGHT_POLL_INTERVAL=0)
+class SingleFlightTests(TestCase):
+    def other_worker_lock(self, **fields):
+        GenerationLock.objects.create(
+            key='key', owner='elsewhere:1', expires_at=timezone.now() + timedelta(seconds=60), **fields
+        )
+
+    def test_concurrent_callers_share_one_call(self):
+        calls, results = [], []
+
+        def follow():
+            results.append(run_single_flight('key', lambda: {'from': 'follower'}))
+
+        followers = [threading.Thread(target=follow) for _ in range(3)]
+
+        def generate():
+            calls.append(1)
+            # Followers arrive while the leader is still generating, and wait for it
+            for follower in followers:
+                follower.start()
+            for follower in followers:
+                follower.join(0.2)
+            return {'from': 'leader'}
+
+        results.append(run_single_flight('key', generate))
+        for follower in followers:
+            follower.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'from': 'leader'}] * 4)
+        self.assertEqual(len({id(result) for result in results}), 4)  # Each caller has its own copy
+        self.assertEqual(GenerationLock.objects.get(key='key').result, {'from': 'leader'})
+
+    def test_result_from_another_worker_is_reused(self):
+        self.other_worker_lock(completed=True, result={'from': 'elsewhere'})
+        self.assertEqual(run_single_flight('key', lambda: {'from': 'here'}), {'from': 'elsewhere'})
+        # Unless the caller asked for a fresh journey
+        self.assertEqual(run_single_flight('key', lambda: {'from': 'here'}, fresh=True), {'from': 'here'})
+
+    def test_slow_worker_is_not_waited_on_forever(self):
+        self.other_worker_lock()
+        self.assertEqual(run_single_flight('key', lambda: {'from': 'here'}), {'from': 'here'})
+        self.assertEqual(GenerationLock.objects.get(key='key').owner, 'elsewhere:1')
+
+    def test_failure_releases_the_lock(self):
+        def fail():
+            raise RuntimeError("upstream down")
+
+        with self.assertRaises(RuntimeError):
+            run_single_flight('key', fail)
+        self.assertFalse(GenerationLock.objects.exists())
+        self.assertEqual(run_single_flight('key', lambda: {'from': 'retry'}), {'from': 'retry'})
+
+    async def test_concurrent_coroutines_share_one_call(self):
+        calls = []
+
+        async def generate():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'from': 'leader'}
+
+        results = await asyncio.gather(*(arun_single_flight('key', generate) for _ in range(3)))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'from': 'leader'}] * 3)
+
+class FlakyCompletions:
+    """Stands in for client.chat.completions, failing a set number of times first"""
+
+    def __init__(self, failures, error=None):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error or APIConnectionError(request=httpx.Request('POST', 'http://openrouter.test'))
+        return {'model': kwargs['model']}
+
+@override_settings(OPENROUTER_MAX_RETRIES=2, OPENROUTER_RETRY_BASE_DELAY=0, OPENROUTER_RETRY_MAX_DELAY=0)
+class OpenRouterClientTests(TestCase):
+    def manager(self, completions, budget=10.0):
+        with override_settings(OPENROUTER_RETRY_BUDGET_MAX=budget, OPENROUTER_RETRY_BUDGET_RATIO=0.2):
+            manager = OpenRouterClientManager()
+        manager._client = completions
+        return manager
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, max_tokens=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        budget.record_request()
+        self.assertFalse(budget.try_spend())
+        budget.record_request()
+        self.assertTrue(budget.try_spend())
+
+    def test_transient_failures_are_retried(self):
+        completions = FlakyCompletions(failures=2)
+        manager = self.manager(completions)
+        self.assertEqual(manager.create_completion(model='m'), {'model': 'm'})
+        stats = manager.stats()
+        self.assertEqual((completions.calls, stats['retries'], stats['failures'], stats['successes']), (3, 2, 2, 1))
+
+    def test_retries_stop_at_the_limit(self):
+        completions = FlakyCompletions(failures=5)
+        with self.assertRaises(APIConnectionError):
+            self.manager(completions).create_completion(model='m')
+        self.assertEqual(completions.calls, 3)
+
+    def test_retries_stop_when_the_budget_is_spent(self):
+        completions = FlakyCompletions(failures=5)
+        manager = self.manager(completions, budget=1.0)
+        with self.assertRaises(APIConnectionError):
+            manager.create_completion(model='m')
+        self.assertEqual((completions.calls, manager.stats()['retries_denied']), (2, 1))
+
+    def test_client_errors_are_not_retried(self):
+        response = httpx.Response(400, request=httpx.Request('POST', 'http://openrouter.test'))
+        completions = FlakyCompletions(failures=1, error=BadRequestError("bad", response=response, body=None))
+        with self.assertRaises(BadRequestError):
+            self.manager(completions).create_completion(model='m')
+        self.assertEqual(completions.calls, 1)
+
+@override_settings(
+    OPENROUTER_API_KEY='test-key', JOURNEY_POOL_ENABLED=True, JOURNEY_POOL_PAIRS=['sad:happy'],
+    JOURNEY_POOL_DEPTH=3, JOURNEY_POOL_LOW_WATER=2, JOURNEY_POOL_BACKGROUND_REFILL=True,
+    GENERATION_RATE_LIMIT_ENABLED=True, GENERATION_GLOBAL_BURST=10, GENERATION_USER_DAILY_TOKENS=1000,
+)
+class JourneyPoolTests(TestCase):
+    def fill(self, count):
+        for number in range(count):
+            journey = get_journey_template('sad', 'happy')
+            journey['metadata']['pool_number'] = number
+            PregeneratedJourney.objects.create(from_emotion='sad', to_emotion='happy', journey=journey)
+
+    @mock.patch('api.services.journey_pool.schedule_refill')
+    def test_pop_takes_the_oldest_and_personalizes_it(self, schedule_refill):
+        self.fill(3)
+        journey = pop_pooled_journey('Sad ', 'HAPPY')
+        self.assertEqual(journey['metadata']['pool_number'], 0)
+        self.assertEqual(journey['course']['emotion_transition'], {'from': 'Sad ', 'to': 'HAPPY'})
+        self.assertEqual(PregeneratedJourney.objects.count(), 2)
+        self.assertIsNone(pop_pooled_journey('angry', 'calm'))  # Not a pooled pair
+
+    @mock.patch('api.services.journey_pool.schedule_refill')
+    def test_refill_is_scheduled_below_the_low_water_mark(self, schedule_refill):
+        self.fill(3)
+        pop_pooled_journey('sad', 'happy')
+        schedule_refill.assert_not_called()  # Two left
+        pop_pooled_journey('sad', 'happy')
+        schedule_refill.assert_called_once_with('sad', 'happy')
+        pop_pooled_journey('sad', 'happy')
+        self.assertIsNone(pop_pooled_journey('sad', 'happy'))
+        self.assertEqual(schedule_refill.call_count, 2)  # Misses schedule nothing
+
+    @mock.patch('api.services.ai_service.fetch_journey_from_openrouter')
+    def test_refill_tops_up_to_depth(self, fetch):
+        fetch.return_value = get_journey_template('sad', 'happy')
+        self.fill(1)
+        self.assertEqual(refill_pool('sad', 'happy'), 2)
+        self.assertEqual(fetch.call_count, 2)
+        self.assertEqual(PregeneratedJourney.objects.count(), 3)
+
+    @override_settings(GENERATION_GLOBAL_BURST=1, GENERATION_GLOBAL_PER_MINUTE=1)
+    @mock.patch('api.services.ai_service.fetch_journey_from_openrouter')
+    def test_refill_stops_at_the_global_rate_limit(self, fetch):
+        fetch.return_value = get_journey_template('sad', 'happy')
+        self.assertEqual(refill_pool('sad', 'happy'), 1)
+
+    @mock.patch('api.services.ai_service.fetch_journey_from_openrouter')
+    def test_refill_stops_at_the_pool_token_budget(self, fetch):
+        TokenUsage.objects.create(user_id=POOL_USER, day=timezone.localdate(), prompt_tokens=400, completion_tokens=600)
+        self.assertEqual(refill_pool('sad', 'happy'), 0)
+        fetch.assert_not_called()
+
+    @mock.patch('api.services.ai_service.fetch_journey_from_openrouter')
+    def test_refill_stops_while_the_circuit_is_open(self, fetch):
+        fetch.side_effect = CircuitOpen('openrouter', 30)
+        self.assertEqual(refill_pool('sad', 'happy'), 0)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertFalse(PregeneratedJourney.objects.exists())
+
+class TemplateRegistryTests(TestCase):
+    def setUp(self):
+        self.registry = TemplateRegistry()
+
+    def test_renders_personalized_fields(self):
+        journey = self.registry.render_journey('sad', 'happy')
+        course = journey['course']
+        self.assertEqual(course['title'], "From Sad to Happy Journey")
+        self.assertEqual(course['emotion_transition'], {'from': 'sad', 'to': 'happy'})
+        self.assertEqual(course['reward']['medal_type'], 'blue')
+        self.assertEqual([step['step_number'] for step in course['steps']], list(range(1, len(course['steps']) + 1)))
+        self.assertIn(('sad', 'happy'), self.registry.pairs())
+
+    def test_unknown_pairs_use_the_default_steps(self):
+        journey = self.registry.render_journey('bored', 'curious')
+        self.assertEqual(journey['course']['steps'], self.registry.render_steps('bored', 'curious'))
+        self.assertNotEqual(journey['course']['steps'], self.registry.render_steps('sad', 'happy'))
+        self.assertEqual(journey['course']['reward']['medal_type'], 'silver')
+
+    def test_shared_data_is_read_only(self):
+        first = self.registry.render_journey('sad', 'happy')
+        second = self.registry.render_journey('sad', 'happy')
+        self.assertIs(first['course']['steps'], second['course']['steps'])
+        with self.assertRaises(TypeError):
+            first['course']['steps'].append({})
+        with self.assertRaises(TypeError):
+            first['course']['initial_prompt']['input_range']['min'] = 0
+        # Personalized parts are rebuilt for every journey, and a deep copy is fully mutable
+        first['course']['title'] = 'Mine'
+        self.assertNotEqual(second['course']['title'], 'Mine')
+        private = copy.deepcopy(second)
+        private['course']['steps'].append({})
+        self.assertEqual(type(private['course']['steps']), list)
+
+    def test_literal_braces_are_kept(self):
+        template = CompiledTemplate({'text': '{not a field} ${emotion}', 'value': '${emotion}'})
+        self.assertEqual(template.render({'emotion': 'sad'}), {'text': '{not a field} sad', 'value': 'sad'})
+        with self.assertRaises(ImproperlyConfigured):
+            CompiledTemplate({'text': '${unknown}'})
+
+    def test_invalid_templates_fail_to_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'steps').mkdir()
+            (directory / 'base.json').write_text((TEMPLATE_DIR / 'base.json').read_text())
+            steps = json.loads((TEMPLATE_DIR / 'steps' / 'default.json').read_text())
+            steps['steps'][0]['quiz']['correct_answer'] = 'Z'
+            (directory / 'steps' / 'default.json').write_text(json.dumps(steps))
+
+            with self.assertRaisesMessage(ImproperlyConfigured, "correct_answer is not an option id"):
+                TemplateRegistry(directory).load()
+
+class JourneyBlobTests(TestCase):
+    def test_identical_journeys_share_a_blob(self):
+        journey = get_journey_template('sad', 'happy')
+        reordered = json.loads(json.dumps(journey, sort_keys=True))
+        first = create_course('user-a', 'sad', 'happy', 'exam', journey)
+        second = create_course('user-b', 'sad', 'happy', 'work', reordered)
+        third = create_course('user-a', 'angry', 'calm', 'traffic', get_journey_template('angry', 'calm'))
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertNotEqual(first.blob_id, third.blob_id)
+        self.assertEqual(JourneyBlob.objects.count(), 2)
+        blob = JourneyBlob.objects.get(id=first.blob_id)
+        self.assertEqual((blob.title, blob.step_count), (journey['course']['title'], len(journey['course']['steps'])))
+        self.assertEqual(EmotionalCourse.objects.get(id=second.id).json_data, journey)
+
+    def test_changing_a_course_leaves_others_alone(self):
+        journey = get_journey_template('sad', 'happy')
+        first = create_course('user-a', 'sad', 'happy', 'exam', journey)
+        second = create_course('user-b', 'sad', 'happy', 'work', journey)
+
+        edited = copy.deepcopy(journey)
+        edited['course']['title'] = 'Edited'
+        first.json_data = edited
+        first.save(update_fields=['json_data'])
+
+        self.assertEqual(EmotionalCourse.objects.get(id=first.id).json_data['course']['title'], 'Edited')
+        self.assertEqual(EmotionalCourse.objects.get(id=second.id).json_data, journey)
+
+class JourneyBlobMigrationTests(TransactionTestCase):
+    before = [('api', '0006_pregeneratedjourney')]
+    after = [('api', '0007_journeyblob_emotionalcourse_blob')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_courses_are_deduplicated(self):
+        apps = self.migrate(self.before)
+        EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+        journey = get_journey_template('sad', 'happy')
+        other = get_journey_template('angry', 'calm')
+        for index, data in enumerate((journey, other, journey, journey)):
+            EmotionalCourse.objects.create(
+                user_id=f'user-{index}', from_emotion='sad', to_emotion='happy', context='exam', json_data=data
+            )
+
+        apps = self.migrate(self.after)
+        EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+        JourneyBlob = apps.get_model('api', 'JourneyBlob')
+        self.assertEqual(JourneyBlob.objects.count(), 2)
+        blob_data = [course.blob.data for course in EmotionalCourse.objects.select_related('blob').order_by('id')]
+        self.assertEqual(blob_data, [journey, other, journey, journey])
+
+        # And back again
+        apps = self.migrate(self.before)
+        EmotionalCourse = apps.get_model('api', 'EmotionalCourse')
+        self.assertEqual([course.json_data for course in EmotionalCourse.objects.order_by('id')], blob_data)
+
+class CourseListPaginationTests(TestCase):
+    def setUp(self):
+        journey = get_journey_template('sad', 'happy')
+        self.ids = [create_course('lister', 'sad', 'happy', f'context {i}', journey).id for i in range(5)]
+        create_course('someone-else', 'sad', 'happy', 'other', journey)
+        # Equal timestamps are ordered by id, so no course is skipped or repeated
+        EmotionalCourse.objects.filter(id__in=self.ids[1:4]).update(created_at=timezone.now())
+
+    def test_pages_cover_every_course_newest_first(self):
+        seen, pages = [], 0
+        url = '/api/v1/courses/?user_id=lister&page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [course['id'] for course in response.json()['results']]
+            url = response.json()['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        expected = EmotionalCourse.objects.filter(user_id='lister').order_by('-created_at', '-id')
+        self.assertEqual(seen, list(expected.values_list('id', flat=True)))
+
+    def test_without_a_user_the_list_is_empty(self):
+        self.assertEqual(self.client.get('/api/v1/courses/').json()['results'], [])
+
+    def test_page_is_an_index_range_scan(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Checks the SQLite query plan")
+        page = EmotionalCourse.objects.filter(user_id='lister').summaries().order_by('-created_at', '-id')[:3]
+        sql, params = page.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('course_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)  # No sort step
+
+class CourseRepresentationTests(TestCase):
+    def setUp(self):
+        self.journey = get_journey_template('sad', 'happy')
+        self.course = create_course('viewer', 'sad', 'happy', 'exam', self.journey)
+
+    def test_list_has_summaries_without_the_journey(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/courses/?user_id=viewer')
+        summary = response.json()['results'][0]
+        self.assertNotIn('json_data', summary)
+        self.assertEqual(summary['title'], self.journey['course']['title'])
+        self.assertEqual(summary['step_count'], len(self.journey['course']['steps']))
+        self.assertFalse(any('"api_journeyblob"."data"' in query['sql'] for query in queries.captured_queries))
+
+    def test_detail_has_the_journey(self):
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/')
+        self.assertEqual(response.json()['json_data'], self.journey)
+
+    def test_single_step(self):
+        response = self.client.get(f'/api/v1/courses/{self.course.id}/steps/2/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.journey['course']['steps'][1])
+        self.assertEqual(self.client.get(f'/api/v1/courses/{self.course.id}/steps/99/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/v1/courses/{self.course.id + 1}/steps/1/').status_code, 404)
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.journey = get_journey_template('sad', 'happy')
+        self.course = create_course('etag-user', 'sad', 'happy', 'exam', self.journey)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_course_detail(self):
+        url = f'/api/v1/courses/{self.course.id}/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.course.completed = True
+        self.course.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/v1/courses/{self.course.id + 1}/').status_code, 404)
+
+    def test_step_only_changes_with_the_journey(self):
+        url = f'/api/v1/courses/{self.course.id}/steps/1/'
+        response = self.client.get(url)
+        self.course.completed = True
+        self.course.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.assertNotEqual(self.client.get(f'/api/v1/courses/{self.course.id}/steps/2/')['ETag'], response['ETag'])
+
+    def test_course_list(self):
+        url = '/api/v1/courses/?user_id=etag-user&page_size=1'
+        response = self.client.get(url)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # A new course lands on the first page
+        create_course('etag-user', 'sad', 'happy', 'work', self.journey)
+        fresh = self.revalidate(url, response)
+        self.assertEqual(fresh.status_code, 200)
+        # Another user's courses do not matter
+        create_course('someone-else', 'sad', 'happy', 'work', self.journey)
+        self.assertEqual(self.revalidate(url, fresh).status_code, 304)
+
+    def test_progress_preconditions(self):
+        url = f'/api/v1/courses/{self.course.id}/progress/'
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        def report(step):
+            return self.client.post(
+                url, {'current_step': step}, content_type='application/json', HTTP_IF_MATCH=response['ETag']
+            )
+
+        self.assertEqual(report(1).status_code, 200)
+        # The first update changed the progress, so a second write against the old version is refused
+        self.assertEqual(report(2).status_code, 412)
+        self.assertEqual(self.client.get(url).json()['current_step'], 1)
+
+class CompressedJSONTests(TestCase):
+    def setUp(self):
+        self.journey = get_journey_template('sad', 'happy')
+        self.journey['course']['title'] = 'Från ledsen till glad 🙂'
+
+    def test_round_trip(self):
+        payload = compress_json(self.journey)
+        self.assertEqual(payload[:2], MAGIC + b'\x00')
+        self.assertLess(len(payload), len(dumps(self.journey).encode('utf-8')) / 2)
+        self.assertEqual(decompress_json(payload), self.journey)
+
+    def test_unknown_payloads_are_rejected(self):
+        body = compress_json(self.journey)[2:]
+        for payload in (b'{"not": "compressed"}', MAGIC + b'\x01' + body):
+            with self.assertRaises(ValueError):
+                decompress_json(payload)
+
+    def test_field_stores_compressed_bytes_and_loads_lazily(self):
+        course = create_course('user-a', 'sad', 'happy', 'exam', self.journey)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT data FROM api_journeyblob WHERE id = %s', [course.blob_id])
+            self.assertEqual(decompress_json(cursor.fetchone()[0]), self.journey)
+
+        blob = JourneyBlob.objects.get(id=course.blob_id)
+        self.assertIsInstance(blob.__dict__['data'], CompressedJSON)  # Not inflated until read
+        self.assertEqual(blob.data, self.journey)
+        stored = JourneyBlob.objects.values_list('data', flat=True).get(id=course.blob_id)
+        self.assertEqual(stored.load(), self.journey)
+
+class DropJourneyDictionaryMigrationTests(TransactionTestCase):
+    before = [('api', '0017_userprogress_user_id')]
+    after = [('api', '0018_drop_journey_dictionary')]
+
+    def test_dictionary_rows_are_rewritten(self):
+        dictionary = import_string('api.migrations.0018_drop_journey_dictionary.JOURNEY_V1_DICTIONARY')
+        journeys = [get_journey_template('sad', 'happy'), get_journey_template('angry', 'calm')]
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        for journey in journeys:
+            create_course('user-a', 'sad', 'happy', 'exam', journey)
+
+        # Rewrite the first blob as the retired dictionary used to store it
+        compressor = zlib.compressobj(9, zdict=dictionary)
+        payload = MAGIC + b'\x01' + compressor.compress(dumps(journeys[0]).encode('utf-8')) + compressor.flush()
+        JourneyBlob.objects.filter(digest=journey_digest(journeys[0])).update(data=CompressedJSON(payload))
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        stored = JourneyBlob.objects.order_by('id').values_list('data', flat=True)
+        self.assertEqual([bytes(row.payload[:2]) for row in stored], [MAGIC + b'\x00'] * 2)
+        self.assertEqual([row.load() for row in stored], journeys)
+
+class MoodTrendTests(TestCase):
+    url = '/api/v1/mood-trend/'
+
+    def rate(self, user_id, ratings):
+        changes = RollupChanges()
+        for day, rating in ratings:
+            changes.add_mood(user_id, rating, timezone.make_aware(datetime(day.year, day.month, day.day, 12)))
+        changes.apply()
+
+    def test_progress_reports_are_bucketed(self):
+        course = create_course('trend-user', 'sad', 'happy', 'exam', get_journey_template('sad', 'happy'))
+        update_course_progress(course.id, current_step=0, mood_rating=3)
+        update_course_progress(course.id, current_step=4, mood_rating=7)
+
+        trend = self.client.get(self.url, {'user_id': 'trend-user'}).json()
+        self.assertEqual((trend['granularity'], trend['span_days']), ('day', 1))
+        [point] = trend['points']
+        self.assertEqual(point['start'], timezone.localdate().isoformat())
+        self.assertEqual((point['count'], point['mean'], point['min'], point['max']), (2, 5.0, 3, 7))
+
+    def test_long_ranges_merge_week_buckets(self):
+        monday = date(2026, 1, 5)
+        self.rate('trend-user', [
+            (monday, 2), (monday + timedelta(days=3), 4),  # Week 1
+            (monday + timedelta(days=8), 6),  # Week 2
+            (monday + timedelta(days=15), 8),  # Week 3
+        ])
+        self.rate('someone-else', [(monday, 10)])
+
+        trend = self.client.get(self.url, {
+            'user_id': 'trend-user', 'start': monday.isoformat(),
+            'end': (monday + timedelta(days=27)).isoformat(), 'max_points': 2,
+        }).json()
+        self.assertEqual((trend['granularity'], trend['span_days']), ('week', 14))
+        summary = [(point['start'], point['count'], point['mean'], point['min'], point['max']) for point in trend['points']]
+        self.assertEqual(summary, [
+            (monday.isoformat(), 3, 4.0, 2, 6),
+            ((monday + timedelta(days=14)).isoformat(), 1, 8.0, 8, 8),
+        ])
+
+        # Day buckets on request, for the same range
+        days = self.client.get(self.url, {
+            'user_id': 'trend-user', 'start': monday.isoformat(), 'end': (monday + timedelta(days=6)).isoformat(),
+            'granularity': 'day',
+        }).json()
+        self.assertEqual([point['count'] for point in days['points']], [1, 1])
+
+    def test_invalid_queries(self):
+        for params in (
+            {},
+            {'user_id': 'trend-user', 'granularity': 'month'},
+            {'user_id': 'trend-user', 'start': 'yesterday'},
+            {'user_id': 'trend-user', 'start': '2026-02-01', 'end': '2026-01-01'},
+        ):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+class MetricsTests(TestCase):
+    def sample(self, name):
+        """Value of one series on the metrics endpoint, 0 if it is not there yet"""
+        response = self.client.get('/api/v1/ops/metrics/')
+        self.assertEqual(response.status_code, 200)
+        for line in response.content.decode().splitlines():
+            series, _, value = line.rpartition(' ')
+            if series == name:
+                return float(value)
+        return 0
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram('test_seconds', "Test", labels=('stage',), buckets=(1, 5))
+        for value in (0.5, 3, 3, 10):
+            histogram.observe(value, stage='parse')
+        self.assertEqual(histogram.collect()[2:], [
+            'test_seconds_bucket{stage="parse",le="1"} 1',
+            'test_seconds_bucket{stage="parse",le="5"} 3',
+            'test_seconds_bucket{stage="parse",le="+Inf"} 4',
+            'test_seconds_sum{stage="parse"} 16.5',
+            'test_seconds_count{stage="parse"} 4',
+        ])
+
+    def test_counter_labels_are_escaped(self):
+        counter = Counter('test_total', "Test", labels=('reason',))
+        counter.inc(reason='say "hi"\n')
+        counter.inc(2, reason='say "hi"\n')
+        self.assertEqual(counter.collect()[2:], ['test_total{reason="say \\"hi\\"\\n"} 3'])
+
+    def test_requests_are_timed_and_their_queries_counted(self):
+        course = create_course('metrics-user', 'sad', 'happy', 'exam', get_journey_template('sad', 'happy'))
+        timed = 'dapi_http_request_duration_seconds_count{view="course-detail",method="GET",status="200"}'
+        counted = 'dapi_http_request_queries_count{view="course-detail",method="GET"}'
+        missing = 'dapi_http_request_duration_seconds_count{view="course-detail",method="GET",status="404"}'
+        before = [self.sample(name) for name in (timed, counted, missing)]
+
+        self.client.get(f'/api/v1/courses/{course.id}/')
+        self.client.get(f'/api/v1/courses/{course.id + 1}/')
+        after = [self.sample(name) for name in (timed, counted, missing)]
+        self.assertEqual([b - a for a, b in zip(before, after)], [1, 2, 1])  # Query counts are not split by status
+        self.assertGreater(self.sample('dapi_http_request_queries_sum{view="course-detail",method="GET"}'), 0)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        name = 'dapi_http_request_duration_seconds_count{view="mood-outcomes",method="GET",status="200"}'
+        before = self.sample(name)
+        self.client.get('/api/v1/analytics/mood-outcomes/')
+        self.assertEqual(self.sample(name), before)
+
+    @override_settings(OPENROUTER_API_KEY='', GENERATION_RATE_LIMIT_ENABLED=False, JOURNEY_POOL_ENABLED=False)
+    def test_generation_stages_are_timed(self):
+        name = 'dapi_generation_results_total{source="fallback",reason="no_api_key"}'
+        stage = 'dapi_generation_stage_seconds_count{stage="db_insert"}'
+        before = self.sample(name), self.sample(stage)
+        body = {'user_id': 'metrics-user', 'mood': 'sad', 'context': 'exam', 'no_cache': True}
+        self.client.post('/api/v1/courses/generate/', body, content_type='application/json')
+        self.assertEqual((self.sample(name), self.sample(stage)), (before[0] + 1, before[1] + 1))
+
+class ScriptedRouter(ModelRouter):
+    """Model router whose models follow a script instead of calling OpenRouter.
+
+    script maps a model to (seconds to its first token, seconds to finish,
+    result); a result that is an exception is raised instead.
+    """
+
+    def __init__(self, script):
+        super().__init__(list(script), alpha=0.5)
+        self.script = script
+        self.cancelled = []
+
+    def _attempt(self, model, prompt, progressed, abandoned, streams=None):
+        first_token, finish, result = self.script[model]
+        started = time.monotonic()
+        while time.monotonic() - started < finish:
+            if abandoned.is_set():
+                return None
+            if first_token is not None and time.monotonic() - started >= first_token:
+                progressed.set()
+            time.sleep(0.005)
+        return self._outcome(model, result, time.monotonic() - started)
+
+    async def _aattempt(self, model, prompt, progressed):
+        first_token, finish, result = self.script[model]
+        try:
+            if first_token is not None:
+                await asyncio.sleep(first_token)
+                progressed.set()
+            await asyncio.sleep(finish - (first_token or 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        return self._outcome(model, result, finish)
+
+    def _outcome(self, model, result, latency):
+        if isinstance(result, Exception):
+            self.record_failure(model)
+            raise result
+        self.record_success(model, None, latency)
+        return result
+
+@override_settings(
+    OPENROUTER_HEDGE_AFTER_SECONDS=0.05, OPENROUTER_MODEL_MAX_ERROR_RATE=0.5, OPENROUTER_MODEL_RETRY_SECONDS=60,
+)
+class ModelRouterTests(TestCase):
+    def test_plan(self):
+        router = ScriptedRouter({'a': None, 'b': None, 'c': None})
+        self.assertEqual(router.plan(), ('a', 'c'))  # Unmeasured models go first, later-listed first
+        router.record_success('c', None, 2.0)
+        self.assertEqual(router.plan(), ('a', 'b'))
+        router.record_success('b', None, 3.0)
+        self.assertEqual(router.plan(), ('a', 'c'))  # Then the fastest
+
+        # A failing primary sits out, then gets another chance
+        router.record_failure('a')
+        self.assertEqual(router.plan(), ('b', 'c'))
+        router._stats['a'].failed_at -= 61
+        self.assertEqual(router.plan()[0], 'a')
+
+        with override_settings(OPENROUTER_HEDGE_AFTER_SECONDS=0):
+            self.assertEqual(router.plan(), ('a', None))
+        self.assertEqual(ScriptedRouter({'a': None}).plan(), ('a', None))
+
+    def test_silent_primary_is_hedged(self):
+        router = ScriptedRouter({'slow': (None, 5, 'slow journey'), 'fast': (0.01, 0.02, 'fast journey')})
+        started = time.monotonic()
+        self.assertEqual(router.fetch('prompt'), 'fast journey')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(router.stats()['fast']['hedges_won'], 1)
+        self.assertEqual(router.stats()['slow']['requests'], 0)  # Abandoned, so not measured
+
+    def test_primary_that_is_streaming_is_not_hedged(self):
+        router = ScriptedRouter({'primary': (0.01, 0.15, 'primary journey'), 'hedge': (0.01, 0.02, 'hedge journey')})
+        self.assertEqual(router.fetch('prompt'), 'primary journey')
+        self.assertEqual(router.stats()['hedge']['requests'], 0)
+
+    def test_failed_primary_falls_over_at_once(self):
+        with override_settings(OPENROUTER_HEDGE_AFTER_SECONDS=5):
+            router = ScriptedRouter({'broken': (None, 0, RuntimeError("500")), 'backup': (0.01, 0.02, 'journey')})
+            started = time.monotonic()
+            self.assertEqual(router.fetch('prompt'), 'journey')
+            self.assertLess(time.monotonic() - started, 1)
+
+            router = ScriptedRouter({'broken': (None, 0, RuntimeError("500")), 'also': (None, 0, ValueError("bad"))})
+            with self.assertRaises(ValueError):
+                router.fetch('prompt')
+
+    async def test_async_hedge_cancels_the_loser(self):
+        router = ScriptedRouter({'slow': (None, 5, 'slow journey'), 'fast': (0.01, 0.02, 'fast journey')})
+        self.assertEqual(await router.afetch('prompt'), 'fast journey')
+        self.assertEqual(router.cancelled, ['slow'])
+
+    def test_abandoned_attempts_are_charged_an_estimate(self):
+        with charge_to('hedged-user'):
+            _charge_estimate('x' * 400, ['y' * 200, 'z' * 200])
+        usage = TokenUsage.objects.get(user_id='hedged-user')
+        self.assertEqual(usage.requests, 1)
+        self.assertEqual(usage.completion_tokens, 100)
+        self.assertGreater(usage.prompt_tokens, 100)  # The system prompt counts too
@@ -0,0 +1,12 @@
+from rest_framework.throttling import BaseThrottle
+from .services.rate_limit import generation_wait
+
+def generation_request_wait(request, user_id):
+    """Seconds a validated generation request that missed the cache must wait, or 0 to let it through.
+
+    Called by the generate views once the body is valid and no cached or
+    pooled journey can answer it, so neither malformed requests nor free
+    cache hits spend rate-limit tokens. Clients are told apart by IP, as
+    DRF's throttles do.
+    """
+    return generation_wait(str(user_id), BaseThrottle().get_ident(request))
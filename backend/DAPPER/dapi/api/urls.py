@@ -3,6 +3,17 @@ from . import views
 
 urlpatterns = [
     path("api/v1/courses/generate/", views.generate_course, name="generate-course"),
+    path("api/v1/courses/generate/async/", views.generate_course_async, name="generate-course-async"),
+    path("api/v1/courses/generate/stream/", views.generate_course_stream, name="generate-course-stream"),
+    path("api/v1/courses/<int:course_id>/", views.CourseDetailView.as_view(), name="course-detail"),
+    path("api/v1/courses/<int:course_id>/steps/<int:step_number>/", views.course_step, name="course-step"),
     path("api/v1/courses/<int:course_id>/progress/", views.update_progress, name="update-progress"),
+    path("api/v1/progress/batch/", views.progress_batch, name="progress-batch"),
+    path("api/v1/sync/", views.sync_changes, name="sync-changes"),
+    path("api/v1/jobs/<int:job_id>/", views.generation_job_status, name="generation-job-status"),
+    path("api/v1/mood-trend/", views.mood_trend, name="mood-trend"),
+    path("api/v1/analytics/mood-outcomes/", views.mood_outcomes, name="mood-outcomes"),
+    path("api/v1/ops/openrouter/", views.openrouter_stats, name="openrouter-stats"),
+    path("api/v1/ops/metrics/", views.metrics, name="metrics"),
     path("api/v1/courses/", views.CourseListView.as_view(), name="course-list"),
 ]
@@ -1,10 +1,79 @@
+import json
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
-from .models import EmotionalCourse, UserProgress
-from .serializers import EmotionalCourseSerializer, UserProgressSerializer
-from .services.ai_service import generate_journey_with_claude
+from . import conditional
+from .metrics import registry as metrics_registry
+from .models import EmotionalCourse, GenerationJob, MoodTrendBucket, UserProgress
+from .pagination import CourseCursorPagination
+from .serializers import (
+    EmotionalCourseSerializer,
+    EmotionalCourseSummarySerializer,
+    GenerationJobSerializer,
+    UserProgressSerializer,
+)
+from .services.admission import GenerationOverloaded
+from .services.ai_service import (
+    agenerate_new_journey,
+    alookup_journey,
+    generate_new_journey,
+    get_model_router,
+    lookup_journey,
+    stream_journey_with_claude,
+)
+from .services.analytics_service import mood_outcomes as mood_outcome_stats, mood_trend as mood_trend_points
+from .services.circuit_breaker import openrouter_breaker
+from .services.course_service import create_course
+from .services.job_queue import enqueue_generation
+from .services.openrouter_client import get_client_manager
+from .services.progress_service import apply_progress_batch, update_course_progress
+from .services.rate_limit import charge_to, retry_after
+from .services.sync_service import changes_since, decode_cursor
+from .services.journey_stream import aiter_sync, format_sse, iter_journey_events
+from .throttling import generation_request_wait
+
+def _check_generation_limits(request, user_id):
+    """Raise Throttled (429 with Retry-After) if a generation for user_id must wait"""
+    wait = generation_request_wait(request, user_id)
+    if wait:
+        raise Throttled(wait)
+
+def _is_true(value):
+    """Interpret a JSON or form flag such as ``no_cache``"""
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def _optional_int(data, key):
+    """Read an optional integer field, raising ValueError if it is not one"""
+    value = data.get(key)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"{key} must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be an integer")
+
+def _optional_date(data, key):
+    """Read an optional YYYY-MM-DD field, raising ValueError if it is not one"""
+    value = data.get(key)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a date (YYYY-MM-DD)")
 
 @api_view(['POST'])
 def generate_course(request):
@@ -23,58 +92,317 @@ def generate_course(request):
     # Default target emotion is 'happy' if not specified
     target_emotion = request.data.get('target_emotion', 'happy')
     
-    # Generate journey using Claude (or fallback template)
-    journey_data = generate_journey_with_claude(mood, target_emotion, context)
+    # Skip cached journeys when the client asks for a fresh one
+    use_cache = not _is_true(request.data.get('no_cache', False))
     
-    # Create course in database
-    course = EmotionalCourse.objects.create(
-        user_id=user_id,
-        from_emotion=mood,
-        to_emotion=target_emotion,
-        context=context,
-        json_data=journey_data
-    )
+    # Job mode: queue the generation and let the client poll the job status
+    if request.data.get('mode') == 'job':
+        # The job looks in the cache itself later, so every job counts against the limits
+        _check_generation_limits(request, user_id)
+        job = enqueue_generation(user_id, mood, target_emotion, context, use_cache=use_cache)
+        return Response(
+            {"job_id": job.id, "status": job.status},
+            status=status.HTTP_202_ACCEPTED
+        )
     
-    # Create initial progress
-    UserProgress.objects.create(course=course)
+    # Cached and pooled journeys cost no upstream tokens, so only misses are rate limited
+    journey_data = lookup_journey(mood, target_emotion, context) if use_cache else None
+    try:
+        if journey_data is None:
+            _check_generation_limits(request, user_id)
+            # Generate journey using Claude (or fallback template)
+            with charge_to(user_id):
+                journey_data = generate_new_journey(mood, target_emotion, context, fresh=not use_cache)
+    except GenerationOverloaded as e:
+        return Response(
+            {"error": "Course generation is busy. Try again shortly."},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": retry_after(e.retry_after)}
+        )
+    
+    # Create course and initial progress in database
+    create_course(user_id, mood, target_emotion, context, journey_data)
     
     # Return the journey data
     return Response(journey_data)
 
 @api_view(['POST'])
-def update_progress(request, course_id):
-    """Update user progress through a course"""
-    try:
-        course = EmotionalCourse.objects.get(id=course_id)
-        progress = UserProgress.objects.get(course=course)
-        
-        # Update progress
-        if 'current_step' in request.data:
-            progress.current_step = request.data['current_step']
-        
-        if 'mood_rating' in request.data:
-            if progress.current_step == 0:
-                progress.initial_mood_rating = request.data['mood_rating']
+def generate_course_stream(request):
+    """Generate a new course, streaming its sections as Server-Sent Events.
+
+    Emits an ``initial_prompt`` event and one ``step`` event per step as soon
+    as the model has written them, then ``done`` with the saved course id and
+    the full journey.
+    """
+    user_id = request.data.get('user_id')
+    mood = request.data.get('mood')
+    context = request.data.get('context')
+    
+    # Validate required fields
+    if not all([user_id, mood, context]):
+        return Response(
+            {"error": "Missing required fields. Please provide user_id, mood, and context."}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    target_emotion = request.data.get('target_emotion', 'happy')
+    use_cache = not _is_true(request.data.get('no_cache', False))
+    
+    cached = lookup_journey(mood, target_emotion, context) if use_cache else None
+    if cached is None:
+        _check_generation_limits(request, user_id)
+    
+    def event_stream():
+        with charge_to(user_id):
+            if cached is not None:
+                events = iter_journey_events(cached)
             else:
-                progress.final_mood_rating = request.data['mood_rating']
-                
-                # Check if medal earned
-                if progress.final_mood_rating >= 5:
-                    progress.earned_medal = True
-                    course.completed = True
-                    course.save()
+                events = stream_journey_with_claude(mood, target_emotion, context, use_cache=False)
+            try:
+                for event, payload in events:
+                    if event == "journey":
+                        course = create_course(user_id, mood, target_emotion, context, payload)
+                        yield format_sse("done", {"course_id": course.id, "journey": payload})
+                    else:
+                        yield format_sse(event, payload)
+            finally:
+                # On disconnect, release the upstream stream and generation slot now rather than at GC
+                events.close()
+    
+    stream = event_stream()
+    if isinstance(request._request, ASGIRequest):
+        # Otherwise ASGI would buffer the whole stream before sending any of it
+        stream = aiter_sync(stream)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stop proxies from buffering the stream
+    return response
+
+@csrf_exempt
+@require_POST
+async def generate_course_async(request):
+    """Generate a new emotional journey course without blocking the worker.
+
+    Mirrors generate_course but awaits the OpenRouter call and uses the async
+    ORM, so it should be served through dapi/asgi.py (e.g. with uvicorn).
+    """
+    try:
+        data = json.loads(request.body or b"{}")
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Request body must be valid JSON."}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": "Request body must be a JSON object."}, status=400)
+
+    user_id = data.get('user_id')
+    mood = data.get('mood')
+    context = data.get('context')
+    
+    # Validate required fields
+    if not all([user_id, mood, context]):
+        return JsonResponse(
+            {"error": "Missing required fields. Please provide user_id, mood, and context."},
+            status=400
+        )
+    
+    target_emotion = data.get('target_emotion', 'happy')
+    use_cache = not _is_true(data.get('no_cache', False))
+    
+    journey_data = await alookup_journey(mood, target_emotion, context) if use_cache else None
+    if journey_data is None:
+        # Same limits as the DRF generate views
+        wait = await sync_to_async(generation_request_wait)(request, user_id)
+        if wait:
+            response = JsonResponse({"error": "Too many generation requests. Try again later."}, status=429)
+            response['Retry-After'] = retry_after(wait)
+            return response
+    
+    try:
+        if journey_data is None:
+            with charge_to(user_id):
+                journey_data = await agenerate_new_journey(mood, target_emotion, context, fresh=not use_cache)
+    except GenerationOverloaded as e:
+        response = JsonResponse({"error": "Course generation is busy. Try again shortly."}, status=503)
+        response['Retry-After'] = retry_after(e.retry_after)
+        return response
+    
+    await sync_to_async(create_course)(user_id, mood, target_emotion, context, journey_data)
+    
+    return JsonResponse(journey_data)
+
+@api_view(['GET', 'POST'])
+@condition(etag_func=conditional.progress_etag, last_modified_func=conditional.progress_last_modified)
+def update_progress(request, course_id):
+    """Read or update user progress through a course"""
+    if request.method == 'GET':
+        progress = UserProgress.objects.filter(course_id=course_id).first()
+    else:
+        try:
+            current_step = _optional_int(request.data, 'current_step')
+            mood_rating = _optional_int(request.data, 'mood_rating')
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        progress.save()
-        return Response(UserProgressSerializer(progress).data)
+        # Locked read-fold-write, safe against double-taps and concurrent reports
+        progress = update_course_progress(course_id, current_step=current_step, mood_rating=mood_rating)
+    
+    if progress is None:
+        if not EmotionalCourse.objects.filter(id=course_id).exists():
+            return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"error": "Progress not found for this course"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(UserProgressSerializer(progress).data)
+
+@api_view(['POST'])
+def progress_batch(request):
+    """Apply an ordered batch of progress events, possibly across several courses"""
+    events = request.data.get('events') if isinstance(request.data, dict) else None
+    if not isinstance(events, list) or not events:
+        return Response({"error": "Provide a non-empty list of events."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(events) > settings.PROGRESS_BATCH_MAX_EVENTS:
+        return Response(
+            {"error": f"At most {settings.PROGRESS_BATCH_MAX_EVENTS} events per batch."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    reports = []
+    for index, event in enumerate(events):
+        try:
+            if not isinstance(event, dict):
+                raise ValueError("must be an object")
+            course_id = _optional_int(event, 'course_id')
+            if course_id is None:
+                raise ValueError("course_id is required")
+            reports.append((course_id, _optional_int(event, 'current_step'), _optional_int(event, 'mood_rating')))
+        except ValueError as e:
+            return Response({"error": f"Event {index}: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    progress, missing = apply_progress_batch(reports)
+    return Response({
+        "progress": UserProgressSerializer(progress, many=True).data,
+        "not_found": missing,
+    })
+
+@api_view(['GET'])
+def sync_changes(request):
+    """Return a user's courses and progress changed since the client's cursor"""
+    user_id = request.query_params.get('user_id')
+    if not user_id:
+        return Response({"error": "user_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    since = None
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        try:
+            since = decode_cursor(cursor)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    courses, progress, next_cursor, has_more = changes_since(user_id, since)
+    return Response({
+        "courses": EmotionalCourseSummarySerializer(courses, many=True).data,
+        "progress": UserProgressSerializer(progress, many=True).data,
+        "cursor": next_cursor,
+        "has_more": has_more,
+    })
+
+@api_view(['GET'])
+def generation_job_status(request, job_id):
+    """Report the state of a queued generation job and its course once done"""
+    try:
+        job = GenerationJob.objects.get(id=job_id)
+    except GenerationJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(GenerationJobSerializer(job).data)
+
+@require_GET
+def metrics(request):
+    """Expose request and generation metrics in the Prometheus text format"""
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@api_view(['GET'])
+def openrouter_stats(request):
+    """Expose OpenRouter client pool, retry and latency statistics, per-model routing stats and breaker state"""
+    router = get_model_router()
+    return Response({
+        **get_client_manager().stats(),
+        "completion_latency_ms": router.latency_summary(),
+        "models": router.stats(),
+        "circuit_breaker": openrouter_breaker.stats(),
+    })
+
+@api_view(['GET'])
+def mood_trend(request):
+    """Return a user's mood over time from pre-aggregated day and week buckets"""
+    user_id = request.query_params.get('user_id')
+    if not user_id:
+        return Response({"error": "user_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+    
+    granularity = request.query_params.get('granularity') or None
+    if granularity not in (None, MoodTrendBucket.GRANULARITY_DAY, MoodTrendBucket.GRANULARITY_WEEK):
+        return Response({"error": "granularity must be day or week"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        end = _optional_date(request.query_params, 'end') or timezone.localdate()
+        start = _optional_date(request.query_params, 'start') or end - timedelta(days=settings.MOOD_TREND_DEFAULT_DAYS - 1)
+        max_points = _optional_int(request.query_params, 'max_points') or settings.MOOD_TREND_MAX_POINTS
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if start > end:
+        return Response({"error": "start must not be after end"}, status=status.HTTP_400_BAD_REQUEST)
+    
+    max_points = max(1, min(max_points, settings.MOOD_TREND_MAX_POINTS))
+    granularity, span_days, points = mood_trend_points(user_id, start, end, granularity, max_points)
+    return Response({
+        "granularity": granularity,
+        "span_days": span_days,
+        "start": start,
+        "end": end,
+        "points": points,
+    })
+
+@api_view(['GET'])
+def mood_outcomes(request):
+    """Per emotion pair mood outcome statistics, served from the incremental rollups"""
+    return Response({"pairs": mood_outcome_stats(
+        from_emotion=request.query_params.get('from_emotion'),
+        to_emotion=request.query_params.get('to_emotion'),
+    )})
+
+@api_view(['GET'])
+@condition(etag_func=conditional.course_step_etag, last_modified_func=conditional.course_step_last_modified)
+def course_step(request, course_id, step_number):
+    """Return a single step of a course, for clients that load one screen at a time"""
+    try:
+        course = EmotionalCourse.objects.select_related('blob').only('id', 'blob__data').get(id=course_id)
     except EmotionalCourse.DoesNotExist:
         return Response({"error": "Course not found"}, status=status.HTTP_404_NOT_FOUND)
 
+    steps = course.json_data.get('course', {}).get('steps', [])
+    step = next((s for s in steps if s.get('step_number') == step_number), None)
+    if step is None:
+        return Response({"error": "Step not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(step)
+
+@method_decorator(condition(
+    etag_func=conditional.course_list_etag,
+    last_modified_func=conditional.course_list_last_modified
+), name='get')
 class CourseListView(generics.ListAPIView):
-    """List all courses for a specific user"""
-    serializer_class = EmotionalCourseSerializer
+    """List all courses for a specific user, newest first, one cursor page at a time"""
+    serializer_class = EmotionalCourseSummarySerializer
+    pagination_class = CourseCursorPagination
     
     def get_queryset(self):
         user_id = self.request.query_params.get('user_id')
         if user_id:
-            return EmotionalCourse.objects.filter(user_id=user_id).order_by('-created_at')
+            # Summaries come from the blob's denormalized columns, never its JSON
+            return EmotionalCourse.objects.filter(user_id=user_id).summaries()
         return EmotionalCourse.objects.none()
+
+@method_decorator(condition(
+    etag_func=conditional.course_etag,
+    last_modified_func=conditional.course_last_modified
+), name='get')
+class CourseDetailView(generics.RetrieveAPIView):
+    """Return a course with its full journey"""
+    serializer_class = EmotionalCourseSerializer
+    queryset = EmotionalCourse.objects.select_related('blob')
+    lookup_url_kwarg = 'course_id'
@@ -3,6 +3,10 @@ ASGI config for dapi project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn dapi.asgi:application``) to get
+the non-blocking ``/api/v1/courses/generate/async/`` endpoint; the WSGI entry
+point keeps serving the synchronous ``/api/v1/courses/generate/`` path.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
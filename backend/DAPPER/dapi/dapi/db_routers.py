@@ -0,0 +1,69 @@
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+REPLICA = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Set for the duration of a read-only request; everything else uses the primary
+_replica_reads = ContextVar('replica_reads', default=False)
+
+def replica_configured():
+    return REPLICA in connections.databases
+
+class ReplicaReadMiddleware:
+    """Let GET/HEAD/OPTIONS requests read from the replica.
+
+    Writes, background job threads and management commands never set the
+    flag, so they always read their own writes from the primary.
+    """
+
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Stay async under ASGI, so async views are not funnelled through one thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS or not replica_configured():
+            return self.get_response(request)
+        token = _replica_reads.set(True)
+        try:
+            return self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+    async def __acall__(self, request):
+        if request.method not in SAFE_METHODS or not replica_configured():
+            return await self.get_response(request)
+        token = _replica_reads.set(True)
+        try:
+            return await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+
+class PrimaryReplicaRouter:
+    """Route reads of read-only requests to the replica, all else to default"""
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or not replica_configured():
+            return None
+        # Reads inside a transaction must see that transaction's writes
+        if connections['default'].in_atomic_block:
+            return 'default'
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica mirrors the primary, so objects from either may be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -36,7 +36,116 @@ ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', default=['localhost', '127.0.0.1'])
 # OpenRouter API settings
 OPENROUTER_API_KEY = env.str('OPENROUTER_API_KEY', default='')
 OPENROUTER_REFERRER = env.str('OPENROUTER_REFERRER', default='https://yourusername.pythonanywhere.com')
-
+OPENROUTER_BASE_URL = env.str('OPENROUTER_BASE_URL', default='https://openrouter.ai/api/v1')
+
+# Models tried for journeys, primary first; a request the primary has not started answering
+# after OPENROUTER_HEDGE_AFTER_SECONDS is also sent to the fastest other model (0 disables)
+OPENROUTER_MODELS = env.list('OPENROUTER_MODELS', default=[
+    'anthropic/claude-3-opus-20240229',
+    'anthropic/claude-3-sonnet-20240229',
+    'anthropic/claude-3-haiku-20240307',
+])
+OPENROUTER_HEDGE_AFTER_SECONDS = env.float('OPENROUTER_HEDGE_AFTER_SECONDS', default=8.0)
+# An abandoned hedge keeps reading for its usage report (to charge its tokens) at most this long
+OPENROUTER_ABANDONED_DRAIN_SECONDS = env.float('OPENROUTER_ABANDONED_DRAIN_SECONDS', default=10.0)
+OPENROUTER_EWMA_ALPHA = env.float('OPENROUTER_EWMA_ALPHA', default=0.2)  # Weight of the newest latency sample
+OPENROUTER_MODEL_MAX_ERROR_RATE = env.float('OPENROUTER_MODEL_MAX_ERROR_RATE', default=0.5)  # Skipped above this
+OPENROUTER_MODEL_RETRY_SECONDS = env.float('OPENROUTER_MODEL_RETRY_SECONDS', default=60.0)  # Then tried again
+
+# Circuit breaker around OpenRouter, shared by all workers through the database: after
+# CIRCUIT_BREAKER_FAILURE_THRESHOLD failures in a row, journeys use the template without calling
+# OpenRouter for CIRCUIT_BREAKER_OPEN_SECONDS, then CIRCUIT_BREAKER_HALF_OPEN_PROBES calls test it
+CIRCUIT_BREAKER_ENABLED = env.bool('CIRCUIT_BREAKER_ENABLED', default=True)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = env.int('CIRCUIT_BREAKER_FAILURE_THRESHOLD', default=5)
+CIRCUIT_BREAKER_OPEN_SECONDS = env.float('CIRCUIT_BREAKER_OPEN_SECONDS', default=30.0)
+CIRCUIT_BREAKER_HALF_OPEN_PROBES = env.int('CIRCUIT_BREAKER_HALF_OPEN_PROBES', default=2)
+CIRCUIT_BREAKER_SYNC_SECONDS = env.float('CIRCUIT_BREAKER_SYNC_SECONDS', default=2.0)  # How long a worker trusts its copy
+
+# Shared OpenRouter HTTP client: connection pool, timeouts (seconds) and retry budget
+OPENROUTER_MAX_CONNECTIONS = env.int('OPENROUTER_MAX_CONNECTIONS', default=50)
+OPENROUTER_MAX_KEEPALIVE_CONNECTIONS = env.int('OPENROUTER_MAX_KEEPALIVE_CONNECTIONS', default=20)
+OPENROUTER_KEEPALIVE_EXPIRY = env.float('OPENROUTER_KEEPALIVE_EXPIRY', default=60.0)
+OPENROUTER_CONNECT_TIMEOUT = env.float('OPENROUTER_CONNECT_TIMEOUT', default=5.0)
+OPENROUTER_READ_TIMEOUT = env.float('OPENROUTER_READ_TIMEOUT', default=90.0)
+OPENROUTER_MAX_RETRIES = env.int('OPENROUTER_MAX_RETRIES', default=2)
+OPENROUTER_RETRY_BUDGET_RATIO = env.float('OPENROUTER_RETRY_BUDGET_RATIO', default=0.2)  # Retries earned per request
+OPENROUTER_RETRY_BUDGET_MAX = env.float('OPENROUTER_RETRY_BUDGET_MAX', default=10.0)
+OPENROUTER_RETRY_BASE_DELAY = env.float('OPENROUTER_RETRY_BASE_DELAY', default=0.5)
+OPENROUTER_RETRY_MAX_DELAY = env.float('OPENROUTER_RETRY_MAX_DELAY', default=8.0)
+
+# Journey cache (in-process LRU backed by the JourneyCacheEntry table)
+JOURNEY_CACHE_ENABLED = env.bool('JOURNEY_CACHE_ENABLED', default=True)
+JOURNEY_CACHE_TTL_SECONDS = env.int('JOURNEY_CACHE_TTL_SECONDS', default=7 * 24 * 3600)
+JOURNEY_CACHE_MAX_ENTRIES = env.int('JOURNEY_CACHE_MAX_ENTRIES', default=256)  # Per process
+JOURNEY_CACHE_DB_MAX_ENTRIES = env.int('JOURNEY_CACHE_DB_MAX_ENTRIES', default=10000)
+JOURNEY_CACHE_PRUNE_EVERY = env.int('JOURNEY_CACHE_PRUNE_EVERY', default=100)  # Stores between DB prunes
+
+# Pre-generated journey pool for common emotion pairs (from:to)
+JOURNEY_POOL_ENABLED = env.bool('JOURNEY_POOL_ENABLED', default=True)
+JOURNEY_POOL_DEPTH = env.int('JOURNEY_POOL_DEPTH', default=5)
+# Serving a journey that leaves fewer than this many for the pair schedules a background refill
+JOURNEY_POOL_LOW_WATER = env.int('JOURNEY_POOL_LOW_WATER', default=2)
+JOURNEY_POOL_BACKGROUND_REFILL = env.bool('JOURNEY_POOL_BACKGROUND_REFILL', default=True)
+JOURNEY_POOL_PAIRS = env.list('JOURNEY_POOL_PAIRS', default=[
+    'sad:happy', 'angry:happy', 'anxious:happy', 'envy:happy', 'anxious:calm', 'angry:peaceful',
+])
+
+# Single-flight coalescing of identical concurrent generations
+SINGLE_FLIGHT_ENABLED = env.bool('SINGLE_FLIGHT_ENABLED', default=True)
+SINGLE_FLIGHT_LEASE_SECONDS = env.int('SINGLE_FLIGHT_LEASE_SECONDS', default=180)  # Lock lifetime if the leader dies
+SINGLE_FLIGHT_WAIT_SECONDS = env.int('SINGLE_FLIGHT_WAIT_SECONDS', default=120)  # Then followers generate themselves
+SINGLE_FLIGHT_POLL_INTERVAL = env.float('SINGLE_FLIGHT_POLL_INTERVAL', default=0.5)
+SINGLE_FLIGHT_RESULT_SECONDS = env.int('SINGLE_FLIGHT_RESULT_SECONDS', default=15)  # How long a finished result is shared
+
+# Background course generation jobs
+GENERATION_JOB_WORKERS = env.int('GENERATION_JOB_WORKERS', default=4)
+GENERATION_JOB_RUN_IN_PROCESS = env.bool('GENERATION_JOB_RUN_IN_PROCESS', default=True)  # False if only process_generation_jobs should run them
+GENERATION_JOB_STALE_SECONDS = env.int('GENERATION_JOB_STALE_SECONDS', default=600)
+
+
+# Course list pagination (?page_size= may ask for up to the max)
+COURSE_LIST_PAGE_SIZE = env.int('COURSE_LIST_PAGE_SIZE', default=20)
+COURSE_LIST_MAX_PAGE_SIZE = env.int('COURSE_LIST_MAX_PAGE_SIZE', default=100)
+
+# Delta sync: rows per table per response, and how far the next cursor trails "now"
+SYNC_MAX_ROWS = env.int('SYNC_MAX_ROWS', default=1000)
+SYNC_CURSOR_LAG_SECONDS = env.float('SYNC_CURSOR_LAG_SECONDS', default=2.0)
+
+# Progress events accepted in one batch request
+PROGRESS_BATCH_MAX_EVENTS = env.int('PROGRESS_BATCH_MAX_EVENTS', default=500)
+
+# Course generation rate limits, applied only to requests the cache and pool cannot answer: token
+# buckets per user, per client IP and overall (a burst of 0 disables one; the per-IP bucket is
+# off by default, as a whole class can share one NAT), plus each user's daily token budget (0 = unlimited)
+GENERATION_RATE_LIMIT_ENABLED = env.bool('GENERATION_RATE_LIMIT_ENABLED', default=True)
+GENERATION_USER_BURST = env.int('GENERATION_USER_BURST', default=5)
+GENERATION_USER_PER_HOUR = env.float('GENERATION_USER_PER_HOUR', default=30)
+GENERATION_CLIENT_BURST = env.int('GENERATION_CLIENT_BURST', default=0)
+GENERATION_CLIENT_PER_HOUR = env.float('GENERATION_CLIENT_PER_HOUR', default=60)
+GENERATION_GLOBAL_BURST = env.int('GENERATION_GLOBAL_BURST', default=60)
+GENERATION_GLOBAL_PER_MINUTE = env.float('GENERATION_GLOBAL_PER_MINUTE', default=60)
+GENERATION_USER_DAILY_TOKENS = env.int('GENERATION_USER_DAILY_TOKENS', default=200000)
+
+# Admission control for generations that reach the model, per worker process: at most
+# GENERATION_MAX_CONCURRENT at once (0 = unlimited), GENERATION_MAX_QUEUE more waiting up to
+# GENERATION_MAX_QUEUE_SECONDS. Keep the sum below the worker's thread count. Beyond that,
+# "fallback" serves the template at once and "reject" answers 503 with Retry-After
+GENERATION_MAX_CONCURRENT = env.int('GENERATION_MAX_CONCURRENT', default=8)
+GENERATION_MAX_QUEUE = env.int('GENERATION_MAX_QUEUE', default=8)
+GENERATION_MAX_QUEUE_SECONDS = env.float('GENERATION_MAX_QUEUE_SECONDS', default=2.0)
+# The async endpoint has its own cap: its generations hold no thread while in flight. Each of
+# its queued requests does block a thread while waiting, so keep that queue small
+GENERATION_ASYNC_MAX_CONCURRENT = env.int('GENERATION_ASYNC_MAX_CONCURRENT', default=200)
+GENERATION_ASYNC_MAX_QUEUE = env.int('GENERATION_ASYNC_MAX_QUEUE', default=16)
+GENERATION_OVERLOAD_MODE = env.str('GENERATION_OVERLOAD_MODE', default='fallback')
+GENERATION_OVERLOAD_RETRY_AFTER = env.int('GENERATION_OVERLOAD_RETRY_AFTER', default=10)
+
+# In-process Prometheus metrics, served at /api/v1/ops/metrics/
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=True)
+
+# Mood trend: range served when the client gives no start, and the most points in a response
+MOOD_TREND_DEFAULT_DAYS = env.int('MOOD_TREND_DEFAULT_DAYS', default=90)
+MOOD_TREND_MAX_POINTS = env.int('MOOD_TREND_MAX_POINTS', default=120)
 
 # Application definition
 
@@ -54,8 +163,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',  # First, so it times the rest
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # For serving static files
+    'dapi.middleware.AsyncWhiteNoiseMiddleware',  # WhiteNoise static files, async-capable for ASGI
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS middleware
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +173,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'dapi.db_routers.ReplicaReadMiddleware',  # No-op without a replica database
 ]
 
 # CORS settings
@@ -91,12 +202,71 @@ WSGI_APPLICATION = 'dapi.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_PROFILE picks SQLite (one box) or PostgreSQL (optionally with a read replica)
+DATABASE_PROFILE = env.str('DATABASE_PROFILE', default='sqlite')
+DATABASE_CONN_MAX_AGE = env.int('DATABASE_CONN_MAX_AGE', default=600)  # Seconds to keep connections open
+
+if DATABASE_PROFILE == 'postgres':
+    POSTGRES_POOL = env.bool('POSTGRES_POOL', default=True)  # Needs psycopg[pool]
+
+    def postgres_database(host, port):
+        database = {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env.str('POSTGRES_DB', default='dapi'),
+            'USER': env.str('POSTGRES_USER', default='dapi'),
+            'PASSWORD': env.str('POSTGRES_PASSWORD', default=''),
+            'HOST': host,
+            'PORT': port,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+        if POSTGRES_POOL:
+            # Django's built-in pool replaces persistent connections
+            database['CONN_MAX_AGE'] = 0
+            database['OPTIONS']['pool'] = {
+                'min_size': env.int('POSTGRES_POOL_MIN_SIZE', default=2),
+                'max_size': env.int('POSTGRES_POOL_MAX_SIZE', default=20),
+                'timeout': env.float('POSTGRES_POOL_TIMEOUT', default=10.0),
+            }
+        else:
+            database['CONN_MAX_AGE'] = DATABASE_CONN_MAX_AGE
+        return database
+
+    DATABASES = {
+        'default': postgres_database(env.str('POSTGRES_HOST', default='localhost'), env.str('POSTGRES_PORT', default='5432')),
+    }
+    POSTGRES_REPLICA_HOST = env.str('POSTGRES_REPLICA_HOST', default='')
+    if POSTGRES_REPLICA_HOST:
+        DATABASES['replica'] = postgres_database(
+            POSTGRES_REPLICA_HOST, env.str('POSTGRES_REPLICA_PORT', default=DATABASES['default']['PORT'])
+        )
+        DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+else:
+    SQLITE_BUSY_TIMEOUT = env.int('SQLITE_BUSY_TIMEOUT', default=20)  # Seconds a writer waits for the lock
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': env.str('SQLITE_PATH', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                # Take the write lock when a transaction starts, so concurrent writers
+                # queue on the busy timeout instead of failing with "database is locked"
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets reads run alongside the writer; NORMAL sync is durable across app crashes in WAL mode
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    'PRAGMA cache_size=-20000;'
+                    'PRAGMA temp_store=MEMORY;'
+                    'PRAGMA mmap_size=134217728;'
+                ),
+            },
+        }
     }
-}
+
+DATABASE_ROUTERS = ['dapi.db_routers.PrimaryReplicaRouter']
 
 
 # Password validation